@@ -13,10 +13,16 @@ from flask import session
 from  application.user_view.user import user
 
 from application.database.user.user_db import db
+from application.database.schema import add_missing_columns
 from  application.restaurant.restaurant import restaurant
-#from  application.room_view.room import room
-#from  application.employee_view.employee import employee
-#from  application.guest_view.guest import guest
+from  application.ratelimit.ratelimit import ratelimit
+from  application.jobs.jobs import jobs
+from  application.room_view.room import room
+from  application.employee_view.employee import employee
+from  application.guest_view.guest import guest
+from  application.guest_view.search import ensure_search_index
+from  application.asgi.server import asgi_cli  # flask asgi bench; the server itself is asgi.py
+from  application.server.prefork import server_cli  # flask server warmup | memory
 
 
 
@@ -26,7 +32,9 @@ from  application.restaurant.restaurant import restaurant
 app =app 
 
 with app.app_context():
-             db.create_all()
+             db.create_all(bind_key=None)  # replicas are copies of the primary
+             add_missing_columns(db)
+             ensure_search_index()
 
     
 #     #doctor_id = db.Column(db.Integer,db.ForeignKey('user.id'))
@@ -104,8 +112,11 @@ with app.app_context():
 
 app.register_blueprint(user,url_prefix="/user")
 app.register_blueprint(restaurant,url_prefix="/restaurant")
-# app.register_blueprint(guest,url_prefix="/guest")
-# app.register_blueprint(employee,url_prefix="/employee")
+app.register_blueprint(ratelimit,url_prefix="/ratelimit")
+app.register_blueprint(jobs,url_prefix="/jobs")
+app.register_blueprint(room,url_prefix="/room")
+app.register_blueprint(guest,url_prefix="/guest")
+app.register_blueprint(employee,url_prefix="/employee")
 # # Initialize flask app for the example
 
 
@@ -1227,6 +1238,7 @@ app.register_blueprint(restaurant,url_prefix="/restaurant")
 
 
 
+# development server only; production runs gunicorn (gunicorn.conf.py, wsgi.py)
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
 
@@ -0,0 +1,384 @@
+# application/analytics/text_analytics.py
+#
+# Offline review text analytics.
+#
+# Feedback comments are scored against a small local lexicon: every clause
+# that mentions an aspect (food, service, cleanliness, value) gives that aspect
+# the clause's sentiment, and 2/3-word phrases are counted per restaurant and
+# month.  Results are accumulated into review_aspect_summary (per day) and
+# review_phrase (per month) so premium analytics can return a digest instead of
+# every raw comment.  The job is incremental: a watermark remembers the last
+# feedback id processed.
+#
+# Editing or deleting a review the job has already counted corrects the
+# summaries in the same transaction (correct_review: the old text's counts
+# out, the new text's in).  Runs and corrections take turns on the watermark
+# row, and a run re-reads its round under that lock before merging, so a
+# review edited while the round was being analyzed is counted as it now is.
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+import numpy as np
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from application.settings.setup import app
+from application.database.user.user_db import (
+    db, Feedback, ReviewAspectSummary, ReviewPhrase, BatchWatermark
+)
+from application.recommendation.similar import STOPWORDS
+
+app.config.setdefault("TEXT_ANALYTICS_BATCH_SIZE", 2000)
+app.config.setdefault("TEXT_ANALYTICS_WORKERS", 4)
+
+WATERMARK = "text_analytics"
+
+ASPECTS = ("food", "service", "cleanliness", "value")
+ASPECT_TERMS = {
+    "food": """food meal meals dish dishes taste tasty tasted flavour flavor flavours
+               portion portions jollof rice chicken fish soup stew banku fufu waakye
+               kenkey plantain pizza burger fries drink drinks dessert menu fresh spicy
+               delicious bland cooked undercooked overcooked salty""",
+    "service": """service staff waiter waiters waitress server servers attendant
+                  attendants manager friendly rude slow wait waiting waited served
+                  attentive polite welcoming order ordered delivery""",
+    "cleanliness": """clean cleanliness dirty hygiene hygienic toilet toilets washroom
+                      washrooms tidy smell smelly smells flies ambience ambiance
+                      environment tables table floor neat""",
+    "value": """price prices priced expensive cheap value money worth overpriced
+                affordable bill cost costs pricey reasonable""",
+}
+ASPECT_INDEX = {term: i for i, aspect in enumerate(ASPECTS) for term in ASPECT_TERMS[aspect].split()}
+
+SENTIMENT = {
+    "good": 1.0, "great": 2.0, "excellent": 2.0, "amazing": 2.0, "awesome": 2.0,
+    "delicious": 2.0, "tasty": 1.5, "fresh": 1.0, "nice": 1.0, "lovely": 1.5,
+    "love": 2.0, "loved": 2.0, "best": 2.0, "perfect": 2.0, "friendly": 1.5,
+    "polite": 1.5, "attentive": 1.5, "welcoming": 1.5, "fast": 1.0, "quick": 1.0,
+    "clean": 1.5, "hygienic": 1.5, "tidy": 1.0, "neat": 1.0, "affordable": 1.5,
+    "cheap": 0.5, "reasonable": 1.0, "worth": 1.0, "recommend": 1.0, "enjoyed": 1.5,
+    "bad": -1.5, "poor": -1.5, "terrible": -2.0, "awful": -2.0, "horrible": -2.0,
+    "worst": -2.0, "disgusting": -2.0, "rude": -2.0, "slow": -1.5, "late": -1.0,
+    "dirty": -2.0, "smelly": -2.0, "flies": -1.5, "bland": -1.5, "cold": -1.0,
+    "stale": -1.5, "salty": -1.0, "undercooked": -1.5, "overcooked": -1.0,
+    "expensive": -1.0, "overpriced": -2.0, "pricey": -1.0, "noisy": -1.0,
+    "disappointing": -1.5, "disappointed": -1.5, "waited": -0.5, "never": -0.5,
+}
+NEGATORS = frozenset("""not no never hardly isn't wasn't aren't weren't don't didn't
+                        doesn't can't cannot won't""".split())
+NEGATION_WINDOW = 3
+
+TOKEN_RE = re.compile(r"[a-z]+(?:'[a-z]+)?")
+CLAUSE_RE = re.compile(r"[.!?;,\n]+|\bbut\b|\bhowever\b")
+
+
+def _phrases(tokens):
+    for n in (2, 3):
+        for i in range(len(tokens) - n + 1):
+            gram = tokens[i:i + n]
+            if gram[0] in STOPWORDS or gram[-1] in STOPWORDS or gram[0] in NEGATORS:
+                continue
+            yield " ".join(gram)
+
+
+def analyze_batch(records):
+    """Score a batch of (feedback_id, restaurant_id, timestamp, comment).
+
+    Runs in a worker process.  Returns (aspects, phrases) where aspects maps
+    (restaurant_id, day, aspect) -> [mentions, positive, negative, score_sum]
+    and phrases maps (restaurant_id, month, phrase) -> count.
+    """
+    tokens, clause_of_token, review_of_clause = [], [], []
+    phrases = defaultdict(int)
+    for r, (_, restaurant_id, timestamp, comment) in enumerate(records):
+        month = timestamp.strftime("%Y-%m")
+        for clause in CLAUSE_RE.split(comment.lower()):
+            words = TOKEN_RE.findall(clause)
+            if not words:
+                continue
+            clause_id = len(review_of_clause)
+            review_of_clause.append(r)
+            tokens.extend(words)
+            clause_of_token.extend([clause_id] * len(words))
+            for phrase in _phrases(words):
+                phrases[(restaurant_id, month, phrase[:120])] += 1
+
+    aspects = defaultdict(lambda: [0, 0, 0, 0.0])
+    if not tokens:
+        return dict(aspects), dict(phrases)
+
+    clause = np.asarray(clause_of_token, dtype=np.int64)
+    polarity = np.fromiter((SENTIMENT.get(t, 0.0) for t in tokens), dtype=np.float64, count=len(tokens))
+    negator = np.fromiter((t in NEGATORS for t in tokens), dtype=bool, count=len(tokens))
+    aspect = np.fromiter((ASPECT_INDEX.get(t, -1) for t in tokens), dtype=np.int64, count=len(tokens))
+
+    # a negator flips the polarity of the next few words of the same clause
+    flipped = np.zeros(len(tokens), dtype=bool)
+    for k in range(1, NEGATION_WINDOW + 1):
+        flipped[k:] |= negator[:-k] & (clause[k:] == clause[:-k])
+    polarity = np.where(flipped, -polarity, polarity)
+    clause_score = np.bincount(clause, weights=polarity, minlength=len(review_of_clause))
+
+    # each clause counts once per aspect it mentions
+    hit = aspect >= 0
+    clause_aspect = np.unique(clause[hit] * len(ASPECTS) + aspect[hit])
+    hit_clause, hit_aspect = clause_aspect // len(ASPECTS), clause_aspect % len(ASPECTS)
+    review_aspect = np.asarray(review_of_clause, dtype=np.int64)[hit_clause] * len(ASPECTS) + hit_aspect
+    keys, inverse = np.unique(review_aspect, return_inverse=True)
+    sentiment = np.bincount(inverse, weights=clause_score[hit_clause], minlength=len(keys))
+    score = np.clip(sentiment / 2.0, -1.0, 1.0)
+
+    for key, value in zip(keys.tolist(), score.tolist()):
+        _, restaurant_id, timestamp, _ = records[key // len(ASPECTS)]
+        bucket = aspects[(restaurant_id, timestamp.date(), ASPECTS[key % len(ASPECTS)])]
+        bucket[0] += 1
+        bucket[1] += value > 0
+        bucket[2] += value < 0
+        bucket[3] += value
+    return dict(aspects), dict(phrases)
+
+
+# ---------------------------
+# Persisting
+# ---------------------------
+def _merge(aspects, phrases):
+    # one upsert per key: no lookup of existing rows (whose IN lists would
+    # outgrow SQLite's bound-variable limit on a big backlog)
+    aspect_rows = [
+        {"restaurant_id": restaurant_id, "day": day, "aspect": aspect, "mentions": mentions,
+         "positive": positive, "negative": negative, "score_sum": score_sum}
+        for (restaurant_id, day, aspect), (mentions, positive, negative, score_sum) in aspects.items()
+    ]
+    phrase_rows = [
+        {"restaurant_id": restaurant_id, "month": month, "phrase": phrase, "count": count}
+        for (restaurant_id, month, phrase), count in phrases.items()
+    ]
+    dialect = {"sqlite": sqlite, "postgresql": postgresql}.get(db.engine.dialect.name)
+    if dialect is None:
+        summed = ((ReviewAspectSummary, aspect_rows, ("mentions", "positive", "negative", "score_sum")),
+                  (ReviewPhrase, phrase_rows, ("count",)))
+        for model, rows, added in summed:
+            for values in rows:
+                key = tuple(values[column.name] for column in model.__table__.primary_key)
+                row = db.session.get(model, key)
+                if row is None:
+                    db.session.add(model(**values))
+                else:
+                    for name in added:
+                        setattr(row, name, getattr(row, name) + values[name])
+        return
+
+    if aspect_rows:
+        statement = dialect.insert(ReviewAspectSummary)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[ReviewAspectSummary.restaurant_id, ReviewAspectSummary.day, ReviewAspectSummary.aspect],
+            set_={name: getattr(ReviewAspectSummary, name) + getattr(statement.excluded, name)
+                  for name in ("mentions", "positive", "negative", "score_sum")},
+        ), aspect_rows)
+    if phrase_rows:
+        statement = dialect.insert(ReviewPhrase)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[ReviewPhrase.restaurant_id, ReviewPhrase.month, ReviewPhrase.phrase],
+            set_={"count": ReviewPhrase.count + statement.excluded["count"]},
+        ), phrase_rows)
+
+
+def _negate(result):
+    aspects, phrases = result
+    return {key: [-v for v in values] for key, values in aspects.items()}, {key: -n for key, n in phrases.items()}
+
+
+def _prune_empty(restaurant_ids):
+    # rows whose every mention was taken back
+    db.session.execute(delete(ReviewAspectSummary).where(
+        ReviewAspectSummary.restaurant_id.in_(restaurant_ids), ReviewAspectSummary.mentions <= 0))
+    db.session.execute(delete(ReviewPhrase).where(
+        ReviewPhrase.restaurant_id.in_(restaurant_ids), ReviewPhrase.count <= 0))
+
+
+def _locked_watermark(create=False):
+    """The watermark row, locked until the transaction ends."""
+    connection = db.session.connection()
+    if connection.dialect.name == "sqlite":
+        # the write lock up front (booking.lock_rooms does the same)
+        if not connection.connection.dbapi_connection.in_transaction:
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+    watermark = db.session.execute(
+        select(BatchWatermark).where(BatchWatermark.name == WATERMARK)
+        .with_for_update().execution_options(populate_existing=True)
+    ).scalar()
+    if watermark is None and create:
+        watermark = BatchWatermark(name=WATERMARK, last_id=0)
+        db.session.add(watermark)
+        db.session.flush()
+    return watermark
+
+
+def _round_query(after, through=None):
+    query = (
+        select(Feedback.id, Feedback.restaurant_id, Feedback.timestamp, Feedback.comment)
+        .where(Feedback.id > after,
+               Feedback.comment.isnot(None),
+               Feedback.comment != "",
+               Feedback.timestamp.isnot(None))
+        .order_by(Feedback.id)
+    )
+    return query.where(Feedback.id <= through) if through is not None else query
+
+
+def correct_review(feedback_id, restaurant_id, timestamp, old_comment, new_comment):
+    """Replace an edited review's counts (new_comment None: a deleted one)
+    if the job has already counted it; the caller commits."""
+    if timestamp is None or (old_comment or "") == (new_comment or ""):
+        return
+    watermark = _locked_watermark()
+    if watermark is None or feedback_id > watermark.last_id:
+        return   # not counted yet: the next run reads the final text
+    results = []
+    if old_comment:
+        results.append(_negate(analyze_batch([(feedback_id, restaurant_id, timestamp, old_comment)])))
+    if new_comment:
+        results.append(analyze_batch([(feedback_id, restaurant_id, timestamp, new_comment)]))
+    _merge(*_combine(results))
+    _prune_empty([restaurant_id])
+
+
+def _combine(results):
+    aspects = defaultdict(lambda: [0, 0, 0, 0.0])
+    phrases = defaultdict(int)
+    for batch_aspects, batch_phrases in results:
+        for key, values in batch_aspects.items():
+            bucket = aspects[key]
+            for i, v in enumerate(values):
+                bucket[i] += v
+        for key, count in batch_phrases.items():
+            phrases[key] += count
+    return aspects, phrases
+
+
+def run_text_analytics(rebuild=False, batch_size=None, workers=None):
+    """Process every feedback comment newer than the watermark.
+
+    Each round reads `batch_size * workers` comments, fans the batches out to a
+    process pool and commits the merged counts together with the new watermark,
+    so an interrupted run resumes where it stopped.
+    """
+    batch_size = batch_size or app.config["TEXT_ANALYTICS_BATCH_SIZE"]
+    workers = workers or app.config["TEXT_ANALYTICS_WORKERS"]
+
+    if rebuild:
+        db.session.execute(delete(ReviewAspectSummary))
+        db.session.execute(delete(ReviewPhrase))
+        db.session.execute(delete(BatchWatermark).where(BatchWatermark.name == WATERMARK))
+        db.session.commit()
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    processed = 0
+    try:
+        while True:
+            watermark = db.session.get(BatchWatermark, WATERMARK, populate_existing=True)
+            last_id = watermark.last_id if watermark else 0
+            db.session.commit()   # no transaction held while analyzing
+            rows = db.session.execute(_round_query(last_id).limit(batch_size * workers)).all()
+            if not rows:
+                break
+            records = [tuple(r) for r in rows]
+            batches = [records[i:i + batch_size] for i in range(0, len(records), batch_size)]
+            if pool is not None and len(batches) > 1:
+                results = list(pool.map(analyze_batch, batches))
+            else:
+                results = [analyze_batch(batch) for batch in batches]
+
+            watermark = _locked_watermark(create=True)
+            if watermark.last_id != last_id:
+                db.session.rollback()   # another run merged this round meanwhile
+                continue
+            # reviews edited or deleted since they were read: count them as they are now
+            current = [tuple(r) for r in db.session.execute(_round_query(last_id, records[-1][0])).all()]
+            removed, added = set(records) - set(current), set(current) - set(records)
+            if removed:
+                results.append(_negate(analyze_batch(sorted(removed))))
+            if added:
+                results.append(analyze_batch(sorted(added)))
+            _merge(*_combine(results))
+            if removed:
+                _prune_empty({r[1] for r in removed})
+            watermark.last_id = records[-1][0]
+            db.session.commit()
+            processed += len(records)
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    db.session.commit()
+    return processed
+
+
+def forget_insights(restaurant_id):
+    """Drop a restaurant's summaries before it is deleted (caller commits)."""
+    db.session.execute(delete(ReviewAspectSummary).where(ReviewAspectSummary.restaurant_id == restaurant_id))
+    db.session.execute(delete(ReviewPhrase).where(ReviewPhrase.restaurant_id == restaurant_id))
+
+
+# ---------------------------
+# Reading
+# ---------------------------
+def review_insights(restaurant_id, start_date, top_phrases=10):
+    """Digest of aspect sentiment and top phrases since `start_date`."""
+    aspects = db.session.query(
+        ReviewAspectSummary.aspect,
+        func.sum(ReviewAspectSummary.mentions).label("mentions"),
+        func.sum(ReviewAspectSummary.positive).label("positive"),
+        func.sum(ReviewAspectSummary.negative).label("negative"),
+        func.sum(ReviewAspectSummary.score_sum).label("score_sum"),
+    ).filter(
+        ReviewAspectSummary.restaurant_id == restaurant_id,
+        ReviewAspectSummary.day >= start_date.date()
+    ).group_by(ReviewAspectSummary.aspect).all()
+
+    phrases = db.session.query(
+        ReviewPhrase.phrase,
+        func.sum(ReviewPhrase.count).label("count")
+    ).filter(
+        ReviewPhrase.restaurant_id == restaurant_id,
+        ReviewPhrase.month >= start_date.strftime("%Y-%m")
+    ).group_by(ReviewPhrase.phrase).order_by(func.sum(ReviewPhrase.count).desc()).limit(top_phrases).all()
+
+    watermark = db.session.get(BatchWatermark, WATERMARK)
+    return {
+        'aspects': [
+            {
+                'aspect': a.aspect,
+                'mentions': a.mentions,
+                'positive_percentage': round(a.positive / a.mentions * 100, 2) if a.mentions else 0,
+                'negative_percentage': round(a.negative / a.mentions * 100, 2) if a.mentions else 0,
+                'sentiment': round(a.score_sum / a.mentions, 3) if a.mentions else 0,
+            } for a in sorted(aspects, key=lambda a: ASPECTS.index(a.aspect))
+        ],
+        'top_phrases': [{'phrase': p.phrase, 'count': p.count} for p in phrases],
+        'processed_through_feedback_id': watermark.last_id if watermark else 0,
+    }
+
+
+# ---------------------------
+# CLI:  flask text-analytics run [--rebuild]
+# ---------------------------
+text_analytics_cli = AppGroup("text-analytics", help="Aspect sentiment and phrase extraction for reviews.")
+
+
+@text_analytics_cli.command("run")
+@click.option("--rebuild", is_flag=True, help="Drop the summaries and reprocess every review.")
+@click.option("--workers", type=int, default=None, help="Process pool size.")
+def run_command(rebuild, workers):
+    started = time.perf_counter()
+    processed = run_text_analytics(rebuild=rebuild, workers=workers)
+    click.echo(f"Processed {processed} reviews in {time.perf_counter() - started:.2f}s")
+
+
+app.cli.add_command(text_analytics_cli)
@@ -0,0 +1,64 @@
+# application/asgi/database.py
+#
+# Async engine for the ASGI handlers (see server.py): the same database as
+# the Flask app, through its asyncio driver and a pool of its own.
+#
+#   sqlite      sqlite+aiosqlite
+#   postgresql  postgresql+asyncpg
+#   mysql       mysql+aiomysql
+#
+# Sessions come from a plain AsyncSession, not the app's RoutingSession, so
+# they always use the primary and the RoutingSession commit hooks (cache
+# invalidation, room counters, ...) don't run.  A handler that writes a
+# table one of them watches does that hook's work itself after committing
+# (google_login: a new user clears the user-list counts).
+from sqlalchemy.engine import make_url
+
+try:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+except ImportError:  # pragma: no cover - needs sqlalchemy[asyncio]
+    async_sessionmaker = create_async_engine = None
+
+from application.settings.setup import app
+
+app.config.setdefault("ASGI_DB_POOL_SIZE", 10)
+app.config.setdefault("ASGI_DB_MAX_OVERFLOW", 10)
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+
+def async_url(url):
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f"No async driver configured for {backend}")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+class AsyncDatabase:
+    def __init__(self):
+        self.engine = None
+        self.sessions = None
+
+    def start(self, url):
+        if create_async_engine is None:
+            raise RuntimeError("ASGI mode needs sqlalchemy[asyncio]")
+        url = async_url(url)
+        options = {"pool_pre_ping": True}
+        if url.get_backend_name() != "sqlite":
+            options.update(pool_size=app.config["ASGI_DB_POOL_SIZE"],
+                           max_overflow=app.config["ASGI_DB_MAX_OVERFLOW"])
+        self.engine = create_async_engine(url, **options)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    def session(self):
+        return self.sessions()
+
+    async def dispose(self):
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = self.sessions = None
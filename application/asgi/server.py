@@ -0,0 +1,285 @@
+# application/asgi/server.py
+#
+# Optional ASGI mode.
+#
+# Under gunicorn's sync workers a request holds its worker for as long as it
+# runs, including the time spent waiting on Google in /user/google-login.
+# create_asgi_app(app) wraps the Flask app in an ASGI application (asgi.py
+# at the top of the repo; `uvicorn asgi:application`) that
+#
+#   - answers the routes registered with @async_route (handlers.py) with
+#     native coroutines: outbound HTTP through one shared httpx client,
+#     database work through an async engine (database.py), so thousands of
+#     such requests can wait at once in one process
+#   - passes everything else, unchanged, to the Flask app on a pool of
+#     ASGI_WSGI_THREADS threads (a2wsgi), so the existing blueprints keep
+#     working as they are
+#
+# An async route must answer exactly like the Flask view it shadows; the
+# Flask view stays in place for sync mode (`flask run`, gunicorn sync
+# workers).  Mail already goes through the job queue (mail.send), so no
+# request waits on SMTP in either mode.
+#
+# `flask asgi bench` measures how many requests waiting on a slow upstream
+# one process keeps in flight in each mode.
+import asyncio
+import json
+import threading
+import time
+
+import click
+from flask import Flask
+from flask.cli import AppGroup
+
+try:
+    import httpx
+    from a2wsgi import WSGIMiddleware
+except ImportError:  # pragma: no cover - sync mode doesn't need them
+    httpx = WSGIMiddleware = None
+
+from application.settings.setup import app
+from application.asgi.database import AsyncDatabase
+
+app.config.setdefault("ASGI_WSGI_THREADS", 16)          # threads running Flask views
+app.config.setdefault("ASGI_HTTP_TIMEOUT", 10)          # seconds, outbound calls
+app.config.setdefault("ASGI_HTTP_MAX_CONNECTIONS", 100)
+app.config.setdefault("ASGI_MAX_BODY", 1024 * 1024)     # bytes read by async handlers
+
+ASYNC_ROUTES = {}
+
+
+def async_route(method, path):
+    """Serve `path` with this coroutine in ASGI mode.  It gets an
+    AsyncRequest and returns (payload, status) like a Flask view."""
+    def register(handler):
+        ASYNC_ROUTES[(method, path)] = handler
+        return handler
+    return register
+
+
+class PayloadTooLarge(Exception):
+    pass
+
+
+class AsyncRequest:
+    def __init__(self, server, scope, body):
+        self.server = server
+        self.scope = scope
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        self.body = body
+
+    @property
+    def http(self):
+        return self.server.http
+
+    @property
+    def db(self):
+        return self.server.db
+
+    def json(self):
+        return json.loads(self.body) if self.body else None
+
+
+async def read_body(receive, limit):
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > limit:
+            raise PayloadTooLarge()
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+async def send_json(send, payload, status, origin=None):
+    body = (json.dumps(payload, sort_keys=True, separators=(",", ":")) + "\n").encode()   # as jsonify
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    if origin:
+        # the Flask app allows every origin (CORS(app)); so do these routes
+        headers.append((b"access-control-allow-origin", b"*"))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+class AsgiApp:
+    def __init__(self, flask_app, routes=None, threads=None, database_url=None):
+        if WSGIMiddleware is None:
+            raise RuntimeError("ASGI mode needs a2wsgi and httpx (see requirements.txt)")
+        self.flask_app = flask_app
+        self.routes = dict(ASYNC_ROUTES if routes is None else routes)
+        self.wsgi = WSGIMiddleware(flask_app, workers=threads or app.config["ASGI_WSGI_THREADS"])
+        self.database_url = database_url
+        self.http = None
+        self.db = AsyncDatabase()
+        self._started = None
+
+    async def startup(self):
+        self.http = httpx.AsyncClient(
+            timeout=app.config["ASGI_HTTP_TIMEOUT"],
+            limits=httpx.Limits(max_connections=app.config["ASGI_HTTP_MAX_CONNECTIONS"]),
+        )
+        if self.database_url is not None:
+            self.db.start(self.database_url)
+
+    async def shutdown(self):
+        if self.http is not None:
+            await self.http.aclose()
+        await self.db.dispose()
+
+    async def _ensure_started(self):
+        # servers without lifespan support (and the bench) start us here
+        if self._started is None:
+            self._started = asyncio.ensure_future(self.startup())
+        await self._started
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self._ensure_started()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        handler = self.routes.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        if handler is None:
+            return await self.wsgi(scope, receive, send)
+
+        await self._ensure_started()
+        origin = dict(scope["headers"]).get(b"origin")
+        try:
+            body = await read_body(receive, app.config["ASGI_MAX_BODY"])
+            payload, status = await handler(AsyncRequest(self, scope, body))
+        except PayloadTooLarge:
+            payload, status = {"error": "Request body too large"}, 413
+        except Exception as e:
+            payload, status = {"error": str(e)}, 500
+        await send_json(send, payload, status, origin)
+
+
+def create_asgi_app(flask_app):
+    from application.asgi import handlers  # noqa: F401  registers the async routes
+    from application.database.user.user_db import db
+    # the engine's url has the instance-folder path flask_sqlalchemy resolved
+    return AsgiApp(flask_app, database_url=db.engine.url)
+
+
+# ---------------------------
+# CLI:  flask asgi bench
+# ---------------------------
+asgi_cli = AppGroup("asgi", help="ASGI mode.")
+
+
+def start_upstream(latency):
+    """A local HTTP server answering every request after `latency` seconds;
+    stands in for Google.  Returns (url, stats)."""
+    stats = {"in_flight": 0, "peak": 0}
+    ready = threading.Event()
+    address = {}
+
+    async def handle(reader, writer):
+        try:
+            while await reader.readuntil(b"\r\n\r\n"):
+                stats["in_flight"] += 1
+                stats["peak"] = max(stats["peak"], stats["in_flight"])
+                await asyncio.sleep(latency)
+                stats["in_flight"] -= 1
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: 2\r\n\r\n{}")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(asyncio.start_server(handle, "127.0.0.1", 0, backlog=4096))
+        address["port"] = server.sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    ready.wait()
+    return f"http://127.0.0.1:{address['port']}/", stats
+
+
+async def asgi_get(asgi, path):
+    """One GET through the ASGI app, as a server would send it."""
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+             "query_string": b"", "headers": [(b"host", b"bench")],
+             "server": ("bench", 80), "client": ("127.0.0.1", 0)}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi(scope, receive, send)
+    return next(m["status"] for m in sent if m["type"] == "http.response.start")
+
+
+@asgi_cli.command("bench")
+@click.option("--requests", "count", type=int, default=200, help="Requests sent at once.")
+@click.option("--latency", type=float, default=0.2, help="Seconds the upstream takes to answer.")
+@click.option("--threads", type=int, default=None, help="Threads for Flask views (default ASGI_WSGI_THREADS).")
+def bench_command(count, latency, threads):
+    """Requests waiting on a slow upstream that one process serves at once:
+    a Flask view on 1 thread (gunicorn sync worker), on a thread pool, and
+    an async handler."""
+    import requests
+
+    threads = threads or app.config["ASGI_WSGI_THREADS"]
+    url, stats = start_upstream(latency)
+    bench_app = Flask("asgi_bench")
+    local = threading.local()
+
+    @bench_app.route("/sync")
+    def sync_view():
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        local.session.get(url).raise_for_status()
+        return {}
+
+    async def async_view(request):
+        (await request.http.get(url)).raise_for_status()
+        return {}, 200
+
+    async def run(asgi, path):
+        await asgi._ensure_started()
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*(asgi_get(asgi, path) for _ in range(count)))
+        elapsed = time.perf_counter() - started
+        await asgi.shutdown()
+        return elapsed, sum(status == 200 for status in statuses)
+
+    for label, path, pool in (("sync, 1 thread", "/sync", 1),
+                              (f"sync, {threads} threads", "/sync", threads),
+                              ("async", "/async", threads)):
+        stats["peak"] = 0
+        asgi = AsgiApp(bench_app, routes={("GET", "/async"): async_view}, threads=pool)
+        elapsed, ok = asyncio.run(run(asgi, path))
+        click.echo(f"{label:<18} {ok}/{count} ok in {elapsed:7.2f}s  {ok / elapsed:8.1f} req/s  "
+                   f"concurrency {ok / elapsed * latency:7.1f}  (upstream peak {stats['peak']})")
+
+
+app.cli.add_command(asgi_cli)
@@ -1,13 +1,14 @@
 from application.extensions.extensions import *
 from application.settings.setup import app
 from application.settings.settings import *
-from application.database.user.user_db import User
+from application.database.user.user_db import db, User
+from sqlalchemy import event, inspect as sa_inspect
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+import re
 
 #========  Room database =================#
-db = SQLAlchemy(app)
-
-
-
+# the hotel tables share user_db's SQLAlchemy instance (one per app)
 
 
 
@@ -25,9 +26,11 @@ class Room(db.Model):
     occupancy_state = db.Column(db.String(255))
     assignee = db.Column(db.String(255))
     task = db.Column(db.String(10))
-    picture_one = db.Column(LargeBinary)
-    picture_two = db.Column(LargeBinary)
-    picture_three = db.Column(LargeBinary)
+    # pictures are never loaded with the row; they are served by
+    # /room/<id>/picture/<n> (see application/room_view/blobs.py)
+    picture_one = db.deferred(db.Column(LargeBinary))
+    picture_two = db.deferred(db.Column(LargeBinary))
+    picture_three = db.deferred(db.Column(LargeBinary))
     status = db.Column(db.String(100),nullable=True)
     created_by_id = db.Column(db.Integer,db.ForeignKey('user.id'))
 
@@ -46,6 +49,34 @@ class Room_Type(db.Model):
     description = db.Column(db.String(200))
     created_by_id = db.Column(db.Integer,db.ForeignKey('user.id'))
 
+    # typed copies of bace_price / extral_bed_price / kids_occupancy (see sync_money)
+    base_rate = db.Column(db.Numeric(12, 2))
+    extra_bed_rate = db.Column(db.Numeric(12, 2))
+    max_kids = db.Column(db.Integer)
+
+
+#========  Rate rules =================#
+# Seasonal and weekday adjustments to the base rates, compiled into per-date
+# rate tables by application/room_view/pricing.py.  Rules apply in priority
+# order (then id): 'override' sets the nightly rate, 'percent' changes it by
+# value% (negative for a discount), 'fixed' adds value.  room_type NULL means
+# every type; weekdays is a bit mask (Monday = 1, Sunday = 64), NULL = all.
+
+class Rate_Rule(db.Model):
+    __tablename__ = 'rate_rule'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255))
+    room_type = db.Column(db.String(255), nullable=True, index=True)
+    start_on = db.Column(db.Date, nullable=False)
+    end_on = db.Column(db.Date, nullable=False)             # exclusive
+    weekdays = db.Column(db.Integer, nullable=True)
+    kind = db.Column(db.String(20), nullable=False)         # override / percent / fixed
+    value = db.Column(db.Numeric(12, 2), nullable=False)
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    created_by_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_date = db.Column(DateTime(timezone=True), default=func.now())
+
 
     
 #========  Guest database =================#
@@ -60,7 +91,7 @@ class Guest(db.Model):
     dob = db.Column(db.String(255))
     phone_number = db.Column(db.String(255))
     room = db.Column(db.String(255))
-    room_number = db.Column(db.String(255))
+    room_number = db.Column(db.String(255), index=True)
     country = db.Column(db.String(255))
 
     region = db.Column(db.String(255))
@@ -78,6 +109,12 @@ class Guest(db.Model):
     created_date = db.Column(DateTime(timezone=True), default=func.now())
     created_by_id = db.Column(db.Integer,db.ForeignKey('user.id'))
 
+    # exact lookup keys for the guest search (see sync_guest_keys): the
+    # phone's digits reversed, so "ends with" is an index range, and the id
+    # number upper-cased without separators
+    phone_reversed = db.Column(db.String(32), index=True)
+    id_key = db.Column(db.String(64), index=True)
+
 
     
 #========  Employee database =================#
@@ -102,7 +139,7 @@ class Employee(db.Model):
     address = db.Column(db.String(255))
     id_type = db.Column(db.String(255))
     id_number = db.Column(db.String(255))
-    id_photo = db.Column(LargeBinary)
+    id_photo = db.deferred(db.Column(LargeBinary))  # served by /employee/<id>/id_photo
 
     date_of_join = db.Column(db.String(255))
     remark = db.Column(db.String(233))
@@ -129,6 +166,11 @@ class Payment(db.Model):
     number_of_night = db.Column(db.String(255))
     payment_date = db.Column(db.String(255))
     created_by_id = db.Column(db.Integer,db.ForeignKey('user.id'))
+
+    # typed copies of amount / number_of_night / payment_date (see sync_money)
+    amount_paid = db.Column(db.Numeric(12, 2))
+    nights_paid = db.Column(db.Integer)
+    paid_on = db.Column(db.Date, index=True)
    
     
   
@@ -148,6 +190,9 @@ class Todo(db.Model):
   
 
 class Reservation(db.Model):
+    __table_args__ = (
+        db.Index('ix_reservation_room_stay', 'room_number', 'arrival_on', 'departure_on'),
+    )
    
     id = db.Column(db.Integer,primary_key =True)
     guestname = db.Column(db.String(255))
@@ -176,8 +221,22 @@ class Reservation(db.Model):
 
     created_date = db.Column(DateTime(timezone=True), default=func.now())
 
+    # typed copies of the string fields above, kept in sync on every write
+    # (see sync_stay_dates); the stay is [arrival_on, departure_on)
+    arrival_on = db.Column(db.Date, index=True)
+    departure_on = db.Column(db.Date, index=True)
+    checkin_at = db.Column(db.DateTime)
+    checkout_at = db.Column(db.DateTime)
+
+    # typed copies of rate_amount / discount_value (see sync_money)
+    nightly_rate = db.Column(db.Numeric(12, 2))
+    discount = db.Column(db.Numeric(12, 2))
+
 
 class Group_Reservation(db.Model):
+    __table_args__ = (
+        db.Index('ix_group_reservation_room_stay', 'room_number', 'arrival_on', 'departure_on'),
+    )
    
     id = db.Column(db.Integer,primary_key =True)
     guestname = db.Column(db.String(255))
@@ -206,4 +265,219 @@ class Group_Reservation(db.Model):
 
     created_date = db.Column(DateTime(timezone=True), default=func.now())
 
-    
\ No newline at end of file
+    # rooms booked together through /room/group_booking share a group_ref,
+    # one row per room
+    group_ref = db.Column(db.String(32), index=True)
+
+    # typed copies of the string fields above, kept in sync on every write
+    # (see sync_stay_dates); the stay is [arrival_on, departure_on)
+    arrival_on = db.Column(db.Date, index=True)
+    departure_on = db.Column(db.Date, index=True)
+    checkin_at = db.Column(db.DateTime)
+    checkout_at = db.Column(db.DateTime)
+
+    # typed copies of rate_amount / discount_value (see sync_money)
+    nightly_rate = db.Column(db.Numeric(12, 2))
+    discount = db.Column(db.Numeric(12, 2))
+
+
+#========  Stored blobs =================#
+# ETag, size and type of each picture / id photo, so conditional requests
+# never read the blob; `path` is set once the bytes were moved out of the
+# table into the file store (flask hotel migrate-blobs).
+
+class Stored_Blob(db.Model):
+    __tablename__ = 'stored_blob'
+
+    owner = db.Column(db.String(20), primary_key=True)     # 'room' or 'employee'
+    owner_id = db.Column(db.Integer, primary_key=True)
+    field = db.Column(db.String(30), primary_key=True)
+    sha256 = db.Column(db.String(64), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    content_type = db.Column(db.String(100), nullable=False)
+    path = db.Column(db.String(255), nullable=True)          # relative to HOTEL_BLOB_DIR
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+#========  Night audit =================#
+# One row per night and room type, written by the night audit
+# (application/room_view/audit.py); room_type '*' is the whole hotel and
+# the only row that carries the payments taken that day.
+
+class Night_Audit(db.Model):
+    __tablename__ = 'night_audit'
+
+    day = db.Column(db.Date, primary_key=True)
+    room_type = db.Column(db.String(255), primary_key=True)
+    rooms_available = db.Column(db.Integer, nullable=False, default=0)
+    rooms_sold = db.Column(db.Integer, nullable=False, default=0)
+    room_revenue = db.Column(db.Numeric(14, 2, asdecimal=False), nullable=False, default=0)
+    payments = db.Column(db.Numeric(14, 2, asdecimal=False))
+    adr = db.Column(db.Numeric(12, 2, asdecimal=False))          # revenue per room sold
+    revpar = db.Column(db.Numeric(12, 2, asdecimal=False))       # revenue per room available
+    occupancy = db.Column(db.Float)                              # rooms sold / rooms available
+    audited_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+#========  Typed stay dates =================#
+# The booking forms post arrival_date / night / checkin_time / checkout_time
+# as free strings.  parse_stay() turns them into dates once, on write, so
+# availability and conflict checks can compare dates in SQL.
+
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d', '%d.%m.%Y')
+DATETIME_FORMATS = ('%Y-%m-%dT%H:%M', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S')
+TIME_FORMATS = ('%H:%M', '%H:%M:%S', '%I:%M %p', '%I:%M%p')
+STAY_FIELDS = ('arrival_date', 'night', 'checkin_time', 'checkout_time')
+
+
+def _parse(value, formats):
+    value = (value or '').strip()
+    if not value:
+        return None
+    for fmt in formats:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def parse_date(value):
+    value = (value or '').strip()
+    try:
+        return date.fromisoformat(value[:10])  # the common case, ~50x cheaper than strptime
+    except ValueError:
+        pass
+    parsed = _parse(value, DATE_FORMATS) or _parse(value, DATETIME_FORMATS)
+    return parsed.date() if parsed else None
+
+
+def parse_nights(value):
+    match = re.search(r'\d+', str(value or ''))
+    return int(match.group()) if match else None
+
+
+def _at(day, value):
+    """`value` as a datetime: either a full timestamp or a time on `day`."""
+    parsed = _parse(value, DATETIME_FORMATS)
+    if parsed:
+        return parsed
+    parsed = _parse(value, TIME_FORMATS)
+    if parsed and day:
+        return datetime.combine(day, parsed.time())
+    return None
+
+
+def parse_stay(arrival_date, night, checkin_time=None, checkout_time=None):
+    """(arrival_on, departure_on, checkin_at, checkout_at); dates are None when
+    the arrival cannot be parsed.  A stay without a night count ends on the
+    checkout date if there is one, else after one night."""
+    arrival_on = parse_date(arrival_date)
+    checkin_at = _at(arrival_on, checkin_time)
+    arrival_on = arrival_on or (checkin_at.date() if checkin_at else None)
+    if arrival_on is None:
+        return None, None, checkin_at, None
+    nights = parse_nights(night)
+    checkout_at = _at(arrival_on + timedelta(days=nights or 0), checkout_time)
+    if nights:
+        departure_on = arrival_on + timedelta(days=nights)
+    elif checkout_at and checkout_at.date() > arrival_on:
+        departure_on = checkout_at.date()
+    else:
+        departure_on = arrival_on + timedelta(days=1)
+    return arrival_on, departure_on, checkin_at, checkout_at
+
+
+def sync_stay_dates(mapper, connection, target):
+    state = sa_inspect(target)
+    strings_changed = any(state.attrs[name].history.has_changes() for name in STAY_FIELDS)
+    if strings_changed or target.arrival_on is None:
+        arrival_on, departure_on, checkin_at, checkout_at = parse_stay(
+            target.arrival_date, target.night, target.checkin_time, target.checkout_time
+        )
+        if arrival_on is not None or strings_changed:
+            target.arrival_on, target.departure_on = arrival_on, departure_on
+            target.checkin_at, target.checkout_at = checkin_at, checkout_at
+    elif target.arrival_date is None and target.arrival_on is not None:
+        # written through the typed columns only: fill the form fields in
+        target.arrival_date = target.arrival_on.isoformat()
+        if target.departure_on:
+            target.night = str((target.departure_on - target.arrival_on).days)
+
+
+for _model in (Reservation, Group_Reservation):
+    event.listen(_model, 'before_insert', sync_stay_dates)
+    event.listen(_model, 'before_update', sync_stay_dates)
+
+
+#========  Typed money =================#
+# rate_amount, discount_value, amount, number_of_night and the room type
+# prices are free strings too ("GHS 1,200.00", "250", "3 nights").  sync_money() keeps numeric copies
+# so revenue can be summed in SQL and NumPy instead of parsed per report.
+
+MONEY_FIELDS = {   # string field -> typed copy
+    'Payment': (('amount', 'amount_paid'), ('number_of_night', 'nights_paid'), ('payment_date', 'paid_on')),
+    'Reservation': (('rate_amount', 'nightly_rate'), ('discount_value', 'discount')),
+    'Group_Reservation': (('rate_amount', 'nightly_rate'), ('discount_value', 'discount')),
+    'Room_Type': (('bace_price', 'base_rate'), ('extral_bed_price', 'extra_bed_rate'), ('kids_occupancy', 'max_kids')),
+}
+CENT = Decimal('0.01')
+
+
+def parse_money(value):
+    """Decimal amount in a string such as 'GHS 1,200.50'; None if there is none."""
+    match = re.search(r'-?\d[\d,]*(?:\.\d+)?|-?\.\d+', str(value or ''))
+    if not match:
+        return None
+    try:
+        return Decimal(match.group().replace(',', '')).quantize(CENT)
+    except InvalidOperation:
+        return None
+
+
+def is_percent(discount_type):
+    kind = (discount_type or '').strip().lower()
+    return '%' in kind or kind.startswith('perc')
+
+
+PARSERS = {'amount_paid': parse_money, 'nights_paid': parse_nights, 'paid_on': parse_date,
+           'nightly_rate': parse_money, 'discount': parse_money,
+           'base_rate': parse_money, 'extra_bed_rate': parse_money, 'max_kids': parse_nights}
+
+
+def sync_money(mapper, connection, target):
+    state = sa_inspect(target)
+    for name, typed in MONEY_FIELDS[type(target).__name__]:
+        value, parsed = getattr(target, name), getattr(target, typed)
+        if state.attrs[name].history.has_changes() or (value is not None and parsed is None):
+            setattr(target, typed, PARSERS[typed](value))
+        elif value is None and parsed is not None:
+            # written through the typed column only: fill the form field in
+            setattr(target, name, parsed.isoformat() if isinstance(parsed, date) else str(parsed))
+
+
+for _model in (Payment, Reservation, Group_Reservation, Room_Type):
+    event.listen(_model, 'before_insert', sync_money)
+    event.listen(_model, 'before_update', sync_money)
+
+
+#========  Guest lookup keys =================#
+
+def phone_key(value):
+    # no leading zeros: the trunk 0 of "024 ..." is not part of "+233 24 ..."
+    digits = re.sub(r'\D', '', value or '').lstrip('0')
+    return digits[::-1][:32] or None
+
+
+def id_key(value):
+    key = re.sub(r'[^0-9A-Za-z]', '', value or '').upper()
+    return key[:64] or None
+
+
+def sync_guest_keys(mapper, connection, target):
+    target.phone_reversed = phone_key(target.phone_number)
+    target.id_key = id_key(target.id_number)
+
+
+event.listen(Guest, 'before_insert', sync_guest_keys)
+event.listen(Guest, 'before_update', sync_guest_keys)
@@ -0,0 +1,234 @@
+# application/database/routing.py
+#
+# Read-replica routing.
+#
+# Replica URLs listed in SQLALCHEMY_REPLICAS become extra binds
+# ("replica_0", "replica_1", ...).  RoutingSession sends SELECTs issued while
+# serving a GET/HEAD request of a read blueprint to a healthy replica (round
+# robin) and everything else - writes, flushes, CLI jobs - to the primary.
+#
+# Read-your-writes: for REPLICA_STICKY_SECONDS after a successful write
+# request, reads of the same user (the "id" claim of its bearer token) stay
+# on the primary.  The time is kept in this process; the write also sets a
+# short-lived cookie, which covers clients that send cookies back when the
+# next read lands on another worker.
+# Failover: a replica whose connection errors is taken out of rotation for
+# REPLICA_RETRY_AFTER seconds and must answer a probe before it is used again;
+# with no healthy replica every read goes to the primary.
+import base64
+import binascii
+import itertools
+import json
+import sqlite3
+import threading
+import time
+
+import click
+from flask import g, has_request_context, request
+from flask.cli import AppGroup
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+
+READ_BLUEPRINTS = ("restaurant", "user")
+SAFE_METHODS = ("GET", "HEAD")
+STICKY_COOKIE = "db_primary_until"
+RECENT_WRITERS_MAX = 10000
+
+
+class ReplicaSet:
+    def __init__(self):
+        self.keys = []
+        self._down_until = {}
+        self._watched = set()
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self.app = None
+        self.db = None
+
+    def init_app(self, app):
+        """Register replica binds; call before SQLAlchemy(app)."""
+        app.config.setdefault("SQLALCHEMY_REPLICAS", [])
+        app.config.setdefault("REPLICA_STICKY_SECONDS", 5)
+        app.config.setdefault("REPLICA_RETRY_AFTER", 30)
+        binds = app.config.setdefault("SQLALCHEMY_BINDS", {})
+        self.keys = []
+        for i, url in enumerate(app.config["SQLALCHEMY_REPLICAS"]):
+            key = f"replica_{i}"
+            binds[key] = url
+            self.keys.append(key)
+        self.app = app
+        app.before_request(_route_request)
+        app.after_request(_mark_sticky)
+        app.teardown_request(self._end_session)
+
+    def _end_session(self, exc):
+        # setup.py keeps an app context pushed for the whole process, so the
+        # scoped session would otherwise live across requests and serve rows
+        # from its identity map regardless of where this request was routed
+        if self.db is not None:
+            self.db.session.remove()
+
+    # ---------------------------
+    # Health
+    # ---------------------------
+    def _watch(self, key, engine):
+        if key in self._watched:
+            return
+        with self._lock:
+            if key not in self._watched:
+                event.listen(engine, "handle_error", lambda context: self._on_error(key, context))
+                self._watched.add(key)
+
+    def _on_error(self, key, context):
+        if context.is_disconnect or context.connection is None or isinstance(
+            context.original_exception, (sqlite3.OperationalError,)
+        ):
+            self.mark_down(key)
+
+    def mark_down(self, key):
+        self._down_until[key] = time.monotonic() + self.app.config["REPLICA_RETRY_AFTER"]
+        self.app.logger.warning("Replica %s marked down", key)
+
+    def _probe(self, key, engine):
+        try:
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+        except Exception:
+            self.mark_down(key)
+            return False
+        self._down_until.pop(key, None)
+        return True
+
+    def is_healthy(self, key):
+        until = self._down_until.get(key)
+        if until is None:
+            return True
+        if time.monotonic() < until:
+            return False
+        return self._probe(key, self.db.engines[key])
+
+    def choose(self):
+        """Bind key of the next healthy replica, or None for the primary."""
+        if not self.keys:
+            return None
+        start = next(self._counter)
+        for i in range(len(self.keys)):
+            key = self.keys[(start + i) % len(self.keys)]
+            if not self.is_healthy(key):
+                continue
+            if key not in self._watched:
+                # probe before first use so a replica that is down at boot
+                # never fails a request
+                self._watch(key, self.db.engines[key])
+                if not self._probe(key, self.db.engines[key]):
+                    continue
+            return key
+        return None
+
+
+replicas = ReplicaSet()
+_recent_writers = {}   # user id -> time.time() until which reads stay on the primary
+_recent_lock = threading.Lock()
+
+
+def _request_identity():
+    """The "id" claim of the request's bearer token, unverified: it only
+    picks where reads go, the view still authenticates the token."""
+    header = request.headers.get("Authorization", "")
+    if not header.startswith("Bearer "):
+        return None
+    try:
+        payload = header[7:].split(".")[1]
+        return json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))).get("id")
+    except (IndexError, ValueError, AttributeError, binascii.Error):
+        return None
+
+
+def _wrote_recently():
+    if float(request.cookies.get(STICKY_COOKIE, 0) or 0) >= time.time():
+        return True
+    identity = _request_identity()
+    return identity is not None and _recent_writers.get(identity, 0) >= time.time()
+
+
+def _route_request():
+    g.db_read_only = (
+        bool(replicas.keys)
+        and request.method in SAFE_METHODS
+        and request.blueprint in READ_BLUEPRINTS
+        and not _wrote_recently()
+    )
+
+
+def _mark_sticky(response):
+    if replicas.keys and request.method not in SAFE_METHODS + ("OPTIONS",) and response.status_code < 400:
+        seconds = replicas.app.config["REPLICA_STICKY_SECONDS"]
+        until = time.time() + seconds
+        identity = _request_identity()
+        if identity is not None:
+            with _recent_lock:
+                if len(_recent_writers) >= RECENT_WRITERS_MAX:
+                    now = time.time()
+                    for key in [key for key, value in _recent_writers.items() if value < now]:
+                        del _recent_writers[key]
+                _recent_writers[identity] = until
+        response.set_cookie(STICKY_COOKIE, str(until), max_age=seconds, httponly=True, samesite="Lax")
+    return response
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self._flushing
+            and clause is not None
+            and getattr(clause, "is_select", False)
+            and has_request_context()
+            and g.get("db_read_only")
+        ):
+            key = replicas.choose()
+            if key is not None:
+                return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+# ---------------------------
+# CLI:  flask replicas status|sync
+# ---------------------------
+replicas_cli = AppGroup("replicas", help="Read replica routing.")
+
+
+@replicas_cli.command("status")
+def status_command():
+    if not replicas.keys:
+        click.echo("No replicas configured (SQLALCHEMY_REPLICAS is empty)")
+    for key in replicas.keys:
+        engine = replicas.db.engines[key]
+        state = "up" if replicas._probe(key, engine) else "down"
+        click.echo(f"{key}: {engine.url.render_as_string(hide_password=True)} {state}")
+
+
+@replicas_cli.command("sync")
+def sync_command():
+    """Copy a SQLite primary into every SQLite replica (local testing)."""
+    primary = replicas.db.engines[None]
+    if primary.url.get_backend_name() != "sqlite":
+        raise click.ClickException("sync only copies SQLite databases; use streaming replication for Postgres")
+    source = primary.raw_connection()
+    try:
+        for key in replicas.keys:
+            url = make_url(replicas.app.config["SQLALCHEMY_BINDS"][key])
+            engine = replicas.db.engines[key]
+            if url.get_backend_name() != "sqlite":
+                click.echo(f"{key}: not SQLite, skipped")
+                continue
+            engine.dispose()
+            target = engine.raw_connection()
+            try:
+                source.driver_connection.backup(target.driver_connection)
+            finally:
+                target.close()
+            click.echo(f"{key}: copied from primary")
+    finally:
+        source.close()
@@ -0,0 +1,42 @@
+# application/database/schema.py
+#
+# Additive schema sync for databases created by db.create_all().
+#
+# create_all() creates missing tables but never touches existing ones, so a
+# column added to a model would break every query on an older database.  This
+# adds such columns (type, NOT NULL + server default) and any index declared
+# on the model that the table does not have yet.  It only ever adds; renames,
+# drops and type changes still need a real migration.
+from sqlalchemy import inspect, text
+
+
+def add_missing_columns(db):
+    inspector = inspect(db.engine)
+    added = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        new_columns = [column for column in table.columns if column.name not in existing]
+        indexed = {index["name"] for index in inspector.get_indexes(table.name)}
+        new_indexes = [index for index in table.indexes if index.name not in indexed]
+        if not new_columns and not new_indexes:
+            continue
+        preparer = db.engine.dialect.identifier_preparer
+        with db.engine.begin() as connection:
+            for column in new_columns:
+                ddl = "ALTER TABLE {} ADD COLUMN {} {}".format(
+                    preparer.format_table(table),
+                    preparer.format_column(column),
+                    column.type.compile(dialect=db.engine.dialect),
+                )
+                if column.server_default is not None:
+                    ddl += " DEFAULT " + str(column.server_default.arg)
+                    if not column.nullable:
+                        ddl += " NOT NULL"
+                connection.execute(text(ddl))
+                added.append(f"{table.name}.{column.name}")
+            for index in new_indexes:
+                index.create(connection, checkfirst=True)
+                added.append(f"{table.name}:{index.name}")
+    return added
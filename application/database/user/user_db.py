@@ -7,10 +7,16 @@ from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 from flask_praetorian import Praetorian
 from datetime import datetime
+from sqlalchemy import event
+
+from application.database.routing import RoutingSession, replicas, replicas_cli
 
 # Initialize extensions (ensure these aren't double-initialized elsewhere)
-db = SQLAlchemy(app)
+replicas.init_app(app)
+db = SQLAlchemy(app, session_options={"class_": RoutingSession})
+replicas.db = db
 migrate = Migrate(app, db)
+app.cli.add_command(replicas_cli)
 
 # Association Table for Feedback Tags (Many-to-Many)
 feedback_tags = db.Table(
@@ -24,9 +30,12 @@ feedback_tags = db.Table(
 # ---------------------------
 class User(db.Model):
     __tablename__ = 'user'
+    __table_args__ = (
+        db.Index('ix_user_role_id', 'role', 'id'),   # admin list filtered by role
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), nullable=False)
+    username = db.Column(db.String(80), nullable=False, index=True)  # sorted and prefix-filtered user lists
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.Text, nullable=False)
     phone = db.Column(db.String(20))
@@ -83,6 +92,11 @@ class Restaurant(db.Model):
     is_featured = db.Column(db.Boolean, default=False)
     status = db.Column(db.String(100))
 
+    # bumped on every change to the row or its feedbacks / menu items (see
+    # "Row versioning" below); used for ETags
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    menu_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
     # relationships
     feedbacks = db.relationship('Feedback', back_populates='restaurant', lazy='select', cascade='all, delete-orphan')
     saved_by_users = db.relationship('SavedPlace', back_populates='restaurant', lazy='select', cascade='all, delete-orphan')
@@ -118,12 +132,13 @@ class Feedback(db.Model):
     comment = db.Column(db.Text, nullable=True)
 
     anonymous = db.Column(db.Boolean, default=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # archive horizon scans
     likes = db.Column(db.Integer, default=0)
 
     # relationships (use back_populates for both sides)
     restaurant = db.relationship('Restaurant', back_populates='feedbacks', lazy='joined')
     user = db.relationship('User', back_populates='feedbacks', lazy='joined')
+    like_records = db.relationship('FeedbackLike', lazy='select', cascade='all, delete-orphan')
 
     # convenience method: validate ratings server-side
     def validate_ratings(self):
@@ -196,6 +211,7 @@ class MenuItem(db.Model):
     description = db.Column(db.Text)
     price = db.Column(db.Float, nullable=False)
     image_base64 = db.Column(db.Text)  # store base64 image
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
 
 # ---------------------------
@@ -251,3 +267,230 @@ class SavedPlace(db.Model):
 
     restaurant = db.relationship('Restaurant', back_populates='saved_by_users')
     user = db.relationship('User', back_populates='saved_places')
+
+
+# ---------------------------
+# Restaurant Neighbour Model ("people also saved")
+# ---------------------------
+class RestaurantNeighbour(db.Model):
+    __tablename__ = 'restaurant_neighbour'
+
+    restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    neighbour_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    co_saves = db.Column(db.Integer, nullable=False, default=0)
+    built_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# restaurants whose saves changed since the last neighbour build
+class RecommendationDirty(db.Model):
+    __tablename__ = 'recommendation_dirty'
+
+    restaurant_id = db.Column(db.Integer, primary_key=True)
+    marked_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# ---------------------------
+# Review Text Analytics Models
+# ---------------------------
+class ReviewAspectSummary(db.Model):
+    __tablename__ = 'review_aspect_summary'
+
+    restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    aspect = db.Column(db.String(20), primary_key=True)  # food, service, cleanliness, value
+    mentions = db.Column(db.Integer, nullable=False, default=0)
+    positive = db.Column(db.Integer, nullable=False, default=0)
+    negative = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class ReviewPhrase(db.Model):
+    __tablename__ = 'review_phrase'
+
+    restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'), primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)  # YYYY-MM
+    phrase = db.Column(db.String(120), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+# high-water marks of incremental batch jobs (last processed row id)
+class BatchWatermark(db.Model):
+    __tablename__ = 'batch_watermark'
+
+    name = db.Column(db.String(50), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# ---------------------------
+# FeedbackLike Model (one row per user per liked review)
+# ---------------------------
+class FeedbackLike(db.Model):
+    __tablename__ = 'feedback_like'
+
+    feedback_id = db.Column(db.Integer, db.ForeignKey('feedback.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # likes reconcile skips recent ones
+
+
+# an unlike leaves no feedback_like row behind; this records when it happened
+# so the likes reconcile can skip reviews other workers may still owe a delta.
+# No foreign key: the review may be deleted or archived meanwhile.
+class FeedbackUnlike(db.Model):
+    __tablename__ = 'feedback_unlike'
+
+    id = db.Column(db.Integer, primary_key=True)
+    feedback_id = db.Column(db.Integer, nullable=False, index=True)
+    unliked_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+# ---------------------------
+# Feedback cold storage
+# ---------------------------
+# reviews older than the archive horizon, moved out of the hot feedback table
+class FeedbackArchive(db.Model):
+    __tablename__ = 'feedback_archive'
+
+    id = db.Column(db.Integer, primary_key=True)  # same id it had in feedback
+    restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    rating_food = db.Column(db.Integer)
+    rating_service = db.Column(db.Integer)
+    rating_cleanliness = db.Column(db.Integer)
+    rating_value = db.Column(db.Integer)
+    rating_overall = db.Column(db.Integer)
+    recommend = db.Column(db.Boolean)
+    comment = db.Column(db.Text)
+    anonymous = db.Column(db.Boolean)
+    timestamp = db.Column(db.DateTime, index=True)
+    likes = db.Column(db.Integer, default=0)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# per restaurant per day sums of archived reviews, so aggregates over old
+# periods never need the archived rows themselves
+class FeedbackDailyRollup(db.Model):
+    __tablename__ = 'feedback_daily_rollup'
+
+    restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    reviews = db.Column(db.Integer, nullable=False, default=0)
+    food_sum = db.Column(db.Integer, nullable=False, default=0)
+    service_sum = db.Column(db.Integer, nullable=False, default=0)
+    cleanliness_sum = db.Column(db.Integer, nullable=False, default=0)
+    value_sum = db.Column(db.Integer, nullable=False, default=0)
+    value_count = db.Column(db.Integer, nullable=False, default=0)
+    overall_sum = db.Column(db.Integer, nullable=False, default=0)
+    overall_count = db.Column(db.Integer, nullable=False, default=0)
+    recommend_yes = db.Column(db.Integer, nullable=False, default=0)
+    recommend_count = db.Column(db.Integer, nullable=False, default=0)
+    service_1 = db.Column(db.Integer, nullable=False, default=0)
+    service_2 = db.Column(db.Integer, nullable=False, default=0)
+    service_3 = db.Column(db.Integer, nullable=False, default=0)
+    service_4 = db.Column(db.Integer, nullable=False, default=0)
+    service_5 = db.Column(db.Integer, nullable=False, default=0)
+
+
+class FeedbackArchiveRun(db.Model):
+    __tablename__ = 'feedback_archive_run'
+
+    id = db.Column(db.Integer, primary_key=True)
+    cutoff = db.Column(db.DateTime, nullable=False)  # everything older is archived
+    archived = db.Column(db.Integer, nullable=False, default=0)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+
+# ---------------------------
+# Job queue (see application/jobs/queue.py)
+# ---------------------------
+class Job(db.Model):
+    __tablename__ = 'job'
+    __table_args__ = (
+        db.Index('ix_job_claim', 'status', 'queue', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, index=True)
+    queue = db.Column(db.String(50), nullable=False, default='default')
+    payload = db.Column(db.Text, nullable=False, default='{}')   # {"args": [...], "kwargs": {...}}
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # lease: a running job belongs to locked_by until locked_until
+    locked_by = db.Column(db.String(100))
+    locked_until = db.Column(db.DateTime)
+
+    result = db.Column(db.Text)
+    last_error = db.Column(db.Text)
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+
+class JobSchedule(db.Model):
+    __tablename__ = 'job_schedule'
+
+    name = db.Column(db.String(100), primary_key=True)
+    next_run_at = db.Column(db.DateTime, nullable=False)
+    last_job_id = db.Column(db.Integer)
+
+
+# ---------------------------
+# Revoked tokens (see application/user_view/revocation.py)
+# ---------------------------
+class RevokedToken(db.Model):
+    __tablename__ = 'revoked_token'
+
+    jti = db.Column(db.String(36), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), index=True)
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    # when the token could no longer be refreshed anyway; pruned after that
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+# ---------------------------
+# Row versioning
+# ---------------------------
+# Restaurant.version changes whenever anything in the restaurant payload
+# changes (its own columns or its feedbacks); Restaurant.menu_version whenever
+# one of its menu items is added, edited or removed.  ORM write paths are
+# covered by these listeners; bulk Core updates must bump versions themselves
+# (see bump_restaurant_versions).
+def bump_restaurant_versions(connection, restaurant_ids, column='version'):
+    table = Restaurant.__table__
+    connection.execute(
+        table.update()
+        .where(table.c.id.in_(restaurant_ids))
+        .values({column: table.c[column] + 1})
+    )
+
+
+@event.listens_for(Restaurant, 'before_update')
+def _restaurant_before_update(mapper, connection, target):
+    target.version = (target.version or 0) + 1
+
+
+@event.listens_for(MenuItem, 'before_update')
+def _menu_item_before_update(mapper, connection, target):
+    target.version = (target.version or 0) + 1
+
+
+@event.listens_for(Feedback, 'after_insert')
+@event.listens_for(Feedback, 'after_update')
+@event.listens_for(Feedback, 'after_delete')
+def _feedback_changed(mapper, connection, target):
+    bump_restaurant_versions(connection, [target.restaurant_id])
+
+
+@event.listens_for(MenuItem, 'after_insert')
+@event.listens_for(MenuItem, 'after_update')
+@event.listens_for(MenuItem, 'after_delete')
+def _menu_item_changed(mapper, connection, target):
+    bump_restaurant_versions(connection, [target.restaurant_id], column='menu_version')
@@ -0,0 +1,48 @@
+from flask import Blueprint, jsonify, request
+from application.extensions.extensions import *
+from application.settings.setup import app
+from application.database.hotel_db.hotel import Employee
+from application.room_view.blobs import blob_response, blob_presence
+from flask_marshmallow import Marshmallow
+import flask_praetorian
+
+
+employee = Blueprint("employee", __name__)
+
+ma = Marshmallow(app)
+
+
+# salary, date of birth, address and ID document details are never listed
+class EmployeeSchema(ma.Schema):
+    class Meta:
+        fields = (
+            "id", "first_name", "last_name", "username", "email", "phone", "department",
+            "designation", "country", "region", "phone_number", "city", "gender",
+            "date_of_join", "remark", "session", "created_by_id", "created_date"
+        )
+
+employees_schema = EmployeeSchema(many=True)
+
+
+@employee.route("/", methods=["GET"])
+@flask_praetorian.roles_required("admin")
+def get_employees():
+    # id_photo is a deferred column; the list only says whether there is one
+    try:
+        staff = Employee.query.order_by(Employee.last_name, Employee.first_name).all()
+        photos = blob_presence("employee", [e.id for e in staff])
+        results = employees_schema.dump(staff)
+        for result in results:
+            result["id_photo"] = f"/employee/{result['id']}/id_photo" if photos[result["id"]] else None
+        return jsonify(results), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@employee.route("/<int:employee_id>/id_photo", methods=["GET"])
+@flask_praetorian.roles_required("admin")
+def get_id_photo(employee_id):
+    try:
+        return blob_response("employee", employee_id, "id_photo", private=True)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,45 @@
+from flask import Blueprint, jsonify, request
+from application.extensions.extensions import *
+from application.settings.setup import app
+from application.guest_view.search import search_guests
+from flask_marshmallow import Marshmallow
+import flask_praetorian
+
+
+guest = Blueprint("guest", __name__)
+
+ma = Marshmallow(app)
+
+
+# a lookup result list: no date of birth or address
+class GuestSchema(ma.Schema):
+    class Meta:
+        fields = (
+            "id", "first_name", "last_name", "username", "phone_number", "room", "room_number",
+            "country", "region", "city", "id_type", "id_number", "remark",
+            "arrival_date", "checkout_date", "work", "gender", "created_by_id", "created_date"
+        )
+
+guest_schema = GuestSchema()
+
+
+@guest.route("/search", methods=["GET"])
+@flask_praetorian.roles_required("admin")
+def search():
+    # ?q= tries phone / id / room exactly, then the name fuzzily;
+    # ?phone= ?id_number= ?room_number= ?name= search one field only
+    fields = {name: (request.args.get(name) or "").strip() or None
+              for name in ("q", "phone", "id_number", "room_number", "name")}
+    if not any(fields.values()):
+        return jsonify({"error": "Give q, phone, id_number, room_number or name"}), 400
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+    try:
+        results = []
+        for found, match, score in search_guests(limit=limit, **fields):
+            result = guest_schema.dump(found)
+            result["match"] = match
+            result["score"] = score
+            results.append(result)
+        return jsonify({"count": len(results), "guests": results}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
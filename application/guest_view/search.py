@@ -0,0 +1,287 @@
+# application/guest_view/search.py
+#
+# Front-desk guest search.
+#
+# Phone numbers, id numbers and room numbers are matched exactly, through
+# indexed keys kept on the guest row (see sync_guest_keys): a phone number
+# matches every guest whose number ends with the digits typed, so
+# "024 412 3456" finds "+233 24 412 3456".  When none of those hit, the
+# query is a name and is matched fuzzily on trigrams:
+#
+#   Postgres  pg_trgm GIN index on lower(first_name || ' ' || last_name),
+#             ranked by greatest(similarity, word_similarity)
+#   SQLite    an FTS5 table with the trigram tokenizer (guest_name_fts, kept
+#             in sync by triggers); names containing every query word, then
+#             if needed names sharing any 4-letter piece (best by bm25), up
+#             to GUEST_SEARCH_CANDIDATES, re-ranked in Python with the same
+#             similarity pg_trgm uses
+#
+# Names scoring below GUEST_SEARCH_THRESHOLD are dropped.  The index is
+# created at startup; `flask hotel guest-index` rebuilds it and backfills
+# the lookup keys of guests written before they existed.
+import re
+import time
+
+import click
+from sqlalchemy import bindparam, func, literal_column, or_, select, text
+
+from application.settings.setup import app
+from application.database.user.user_db import db
+from application.database.hotel_db.hotel import Guest, phone_key, id_key
+from application.room_view.availability import hotel_cli
+
+app.config.setdefault("GUEST_SEARCH_THRESHOLD", 0.3)
+app.config.setdefault("GUEST_SEARCH_CANDIDATES", 200)
+app.config.setdefault("GUEST_SEARCH_MIN_PHONE_DIGITS", 6)
+
+FTS_TABLE = "guest_name_fts"
+SQLITE_DDL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(name, tokenize='trigram')",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON guest BEGIN
+          INSERT INTO {FTS_TABLE}(rowid, name)
+          VALUES (new.id, trim(coalesce(new.first_name, '') || ' ' || coalesce(new.last_name, '')));
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF first_name, last_name ON guest BEGIN
+          DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+          INSERT INTO {FTS_TABLE}(rowid, name)
+          VALUES (new.id, trim(coalesce(new.first_name, '') || ' ' || coalesce(new.last_name, '')));
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON guest BEGIN
+          DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        END""",
+)
+POSTGRES_NAME = "lower(coalesce(first_name, '') || ' ' || coalesce(last_name, ''))"
+POSTGRES_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_guest_name_trgm ON guest USING gin (({POSTGRES_NAME}) gin_trgm_ops)",
+)
+
+
+# ---------------------------
+# Trigrams (pg_trgm semantics)
+# ---------------------------
+def words(value):
+    return re.findall(r"[^\W_]+", (value or "").lower())
+
+
+def trigrams(value):
+    grams = set()
+    for word in words(value):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a, b):
+    a, b = trigrams(a), trigrams(b)
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def name_score(query, name):
+    """The better of whole-name similarity and, per query word, its best
+    match among the name's words (so "mensa" still finds "Kofi Mensah")."""
+    query_words, name_words = words(query), words(name)
+    if not query_words or not name_words:
+        return 0.0
+    per_word = sum(max(similarity(q, n) for n in name_words) for q in query_words) / len(query_words)
+    return max(similarity(query, name), per_word)
+
+
+# ---------------------------
+# Index setup
+# ---------------------------
+def backend():
+    return {"sqlite": "fts5", "postgresql": "pg_trgm"}.get(db.engine.dialect.name)
+
+
+def ensure_search_index(rebuild=False):
+    """Create the trigram index (and fill it when it is new)."""
+    kind = backend()
+    if kind == "fts5":
+        with db.engine.begin() as connection:
+            exists = connection.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+            ).first()
+            for ddl in SQLITE_DDL:
+                connection.exec_driver_sql(ddl)
+            if rebuild or not exists:
+                connection.exec_driver_sql(f"DELETE FROM {FTS_TABLE}")
+                connection.exec_driver_sql(
+                    f"INSERT INTO {FTS_TABLE}(rowid, name) SELECT id, "
+                    "trim(coalesce(first_name, '') || ' ' || coalesce(last_name, '')) FROM guest"
+                )
+    elif kind == "pg_trgm":
+        with db.engine.begin() as connection:
+            for ddl in POSTGRES_DDL:
+                connection.exec_driver_sql(ddl)
+    return kind
+
+
+def backfill_guest_keys(batch_size=1000):
+    table = Guest.__table__
+    stmt = (
+        table.update()
+        .where(table.c.id == bindparam("gid"))
+        .values(phone_reversed=bindparam("phone_reversed"), id_key=bindparam("id_key"))
+    )
+    updated, last_id = 0, 0
+    while True:
+        rows = db.session.execute(
+            select(Guest.id, Guest.phone_number, Guest.id_number)
+            .where(
+                Guest.id > last_id,
+                or_(
+                    Guest.phone_number.isnot(None) & Guest.phone_reversed.is_(None),
+                    Guest.id_number.isnot(None) & Guest.id_key.is_(None),
+                ),
+            )
+            .order_by(Guest.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        db.session.execute(stmt, [
+            {"gid": gid, "phone_reversed": phone_key(phone), "id_key": id_key(number)}
+            for gid, phone, number in rows
+        ])
+        db.session.commit()
+        updated += len(rows)
+        last_id = rows[-1][0]
+    return updated
+
+
+# ---------------------------
+# Search
+# ---------------------------
+def _by_phone(value, limit):
+    key = phone_key(value)
+    if not key or len(key) < app.config["GUEST_SEARCH_MIN_PHONE_DIGITS"]:
+        return []
+    # reversed digits: "ends with" is the index range [key, key + ':')
+    return Guest.query.filter(Guest.phone_reversed >= key, Guest.phone_reversed < key + ":") \
+        .order_by(Guest.id.desc()).limit(limit).all()
+
+
+def _by_id_number(value, limit):
+    key = id_key(value)
+    if not key:
+        return []
+    return Guest.query.filter(Guest.id_key == key).order_by(Guest.id.desc()).limit(limit).all()
+
+
+def _by_room(value, limit):
+    value = (value or "").strip()
+    if not value:
+        return []
+    return Guest.query.filter(Guest.room_number == value).order_by(Guest.id.desc()).limit(limit).all()
+
+
+def _phrase(term):
+    return '"{}"'.format(term.replace('"', '""'))
+
+
+def _fts_ids(expression, order):
+    return db.session.execute(
+        text(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :q ORDER BY {order} LIMIT :n"),
+        {"q": expression, "n": app.config["GUEST_SEARCH_CANDIDATES"]},
+    ).scalars().all()
+
+
+def _by_name(value, limit):
+    threshold = app.config["GUEST_SEARCH_THRESHOLD"]
+    kind = backend()
+    if kind == "pg_trgm":
+        name = literal_column(POSTGRES_NAME)
+        query = value.lower()
+        score = func.greatest(func.similarity(name, query), func.word_similarity(query, name))
+        db.session.execute(
+            text("SELECT set_config('pg_trgm.similarity_threshold', :t, true), "
+                 "set_config('pg_trgm.word_similarity_threshold', :t, true)"),
+            {"t": str(threshold)},
+        )
+        rows = db.session.execute(
+            select(Guest, score.label("score"))
+            .where(or_(name.op("%")(query), name.op("%>")(query)))
+            .order_by(score.desc())
+            .limit(limit)
+        ).all()
+        return [(guest, round(float(s), 3)) for guest, s in rows]
+
+    terms = [w for w in words(value) if len(w) >= 3]
+    if kind == "fts5" and terms:
+        # every word as a substring first (cheap, newest guests first); only
+        # when that leaves the page short, any 4-letter piece, ranked by bm25
+        ids = _fts_ids(" AND ".join(map(_phrase, terms)), "rowid DESC")
+        if len(ids) < limit:
+            pieces = sorted({w[i:i + 4] for w in terms for i in range(max(len(w) - 3, 1))})
+            found = set(ids)
+            ids += [i for i in _fts_ids(" OR ".join(map(_phrase, pieces)), "rank") if i not in found]
+        candidates = Guest.query.filter(Guest.id.in_(ids)).all() if ids else []
+    else:
+        # no trigram index (or a query too short for one): prefix scan
+        prefix = (words(value) or [""])[0]
+        if not prefix:
+            return []
+        candidates = Guest.query.filter(or_(
+            func.lower(Guest.first_name).like(prefix + "%"), func.lower(Guest.last_name).like(prefix + "%")
+        )).limit(app.config["GUEST_SEARCH_CANDIDATES"]).all()
+    scored = [(guest, name_score(value, f"{guest.first_name or ''} {guest.last_name or ''}")) for guest in candidates]
+    scored = [(guest, round(s, 3)) for guest, s in scored if s >= threshold]
+    scored.sort(key=lambda pair: (-pair[1], -pair[0].id))
+    return scored[:limit]
+
+
+def search_guests(q=None, phone=None, id_number=None, room_number=None, name=None, limit=20):
+    """[(guest, match, score)].  A bare `q` tries the exact keys first and
+    only falls back to the fuzzy name match when none of them hit."""
+    exact = []
+    if phone:
+        exact += [(g, "phone") for g in _by_phone(phone, limit)]
+    if id_number:
+        exact += [(g, "id_number") for g in _by_id_number(id_number, limit)]
+    if room_number:
+        exact += [(g, "room_number") for g in _by_room(room_number, limit)]
+    if q and re.search(r"\d", q):
+        exact += [(g, "id_number") for g in _by_id_number(q, limit)]
+        if re.fullmatch(r"[\d\s()+\-./]+", q.strip()):
+            exact += [(g, "phone") for g in _by_phone(q, limit)]
+        exact += [(g, "room_number") for g in _by_room(q, limit)]
+
+    results, seen = [], set()
+    for guest, match in exact:
+        if guest.id not in seen:
+            seen.add(guest.id)
+            results.append((guest, match, 1.0))
+    fuzzy = name or (q if not results else None)
+    if fuzzy:
+        for guest, score in _by_name(fuzzy, limit):
+            if guest.id not in seen:
+                seen.add(guest.id)
+                results.append((guest, "name", score))
+    return results[:limit]
+
+
+# ---------------------------
+# CLI:  flask hotel guest-index | guest-search
+# ---------------------------
+@hotel_cli.command("guest-index")
+@click.option("--batch-size", type=int, default=1000)
+def guest_index_command(batch_size):
+    updated = backfill_guest_keys(batch_size)
+    started = time.perf_counter()
+    kind = ensure_search_index(rebuild=True)
+    click.echo(f"Backfilled lookup keys of {updated} guests; "
+               f"{kind or 'no trigram'} index rebuilt in {time.perf_counter() - started:.2f}s")
+
+
+@hotel_cli.command("guest-search")
+@click.argument("query")
+@click.option("--limit", type=int, default=10)
+def guest_search_command(query, limit):
+    started = time.perf_counter()
+    results = search_guests(q=query, limit=limit)
+    elapsed = time.perf_counter() - started
+    for guest, match, score in results:
+        click.echo(f"{guest.id:>8}  {score:5.3f}  {match:<11} {guest.first_name} {guest.last_name}  "
+                   f"{guest.phone_number or ''}  {guest.id_number or ''}")
+    click.echo(f"{len(results)} guests in {elapsed * 1000:.1f}ms ({backend() or 'no trigram index'})")
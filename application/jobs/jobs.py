@@ -0,0 +1,243 @@
+# application/jobs/jobs.py
+#
+# `flask worker` and the job-status API.
+#
+#   flask worker                         all queues, 4 threads
+#   flask worker -q mail -c 2            only the mail queue
+#   flask worker --burst                 run what is due, then exit (cron, tests)
+#   flask jobs enqueue mail.send '["a@b.c", "Hi", "..."]'
+#   flask jobs stats
+#
+# Each worker thread claims one job at a time inside its own app context (so
+# its own database session).  The main thread renews the leases of running
+# jobs, requeues jobs of dead workers and enqueues periodic tasks.  SIGTERM
+# or Ctrl-C stops claiming new jobs and waits for the running ones.
+import json
+import signal
+import threading
+import time
+from datetime import datetime
+
+import click
+import flask_praetorian
+from flask import Blueprint, jsonify, request
+from flask.cli import AppGroup
+from sqlalchemy import func, select
+
+from application.settings.setup import app
+from application.database.user.user_db import db, Job
+from application.jobs.queue import (
+    STATUSES, tasks, enqueue, claim, renew, reap, execute, enqueue_due_periodic, job_status, worker_name
+)
+import application.jobs.tasks  # noqa: F401  (registers the tasks)
+
+app.config.setdefault("JOBS_CONCURRENCY", 4)
+app.config.setdefault("JOBS_POLL_INTERVAL", 1.0)
+
+jobs = Blueprint("jobs", __name__)
+
+
+class Worker:
+    def __init__(self, queues=None, concurrency=None, poll_interval=None, burst=False, scheduler=True):
+        self.name = worker_name()
+        self.queues = list(queues or {spec.queue for spec in tasks.values()})
+        self.concurrency = concurrency or app.config["JOBS_CONCURRENCY"]
+        self.poll_interval = poll_interval or app.config["JOBS_POLL_INTERVAL"]
+        self.burst = burst
+        self.scheduler = scheduler
+        self.stopping = threading.Event()
+        self.processed = 0
+        self.failed = 0
+        self._running = set()
+        self._lock = threading.Lock()
+
+    def stop(self, *_):
+        self.stopping.set()
+
+    def _work(self):
+        while not self.stopping.is_set():
+            with app.app_context():
+                try:
+                    if not self._work_one():
+                        if self.burst:
+                            return
+                        self.stopping.wait(self.poll_interval)
+                except Exception as e:
+                    # e.g. the database went away: keep the thread alive; a
+                    # job claimed but not finished goes back when its lease expires
+                    db.session.rollback()
+                    app.logger.warning("Worker %s failed to run a job: %s", self.name, e)
+                    self.stopping.wait(self.poll_interval)
+
+    def _work_one(self):
+        """Claim and run one job; False when none is due."""
+        rows = claim(self.name, self.queues)
+        if not rows:
+            return False
+        job_id, name, payload, attempts = rows[0]
+        with self._lock:
+            self._running.add(job_id)
+        try:
+            ok = execute(job_id, name, payload, attempts, self.name)
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+        with self._lock:
+            self.processed += 1
+            self.failed += not ok
+        return True
+
+    def _housekeeping(self):
+        with app.app_context():
+            try:
+                with self._lock:
+                    running = list(self._running)
+                renew(self.name, running)
+                reap()
+                if self.scheduler:
+                    for name in enqueue_due_periodic():
+                        app.logger.info("Enqueued periodic job %s", name)
+            except Exception as e:
+                db.session.rollback()
+                app.logger.warning("Worker housekeeping failed: %s", e)
+
+    def run(self):
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+        self._housekeeping()
+        threads = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        tick = max(1.0, app.config["JOBS_LEASE_SECONDS"] / 4.0)
+        while any(thread.is_alive() for thread in threads):
+            # short waits so a finished burst is noticed promptly
+            deadline = time.monotonic() + tick
+            while time.monotonic() < deadline and any(thread.is_alive() for thread in threads):
+                time.sleep(min(self.poll_interval, 0.2))
+            self._housekeeping()
+        return self.processed, self.failed
+
+
+# ---------------------------
+# CLI:  flask worker / flask jobs ...
+# ---------------------------
+@app.cli.command("worker")
+@click.option("-q", "--queue", "queues", multiple=True, help="Queue to consume (repeatable; default all).")
+@click.option("-c", "--concurrency", type=int, default=None, help="Jobs run at once by this process.")
+@click.option("--poll-interval", type=float, default=None, help="Seconds to sleep when the queue is empty.")
+@click.option("--burst", is_flag=True, help="Exit once no job is due.")
+@click.option("--no-scheduler", is_flag=True, help="Do not enqueue periodic jobs from this worker.")
+def worker_command(queues, concurrency, poll_interval, burst, no_scheduler):
+    worker = Worker(queues, concurrency, poll_interval, burst, scheduler=not no_scheduler)
+    click.echo(f"Worker {worker.name} on {', '.join(sorted(worker.queues))} with {worker.concurrency} threads")
+    processed, failed = worker.run()
+    click.echo(f"Processed {processed} jobs ({failed} failed)")
+
+
+jobs_cli = AppGroup("jobs", help="Background job queue.")
+
+
+@jobs_cli.command("enqueue")
+@click.argument("name")
+@click.argument("args", default="[]")
+@click.option("--delay", type=float, default=None, help="Seconds before the job may run.")
+def enqueue_command(name, args, delay):
+    job = enqueue(name, *json.loads(args), delay=delay)
+    db.session.commit()
+    click.echo(f"Enqueued job {job.id} ({name})")
+
+
+@jobs_cli.command("stats")
+def stats_command():
+    for (queue, status), count in sorted(queue_counts().items()):
+        click.echo(f"{queue:<15} {status:<10} {count}")
+
+
+app.cli.add_command(jobs_cli)
+
+
+def queue_counts():
+    rows = db.session.execute(
+        select(Job.queue, Job.status, func.count()).group_by(Job.queue, Job.status)
+    ).all()
+    return {(queue, status): count for queue, status, count in rows}
+
+
+# ---------------------------
+# Job-status API
+# ---------------------------
+@jobs.route("/<int:job_id>", methods=["GET"])
+@flask_praetorian.auth_required
+def get_job(job_id):
+    try:
+        job = db.session.get(Job, job_id)
+        user = flask_praetorian.current_user()
+        if job is None or (user.role != "admin" and job.created_by != user.id):
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(job_status(job)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@jobs.route("/", methods=["GET"])
+@flask_praetorian.roles_required("admin")
+def list_jobs():
+    try:
+        status = request.args.get("status")
+        if status and status not in STATUSES:
+            return jsonify({"error": f"status must be one of {', '.join(STATUSES)}"}), 400
+        query = Job.query
+        if status:
+            query = query.filter(Job.status == status)
+        if request.args.get("name"):
+            query = query.filter(Job.name == request.args["name"])
+        limit = min(request.args.get("limit", default=50, type=int), 500)
+        rows = query.order_by(Job.id.desc()).limit(limit).all()
+        counts = {}
+        for (queue, state), count in queue_counts().items():
+            counts.setdefault(queue, {})[state] = count
+        return jsonify({"jobs": [job_status(job) for job in rows], "counts": counts}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@jobs.route("/", methods=["POST"])
+@flask_praetorian.roles_required("admin")
+def create_job():
+    try:
+        data = request.get_json() or {}
+        if data.get("name") not in tasks:
+            return jsonify({"error": "Unknown task"}), 400
+        job = enqueue(
+            data["name"], *data.get("args", []), delay=data.get("delay"),
+            user_id=flask_praetorian.current_user().id, **data.get("kwargs", {})
+        )
+        db.session.commit()
+        return jsonify(job_status(job)), 202
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+@jobs.route("/<int:job_id>/retry", methods=["POST"])
+@flask_praetorian.roles_required("admin")
+def retry_job(job_id):
+    try:
+        job = db.session.get(Job, job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        if job.status != "failed":
+            return jsonify({"error": "Only failed jobs can be retried"}), 409
+        job.status = "queued"
+        job.attempts = 0
+        job.run_at = datetime.utcnow()
+        job.finished_at = None
+        db.session.commit()
+        return jsonify(job_status(job)), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
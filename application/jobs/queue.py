@@ -0,0 +1,298 @@
+# application/jobs/queue.py
+#
+# Durable job queue in the app's own database.
+#
+# A job is a row in `job`: task name, JSON arguments, when it may run and how
+# often it has been tried.  enqueue() only adds the row to the current
+# session, so the job is committed together with the request's own writes (or
+# not at all).  `flask worker` claims due jobs by taking a lease on them:
+#
+#   Postgres  SELECT ... FOR UPDATE SKIP LOCKED inside the claiming UPDATE, so
+#             concurrent workers never wait on each other's rows.
+#   SQLite    the same UPDATE ... RETURNING; SQLite runs one writer at a time,
+#             which makes the claim atomic on its own.
+#
+# The lease (locked_by / locked_until on the row) is renewed while the job
+# runs.  A worker that dies stops renewing it, and the job goes back to the
+# queue once it expires.  Failed jobs are retried with exponential backoff
+# until max_attempts, after which they stay `failed` for inspection.
+#
+#   @task("mail.send", queue="mail", max_attempts=8)
+#   def send_mail(...): ...
+#
+#   enqueue("mail.send", to, subject, body, delay=60)
+#   db.session.commit()
+import json
+import os
+import random
+import socket
+import traceback
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, case, delete, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from application.settings.setup import app
+from application.database.user.user_db import db, Job, JobSchedule
+
+app.config.setdefault("JOBS_LEASE_SECONDS", 120)
+app.config.setdefault("JOBS_BACKOFF_BASE", 10)       # seconds before the first retry
+app.config.setdefault("JOBS_BACKOFF_MAX", 3600)
+app.config.setdefault("JOBS_RETENTION_DAYS", 7)      # finished jobs kept this long
+
+STATUSES = ("queued", "running", "succeeded", "failed")
+
+
+@dataclass
+class Task:
+    name: str
+    func: object
+    queue: str = "default"
+    max_attempts: int = 5
+    priority: int = 0
+
+
+tasks = {}
+periodic = {}
+
+
+def task(name, queue="default", max_attempts=5, priority=0, every=None):
+    """Register a function as a job that workers can run by `name`.
+
+    With `every` (seconds) the worker also enqueues it, without arguments, on
+    that interval; app.config["JOBS_PERIODIC"][name] overrides the interval
+    and 0 disables the schedule.
+    """
+    def decorator(func):
+        tasks[name] = Task(name, func, queue, max_attempts, priority)
+        if every:
+            periodic[name] = every
+        return func
+    return decorator
+
+
+def enqueue(name, *args, delay=None, run_at=None, priority=None, user_id=None, **kwargs):
+    """Add a job to the session (caller commits) and return it."""
+    spec = tasks.get(name)
+    if spec is None:
+        raise KeyError(f"Unknown task {name!r}")
+    if run_at is None:
+        run_at = datetime.utcnow() + timedelta(seconds=delay or 0)
+    job = Job(
+        name=name,
+        queue=spec.queue,
+        payload=json.dumps({"args": list(args), "kwargs": kwargs}),
+        priority=spec.priority if priority is None else priority,
+        max_attempts=spec.max_attempts,
+        run_at=run_at,
+        created_by=user_id,
+    )
+    db.session.add(job)
+    return job
+
+
+def backoff(attempts):
+    base = app.config["JOBS_BACKOFF_BASE"]
+    delay = min(app.config["JOBS_BACKOFF_MAX"], base * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# ---------------------------
+# Claiming and finishing (used by the worker)
+# ---------------------------
+def claim(worker, queues, limit=1):
+    """Lease up to `limit` due jobs; returns [(id, name, payload, attempts)]."""
+    now = datetime.utcnow()
+    due = (
+        select(Job.id)
+        .where(Job.status == "queued", Job.queue.in_(queues), Job.run_at <= now)
+        .order_by(Job.priority.desc(), Job.run_at, Job.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)   # rendered on Postgres, ignored by SQLite
+    )
+    try:
+        rows = db.session.execute(
+            update(Job)
+            .where(Job.id.in_(due.scalar_subquery()), Job.status == "queued")
+            .values(
+                status="running",
+                locked_by=worker,
+                locked_until=now + timedelta(seconds=app.config["JOBS_LEASE_SECONDS"]),
+                attempts=Job.attempts + 1,
+                started_at=now,
+            )
+            .returning(Job.id, Job.name, Job.payload, Job.attempts)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return rows
+
+
+def renew(worker, job_ids):
+    """Extend the lease on jobs this worker is still running."""
+    if not job_ids:
+        return
+    db.session.execute(
+        update(Job)
+        .where(Job.id.in_(job_ids), Job.locked_by == worker, Job.status == "running")
+        .values(locked_until=datetime.utcnow() + timedelta(seconds=app.config["JOBS_LEASE_SECONDS"]))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def reap():
+    """Return jobs whose lease expired (their worker died) to the queue."""
+    now = datetime.utcnow()
+    result = db.session.execute(
+        update(Job)
+        .where(Job.status == "running", Job.locked_until < now)
+        .values(
+            status=case((Job.attempts >= Job.max_attempts, "failed"), else_="queued"),
+            # failed for good: stamped so prune_jobs removes it in time
+            finished_at=case((Job.attempts >= Job.max_attempts, now), else_=None),
+            run_at=now,
+            locked_by=None,
+            locked_until=None,
+            last_error="lease expired",
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def _finish(job_id, worker, **values):
+    # only the lease holder may finish a job; a worker that lost its lease
+    # (e.g. after a long GC pause) must not overwrite the new owner's state
+    result = db.session.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.locked_by == worker, Job.status == "running")
+        .values(locked_by=None, locked_until=None, **values)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    if not result.rowcount:
+        app.logger.warning("Job %s finished after its lease was lost", job_id)
+
+
+def execute(job_id, name, payload, attempts, worker):
+    """Run one claimed job and record the outcome."""
+    spec = tasks.get(name)
+    try:
+        if spec is None:
+            raise KeyError(f"Unknown task {name!r}")
+        params = json.loads(payload or "{}")
+        value = spec.func(*params.get("args", []), **params.get("kwargs", {}))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.warning("Job %s (%s) attempt %s failed: %s", job_id, name, attempts, e)
+        error = traceback.format_exc(limit=5)[-4000:]
+        max_attempts = db.session.execute(select(Job.max_attempts).where(Job.id == job_id)).scalar() or 0
+        if spec is not None and attempts < max_attempts:
+            _finish(job_id, worker, status="queued", last_error=error,
+                    run_at=datetime.utcnow() + timedelta(seconds=backoff(attempts)))
+        else:
+            _finish(job_id, worker, status="failed", last_error=error, finished_at=datetime.utcnow())
+        return False
+    try:
+        result = json.dumps(value)
+    except (TypeError, ValueError):
+        result = json.dumps(repr(value))
+    _finish(job_id, worker, status="succeeded", result=result, last_error=None, finished_at=datetime.utcnow())
+    return True
+
+
+# ---------------------------
+# Periodic jobs
+# ---------------------------
+def schedule_intervals():
+    intervals = dict(periodic)
+    intervals.update(app.config.get("JOBS_PERIODIC") or {})
+    return {name: seconds for name, seconds in intervals.items() if seconds and name in tasks}
+
+
+def enqueue_due_periodic():
+    """Enqueue every periodic task whose time has come.
+
+    Each schedule row is advanced with a compare-and-set UPDATE, so when
+    several workers tick at once exactly one of them enqueues the job.
+    """
+    now = datetime.utcnow()
+    intervals = schedule_intervals()
+    if not intervals:
+        return []
+    known = dict(db.session.execute(
+        select(JobSchedule.name, JobSchedule.next_run_at).where(JobSchedule.name.in_(intervals))
+    ).all())
+    for name in intervals.keys() - known.keys():
+        try:
+            db.session.add(JobSchedule(name=name, next_run_at=now))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+        known[name] = now
+
+    enqueued = []
+    for name, next_run_at in known.items():
+        if next_run_at > now:
+            continue
+        advanced = db.session.execute(
+            update(JobSchedule)
+            .where(JobSchedule.name == name, JobSchedule.next_run_at == next_run_at)
+            .values(next_run_at=now + timedelta(seconds=intervals[name]))
+            .execution_options(synchronize_session=False)
+        )
+        if not advanced.rowcount:
+            db.session.rollback()
+            continue
+        job = enqueue(name)
+        db.session.flush()
+        db.session.execute(
+            update(JobSchedule).where(JobSchedule.name == name).values(last_job_id=job.id)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        enqueued.append(name)
+    return enqueued
+
+
+def prune_jobs(days=None):
+    """Delete finished jobs older than the retention window."""
+    days = days or app.config["JOBS_RETENTION_DAYS"]
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    result = db.session.execute(
+        delete(Job).where(
+            Job.status.in_(("succeeded", "failed")),
+            # rows reaped before reap() stamped finished_at: their run_at
+            or_(Job.finished_at < cutoff, and_(Job.finished_at.is_(None), Job.run_at < cutoff)),
+        )
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def job_status(job):
+    return {
+        "id": job.id,
+        "name": job.name,
+        "queue": job.queue,
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "run_at": job.run_at.isoformat() if job.run_at else None,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "result": json.loads(job.result) if job.result else None,
+        "last_error": job.last_error,
+    }
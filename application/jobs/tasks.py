@@ -0,0 +1,68 @@
+# application/jobs/tasks.py
+#
+# Jobs the worker knows how to run.  The periodic ones replace cron entries
+# for the maintenance CLI commands; intervals are in seconds and can be
+# changed per deployment through app.config["JOBS_PERIODIC"].
+from flask_mail import Message
+
+from application.settings.setup import app
+from application.settings.settings import mail
+from application.jobs.queue import task, prune_jobs
+from application.recommendation.recommendation import refresh_neighbours
+from application.recommendation.similar import refresh_index
+from application.analytics.text_analytics import run_text_analytics
+from application.restaurant.archive import archive_feedback
+from application.restaurant.likes import reconcile_likes
+from application.room_view.audit import audit_recent
+from application.user_view.revocation import prune_revoked
+
+
+@task("mail.send", queue="mail", max_attempts=8)
+def send_mail(recipients, subject, body, html=None):
+    if isinstance(recipients, str):
+        recipients = [recipients]
+    mail.send(Message(subject, sender=app.config["MAIL_USERNAME"], recipients=recipients, body=body, html=html))
+    return len(recipients)
+
+
+@task("recommendations.refresh", every=300)
+def refresh_recommendations():
+    return refresh_neighbours()
+
+
+@task("similar.refresh", every=900)
+def refresh_similar(restaurant_ids=None):
+    return refresh_index(set(restaurant_ids) if restaurant_ids else None)
+
+
+@task("text_analytics.run", every=900)
+def text_analytics():
+    # the worker already runs jobs in parallel; no nested process pool
+    return run_text_analytics(workers=1)
+
+
+@task("feedback.archive", queue="maintenance", every=24 * 3600)
+def archive_old_feedback():
+    return archive_feedback()
+
+
+@task("likes.reconcile", queue="maintenance", every=24 * 3600)
+def reconcile_like_counters():
+    # safe next to the web workers: reviews they may still owe a delta are
+    # skipped, and only restaurants with a corrected count get a new ETag
+    return reconcile_likes()
+
+
+@task("hotel.night_audit", queue="maintenance", every=24 * 3600)
+def hotel_night_audit(days=None):
+    return audit_recent(days)
+
+
+@task("auth.prune_revoked", queue="maintenance", every=24 * 3600)
+def prune_revoked_tokens():
+    return prune_revoked()
+
+
+@task("jobs.prune", queue="maintenance", every=3600)
+def prune_finished_jobs():
+    return prune_jobs()
@@ -0,0 +1,229 @@
+# application/moderation/minhash.py
+#
+# Near-duplicate review detection with MinHash + LSH.
+#
+# A comment is normalised, cut into character shingles and reduced to a
+# MinHash signature; signatures are split into bands and every band is a key in
+# an in-memory LSH table, so finding candidates is a handful of dict lookups.
+#
+# The index is persisted as an append-only file of fixed-size records
+# (feedback id + signature).  Every worker appends the reviews it indexes and
+# picks up records appended by other workers by reading the file tail, so the
+# index is shared and survives restarts without a separate service.
+import os
+import re
+import tempfile
+import threading
+import time
+import zlib
+
+import click
+import numpy as np
+from flask.cli import AppGroup
+from sqlalchemy import select
+
+from application.settings.setup import app
+from application.database.user.user_db import db, Feedback, ModerationLog
+
+app.config.setdefault("MINHASH_INDEX_PATH", os.path.join(app.instance_path, "minhash_index.bin"))
+app.config.setdefault("MINHASH_THRESHOLD", 0.8)
+# very short comments ("nice", "good food") are legitimately repeated
+app.config.setdefault("MINHASH_MIN_LENGTH", 25)
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE = 5
+PRIME = np.uint64((1 << 61) - 1)
+
+_rng = np.random.RandomState(2029)
+_A = _rng.randint(1, 1 << 31, size=(NUM_PERM, 1)).astype(np.uint64)
+_B = _rng.randint(0, 1 << 31, size=(NUM_PERM, 1)).astype(np.uint64)
+
+RECORD = np.dtype([("feedback_id", "<i8"), ("signature", "<u4", (NUM_PERM,))])
+
+FLAG_ACTION = "flagged_duplicate"
+
+_NORMALISE_RE = re.compile(r"[^a-z0-9]+")
+
+
+def normalise(text):
+    return _NORMALISE_RE.sub(" ", (text or "").lower()).strip()
+
+
+def signature(text):
+    """MinHash signature of a normalised comment, or None if it is too short."""
+    if len(text) < app.config["MINHASH_MIN_LENGTH"]:
+        return None
+    data = text.encode()
+    shingles = np.fromiter(
+        {zlib.crc32(data[i:i + SHINGLE]) for i in range(len(data) - SHINGLE + 1)},
+        dtype=np.uint64,
+    )
+    return ((_A * shingles + _B) % PRIME).min(axis=1).astype(np.uint32)
+
+
+class MinHashIndex:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._stamp = None
+        self._offset = 0
+        self.ids = []
+        self.signatures = []
+        self.buckets = [{} for _ in range(BANDS)]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _insert(self, feedback_id, sig):
+        position = len(self.ids)
+        self.ids.append(feedback_id)
+        self.signatures.append(sig)
+        for band in range(BANDS):
+            key = sig[band * ROWS:(band + 1) * ROWS].tobytes()
+            self.buckets[band].setdefault(key, []).append(position)
+
+    def sync(self):
+        """Load the index on first use and apply records appended since."""
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                if self._stamp is not None:
+                    self._reset()
+                return
+            if self._stamp is not None and self._stamp != stat.st_ino:
+                self._reset()  # replaced by a batch dedupe run
+            self._stamp = stat.st_ino
+            complete = stat.st_size - stat.st_size % RECORD.itemsize
+            if complete <= self._offset:
+                return
+            with open(self.path, "rb") as fh:
+                fh.seek(self._offset)
+                records = np.frombuffer(fh.read(complete - self._offset), dtype=RECORD)
+            for record in records:
+                self._insert(int(record["feedback_id"]), record["signature"].copy())
+            self._offset = complete
+
+    def query(self, sig, exclude=None):
+        """Return (feedback_id, similarity) of the closest indexed review."""
+        candidates = set()
+        for band in range(BANDS):
+            candidates.update(self.buckets[band].get(sig[band * ROWS:(band + 1) * ROWS].tobytes(), ()))
+        best = None
+        for position in candidates:
+            if self.ids[position] == exclude:
+                continue
+            similarity = float(np.count_nonzero(self.signatures[position] == sig)) / NUM_PERM
+            if best is None or similarity > best[1]:
+                best = (self.ids[position], similarity)
+        return best
+
+    def add(self, feedback_id, sig):
+        """Append to the shared file; every worker (this one included) picks
+        the record up on its next sync."""
+        record = np.zeros(1, dtype=RECORD)
+        record["feedback_id"] = feedback_id
+        record["signature"] = sig
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, record.tobytes())
+        finally:
+            os.close(fd)
+        self.sync()
+
+
+minhash_index = MinHashIndex(app.config["MINHASH_INDEX_PATH"])
+
+
+def check_feedback(feedback):
+    """Index a freshly committed review and flag it if it near-duplicates an
+    earlier one.  Returns the ModerationLog entry (caller commits) or None."""
+    sig = signature(normalise(feedback.comment))
+    if sig is None:
+        return None
+    minhash_index.sync()
+    match = minhash_index.query(sig, exclude=feedback.id)
+    minhash_index.add(feedback.id, sig)
+    if match is None or match[1] < app.config["MINHASH_THRESHOLD"]:
+        return None
+    log = ModerationLog(
+        feedback_id=feedback.id,
+        action=FLAG_ACTION,
+        reason=f"Near-duplicate of feedback {match[0]} (similarity {match[1]:.2f})",
+    )
+    db.session.add(log)
+    return log
+
+
+def dedupe_history(batch_size=5000):
+    """Rebuild the index from every stored review and flag duplicates of
+    earlier reviews that are not flagged yet.  Returns (indexed, flagged)."""
+    threshold = app.config["MINHASH_THRESHOLD"]
+    already = set(db.session.execute(
+        select(ModerationLog.feedback_id).where(ModerationLog.action == FLAG_ACTION)
+    ).scalars())
+
+    fresh = MinHashIndex(None)
+    records = []
+    flagged = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(Feedback.id, Feedback.comment)
+            .where(Feedback.id > last_id, Feedback.comment.isnot(None))
+            .order_by(Feedback.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        for feedback_id, comment in rows:
+            sig = signature(normalise(comment))
+            if sig is None:
+                continue
+            match = fresh.query(sig)
+            if match and match[1] >= threshold and feedback_id not in already:
+                db.session.add(ModerationLog(
+                    feedback_id=feedback_id,
+                    action=FLAG_ACTION,
+                    reason=f"Near-duplicate of feedback {match[0]} (similarity {match[1]:.2f})",
+                ))
+                flagged += 1
+            fresh._insert(feedback_id, sig)
+            records.append((feedback_id, sig))
+        last_id = rows[-1][0]
+        db.session.commit()
+
+    path = minhash_index.path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = np.zeros(len(records), dtype=RECORD)
+    if records:
+        data["feedback_id"] = [r[0] for r in records]
+        data["signature"] = np.stack([r[1] for r in records])
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(data.tobytes())
+    os.replace(tmp, path)
+    minhash_index.sync()
+    return len(records), flagged
+
+
+# ---------------------------
+# CLI:  flask moderation dedupe
+# ---------------------------
+moderation_cli = AppGroup("moderation", help="Duplicate and spam review detection.")
+
+
+@moderation_cli.command("dedupe")
+def dedupe_command():
+    started = time.perf_counter()
+    indexed, flagged = dedupe_history()
+    click.echo(f"Indexed {indexed} reviews, flagged {flagged} duplicates in {time.perf_counter() - started:.2f}s")
+
+
+app.cli.add_command(moderation_cli)
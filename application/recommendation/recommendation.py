@@ -0,0 +1,282 @@
+# application/recommendation/recommendation.py
+#
+# "People also saved" item-to-item recommendations.
+#
+# A batch job turns SavedPlace (and optionally well rated Feedback) into a
+# sparse restaurant x restaurant co-occurrence matrix, scores every pair with
+# cosine similarity and keeps the top-N neighbours of each restaurant in the
+# restaurant_neighbour table, so serving a list is a single indexed lookup.
+import time
+from datetime import datetime
+
+import click
+import numpy as np
+from flask.cli import AppGroup
+from sqlalchemy import delete, insert, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from application.settings.setup import app
+from application.database.user.user_db import (
+    db, Restaurant, Feedback, SavedPlace, RestaurantNeighbour, RecommendationDirty
+)
+
+app.config.setdefault("RECOMMENDATION_TOP_N", 20)
+# users with more saves than this only contribute their first N places, which
+# keeps the pair expansion (quadratic per user) bounded
+app.config.setdefault("RECOMMENDATION_MAX_SAVES_PER_USER", 200)
+# feedback rated at least this overall counts as an implicit save (None = off)
+app.config.setdefault("RECOMMENDATION_MIN_RATING", 4)
+
+
+# ---------------------------
+# Loading
+# ---------------------------
+def load_interactions(min_rating=None):
+    """Return (user_ids, restaurant_ids) int64 arrays of every save."""
+    rows = db.session.execute(select(SavedPlace.user_id, SavedPlace.restaurant_id)).all()
+    if min_rating is not None:
+        rows += db.session.execute(
+            select(Feedback.user_id, Feedback.restaurant_id)
+            .where(Feedback.rating_overall >= min_rating)
+        ).all()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    pairs = np.array(rows, dtype=np.int64)
+    return pairs[:, 0], pairs[:, 1]
+
+
+# ---------------------------
+# Vectorized co-occurrence
+# ---------------------------
+def co_occurrence(users, items, n_items, max_per_user=None, only_items=None):
+    """Count how many users saved each (a, b) restaurant pair.
+
+    `users`/`items` are parallel arrays with items already mapped to dense
+    indexes 0..n_items-1.  When `only_items` (a boolean mask over item indexes)
+    is given, only pairs whose left side is in the mask are produced.
+
+    Returns (a, b, counts, item_counts).
+    """
+    order = np.lexsort((items, users))
+    users, items = users[order], items[order]
+
+    # one save per (user, restaurant), even if feedback also counted it
+    keep = np.ones(len(users), dtype=bool)
+    keep[1:] = (users[1:] != users[:-1]) | (items[1:] != items[:-1])
+    users, items = users[keep], items[keep]
+
+    _, starts, sizes = np.unique(users, return_index=True, return_counts=True)
+    if max_per_user and len(sizes) and sizes.max() > max_per_user:
+        position = np.arange(len(users)) - np.repeat(starts, sizes)
+        keep = position < max_per_user
+        users, items = users[keep], items[keep]
+        _, starts, sizes = np.unique(users, return_index=True, return_counts=True)
+
+    item_counts = np.bincount(items, minlength=n_items)
+
+    # every row is paired with every row of the same user
+    row_group_size = np.repeat(sizes, sizes)
+    row_group_start = np.repeat(starts, sizes)
+    left_rows = np.arange(len(users))
+    if only_items is not None:
+        mask = only_items[items]
+        left_rows = left_rows[mask]
+        row_group_size = row_group_size[mask]
+        row_group_start = row_group_start[mask]
+
+    left = np.repeat(left_rows, row_group_size)
+    offsets = np.arange(len(left)) - np.repeat(np.cumsum(row_group_size) - row_group_size, row_group_size)
+    right = np.repeat(row_group_start, row_group_size) + offsets
+    distinct = left != right
+    a, b = items[left[distinct]], items[right[distinct]]
+
+    keys, counts = np.unique(a * n_items + b, return_counts=True)
+    return keys // n_items, keys % n_items, counts, item_counts
+
+
+def top_neighbours(a, b, counts, item_counts, top_n):
+    """Cosine-score every pair and keep the best `top_n` per left restaurant.
+
+    Returns (a, b, score, counts, rank) sorted by (a, rank).
+    """
+    score = counts / np.sqrt(item_counts[a].astype(np.float64) * item_counts[b])
+    order = np.lexsort((b, -score, a))
+    a, b, score, counts = a[order], b[order], score[order], counts[order]
+
+    _, starts, sizes = np.unique(a, return_index=True, return_counts=True)
+    rank = np.arange(len(a)) - np.repeat(starts, sizes)
+    keep = rank < top_n
+    return a[keep], b[keep], score[keep], counts[keep], rank[keep]
+
+
+# ---------------------------
+# Build / refresh
+# ---------------------------
+def _build(restaurant_ids=None):
+    top_n = app.config["RECOMMENDATION_TOP_N"]
+    users, items = load_interactions(app.config["RECOMMENDATION_MIN_RATING"])
+
+    # restaurants deleted since they were saved must not show up as neighbours
+    existing = np.array(db.session.execute(select(Restaurant.id)).scalars().all(), dtype=np.int64)
+    known = np.isin(items, existing)
+    users, items = users[known], items[known]
+
+    ids, dense = np.unique(items, return_inverse=True)
+    only = None
+    if restaurant_ids is not None:
+        only = np.isin(ids, np.fromiter(restaurant_ids, dtype=np.int64))
+
+    a, b, counts, item_counts = co_occurrence(
+        users, dense.astype(np.int64), len(ids),
+        max_per_user=app.config["RECOMMENDATION_MAX_SAVES_PER_USER"],
+        only_items=only,
+    )
+    a, b, score, counts, rank = top_neighbours(a, b, counts, item_counts, top_n)
+
+    now = datetime.utcnow()
+    rows = [
+        {"restaurant_id": ra, "neighbour_id": rb, "score": s, "co_saves": c, "rank": r, "built_at": now}
+        for ra, rb, s, c, r in zip(ids[a].tolist(), ids[b].tolist(), score.tolist(), counts.tolist(), rank.tolist())
+    ]
+
+    stale = delete(RestaurantNeighbour)
+    if restaurant_ids is not None:
+        stale = stale.where(RestaurantNeighbour.restaurant_id.in_(list(restaurant_ids)))
+    db.session.execute(stale)
+    if rows:
+        db.session.execute(insert(RestaurantNeighbour), rows)
+    return len(rows)
+
+
+def rebuild_neighbours():
+    """Recompute the whole neighbour table in one transaction."""
+    try:
+        snapshot = _dirty_snapshot()
+        written = _build()
+        _clear_dirty(snapshot)
+        db.session.commit()
+        return written
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def refresh_neighbours():
+    """Recompute neighbour rows only for restaurants marked dirty.
+
+    Other restaurants keep their (slightly older) lists until the next full
+    rebuild; their scores against a changed restaurant drift very little.
+    """
+    try:
+        snapshot = _dirty_snapshot()
+        dirty = db.session.execute(
+            select(RecommendationDirty.restaurant_id).where(RecommendationDirty.marked_at <= snapshot)
+        ).scalars().all()
+        if not dirty:
+            return 0
+        written = _build(set(dirty))
+        _clear_dirty(snapshot)
+        db.session.commit()
+        return written
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def _dirty_snapshot():
+    # marks stamped after this are kept for the next refresh
+    return datetime.utcnow()
+
+
+def _clear_dirty(snapshot):
+    db.session.execute(delete(RecommendationDirty).where(
+        or_(RecommendationDirty.marked_at <= snapshot, RecommendationDirty.marked_at.is_(None))
+    ))
+
+
+def mark_dirty(restaurant_id):
+    """Queue a restaurant for the next incremental refresh (caller commits).
+
+    An upsert, so concurrent saves and ratings of one restaurant don't
+    collide on the primary key; re-marking moves marked_at forward, so a
+    refresh already running keeps the mark for the next one.
+    """
+    dialect = {"sqlite": sqlite, "postgresql": postgresql}.get(db.engine.dialect.name)
+    if dialect is None:
+        mark = db.session.get(RecommendationDirty, restaurant_id)
+        if mark is None:
+            db.session.add(RecommendationDirty(restaurant_id=restaurant_id))
+        else:
+            mark.marked_at = datetime.utcnow()
+        return
+    statement = dialect.insert(RecommendationDirty).values(restaurant_id=restaurant_id, marked_at=datetime.utcnow())
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[RecommendationDirty.restaurant_id],
+        set_={"marked_at": statement.excluded.marked_at},
+    ))
+
+
+def forget_restaurant(restaurant_id):
+    """Drop a restaurant's neighbour rows before it is deleted, both its own
+    list and its place in others' (caller commits).  Restaurants that listed
+    it are marked dirty so the next refresh fills the gap."""
+    listed_by = db.session.execute(
+        select(RestaurantNeighbour.restaurant_id).where(RestaurantNeighbour.neighbour_id == restaurant_id).distinct()
+    ).scalars().all()
+    db.session.execute(delete(RestaurantNeighbour).where(or_(
+        RestaurantNeighbour.restaurant_id == restaurant_id, RestaurantNeighbour.neighbour_id == restaurant_id
+    )))
+    db.session.execute(delete(RecommendationDirty).where(RecommendationDirty.restaurant_id == restaurant_id))
+    for other in listed_by:
+        if other != restaurant_id:
+            mark_dirty(other)
+
+
+# ---------------------------
+# Serving
+# ---------------------------
+def also_saved(restaurant_id, limit=10):
+    rows = db.session.execute(
+        select(
+            Restaurant.id, Restaurant.name, Restaurant.location, Restaurant.cuisine,
+            RestaurantNeighbour.score, RestaurantNeighbour.co_saves
+        )
+        .join(RestaurantNeighbour, RestaurantNeighbour.neighbour_id == Restaurant.id)
+        .where(RestaurantNeighbour.restaurant_id == restaurant_id)
+        .order_by(RestaurantNeighbour.rank)
+        .limit(limit)
+    ).all()
+    return [
+        {
+            "id": r.id,
+            "name": r.name,
+            "location": r.location,
+            "cuisine": r.cuisine,
+            "score": round(r.score, 4),
+            "co_saves": r.co_saves,
+        }
+        for r in rows
+    ]
+
+
+# ---------------------------
+# CLI:  flask recommendations rebuild|refresh
+# ---------------------------
+recommendations_cli = AppGroup("recommendations", help="Build 'people also saved' neighbour lists.")
+
+
+@recommendations_cli.command("rebuild")
+def rebuild_command():
+    started = time.perf_counter()
+    written = rebuild_neighbours()
+    click.echo(f"Wrote {written} neighbour rows in {time.perf_counter() - started:.2f}s")
+
+
+@recommendations_cli.command("refresh")
+def refresh_command():
+    started = time.perf_counter()
+    written = refresh_neighbours()
+    click.echo(f"Refreshed {written} neighbour rows in {time.perf_counter() - started:.2f}s")
+
+
+app.cli.add_command(recommendations_cli)
@@ -0,0 +1,304 @@
+# application/recommendation/similar.py
+#
+# Content based "similar restaurants".
+#
+# Every restaurant is turned into one document (cuisine, menu text, menu item
+# names/descriptions and review comments), vectorized with TF-IDF over a
+# vocabulary built locally from those same documents, and stored as an
+# L2-normalised float32 matrix under the instance folder.  Workers open the
+# matrix with np.load(mmap_mode="r"), so the pages are shared through the OS
+# page cache instead of being copied into every process, and a top-k cosine
+# query is one matrix-vector product.
+import hashlib
+import json
+import math
+import os
+import re
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+import click
+import numpy as np
+from flask.cli import AppGroup
+from sqlalchemy import select
+
+from application.settings.setup import app
+from application.database.user.user_db import db, Restaurant, MenuItem, Feedback
+
+app.config.setdefault("SIMILAR_INDEX_DIR", os.path.join(app.instance_path, "similar_index"))
+app.config.setdefault("SIMILAR_MAX_FEATURES", 1024)
+app.config.setdefault("SIMILAR_MIN_DF", 2)
+
+TOKEN_RE = re.compile(r"[a-z][a-z']+")
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have i in is it its of on or our so
+that the their there they this to was we were with you your very really just
+not no too also all can had more much out will would been than then them
+""".split())
+# cuisine is short but the strongest signal, so it counts several times
+CUISINE_WEIGHT = 3
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+# ---------------------------
+# Documents
+# ---------------------------
+def load_documents(restaurant_ids=None):
+    """Return {restaurant_id: [tokens]} for the given (or all) restaurants."""
+    texts = defaultdict(list)
+
+    def scoped(stmt, column):
+        return stmt if restaurant_ids is None else stmt.where(column.in_(list(restaurant_ids)))
+
+    for rid, cuisine, menu in db.session.execute(
+        scoped(select(Restaurant.id, Restaurant.cuisine, Restaurant.menu), Restaurant.id)
+    ):
+        texts[rid].extend([cuisine or ""] * CUISINE_WEIGHT)
+        texts[rid].append(menu or "")
+    for rid, name, description in db.session.execute(
+        scoped(select(MenuItem.restaurant_id, MenuItem.name, MenuItem.description), MenuItem.restaurant_id)
+    ):
+        if rid in texts:
+            texts[rid].extend((name or "", description or ""))
+    for rid, comment in db.session.execute(
+        scoped(select(Feedback.restaurant_id, Feedback.comment).where(Feedback.comment.isnot(None)),
+               Feedback.restaurant_id)
+    ):
+        if rid in texts:
+            texts[rid].append(comment)
+
+    return {rid: tokenize(" ".join(parts)) for rid, parts in texts.items()}
+
+
+def _digest(tokens):
+    return hashlib.blake2b(" ".join(tokens).encode(), digest_size=8).hexdigest()
+
+
+# ---------------------------
+# Vectorizing
+# ---------------------------
+def build_vocabulary(docs, max_features, min_df):
+    df = Counter()
+    for tokens in docs.values():
+        df.update(set(tokens))
+    n = len(docs)
+    terms = [t for t, c in df.most_common() if c >= min_df][:max_features]
+    terms.sort()
+    idf = np.array([math.log((1 + n) / (1 + df[t])) + 1.0 for t in terms], dtype=np.float32)
+    return {t: i for i, t in enumerate(terms)}, idf
+
+
+def vectorize(tokens, vocabulary, idf):
+    row = np.zeros(len(vocabulary), dtype=np.float32)
+    counts = Counter(t for t in tokens if t in vocabulary)
+    if counts:
+        cols = np.fromiter((vocabulary[t] for t in counts), dtype=np.int64, count=len(counts))
+        tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        row[cols] = (1.0 + np.log(tf)) * idf[cols]
+        norm = np.linalg.norm(row)
+        if norm:
+            row /= norm
+    return row
+
+
+# ---------------------------
+# On-disk index
+# ---------------------------
+def _paths(directory):
+    return (os.path.join(directory, "vectors.npy"),
+            os.path.join(directory, "ids.npy"),
+            os.path.join(directory, "meta.json"))
+
+
+def _atomic_save(path, writer):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        writer(tmp)
+        os.replace(tmp, path)
+    except Exception:
+        os.unlink(tmp)
+        raise
+
+
+def _array_writer(array):
+    def write(tmp):
+        with open(tmp, "wb") as fh:
+            np.save(fh, array)
+    return write
+
+
+def _json_writer(payload):
+    def write(tmp):
+        with open(tmp, "w") as fh:
+            json.dump(payload, fh)
+    return write
+
+
+def _write_index(directory, ids, matrix, vocabulary, idf, digests):
+    os.makedirs(directory, exist_ok=True)
+    vectors_path, ids_path, meta_path = _paths(directory)
+    _atomic_save(ids_path, _array_writer(np.asarray(ids, dtype=np.int64)))
+    _atomic_save(meta_path, _json_writer({"vocabulary": vocabulary, "idf": idf.tolist(), "digests": digests}))
+    # vectors last: readers reload when this file changes
+    _atomic_save(vectors_path, _array_writer(matrix))
+
+
+def rebuild_index():
+    """Build the vocabulary and every vector from scratch."""
+    docs = load_documents()
+    vocabulary, idf = build_vocabulary(docs, app.config["SIMILAR_MAX_FEATURES"], app.config["SIMILAR_MIN_DF"])
+    ids = sorted(docs)
+    matrix = np.zeros((len(ids), len(vocabulary)), dtype=np.float32)
+    for i, rid in enumerate(ids):
+        matrix[i] = vectorize(docs[rid], vocabulary, idf)
+    _write_index(app.config["SIMILAR_INDEX_DIR"], ids, matrix, vocabulary, idf,
+                 {str(rid): _digest(docs[rid]) for rid in ids})
+    return len(ids)
+
+
+def refresh_index(restaurant_ids=None):
+    """Re-vectorize only restaurants whose content changed.
+
+    The vocabulary and IDF weights stay fixed between full rebuilds, so new
+    words are ignored until the next `flask similar rebuild`.  Rows of existing
+    restaurants are rewritten in place; added or deleted restaurants trigger a
+    rewrite of the (small) id list and matrix.
+    """
+    directory = app.config["SIMILAR_INDEX_DIR"]
+    vectors_path, ids_path, meta_path = _paths(directory)
+    if not os.path.exists(vectors_path):
+        return rebuild_index()
+
+    with open(meta_path) as fh:
+        meta = json.load(fh)
+    vocabulary, idf, digests = meta["vocabulary"], np.asarray(meta["idf"], dtype=np.float32), meta["digests"]
+    ids = np.load(ids_path).tolist()
+    position = {rid: i for i, rid in enumerate(ids)}
+
+    docs = load_documents(restaurant_ids)
+    changed = {rid: tokens for rid, tokens in docs.items() if digests.get(str(rid)) != _digest(tokens)}
+    if restaurant_ids is None:
+        removed = set(ids) - set(docs)
+    else:
+        removed = set(rid for rid in restaurant_ids if rid in position and rid not in docs)
+    added = [rid for rid in changed if rid not in position]
+
+    if not added and not removed:
+        if changed:
+            matrix = np.load(vectors_path, mmap_mode="r+")
+            for rid, tokens in changed.items():
+                matrix[position[rid]] = vectorize(tokens, vocabulary, idf)
+                digests[str(rid)] = _digest(tokens)
+            matrix.flush()
+            del matrix
+            _atomic_save(meta_path, _json_writer(dict(meta, digests=digests)))
+        return len(changed)
+
+    old = np.load(vectors_path)
+    keep = [rid for rid in ids if rid not in removed]
+    new_ids = sorted(keep + added)
+    matrix = np.zeros((len(new_ids), len(vocabulary)), dtype=np.float32)
+    for i, rid in enumerate(new_ids):
+        if rid in changed:
+            matrix[i] = vectorize(changed[rid], vocabulary, idf)
+            digests[str(rid)] = _digest(changed[rid])
+        else:
+            matrix[i] = old[position[rid]]
+    for rid in removed:
+        digests.pop(str(rid), None)
+    _write_index(directory, new_ids, matrix, vocabulary, idf, digests)
+    return len(changed) + len(removed)
+
+
+class SimilarIndex:
+    """Per-process view of the memory-mapped index, reopened when rebuilt."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._stamp = None
+        self.ids = None
+        self.vectors = None
+        self.position = {}
+
+    def load(self):
+        vectors_path, ids_path, _ = _paths(self.directory)
+        try:
+            stat = os.stat(vectors_path)
+        except FileNotFoundError:
+            self._stamp, self.vectors, self.ids, self.position = None, None, None, {}
+            return
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if stamp != self._stamp:
+            self.vectors = np.load(vectors_path, mmap_mode="r")
+            self.ids = np.load(ids_path)
+            self.position = {rid: i for i, rid in enumerate(self.ids.tolist())}
+            self._stamp = stamp
+
+    def query(self, restaurant_id, k=10):
+        """Return [(restaurant_id, score)] of the k most similar restaurants."""
+        self.load()
+        row = self.position.get(restaurant_id)
+        if row is None:
+            return []
+        scores = self.vectors @ self.vectors[row]
+        scores[row] = -1.0
+        k = min(k, len(scores) - 1)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.ids[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+
+similar_index = SimilarIndex(app.config["SIMILAR_INDEX_DIR"])
+
+
+def similar_restaurants(restaurant_id, limit=10):
+    matches = similar_index.query(restaurant_id, limit)
+    if not matches:
+        return []
+    rows = {
+        r.id: r for r in db.session.execute(
+            select(Restaurant.id, Restaurant.name, Restaurant.location, Restaurant.cuisine)
+            .where(Restaurant.id.in_([rid for rid, _ in matches]))
+        )
+    }
+    return [
+        {
+            "id": rid,
+            "name": rows[rid].name,
+            "location": rows[rid].location,
+            "cuisine": rows[rid].cuisine,
+            "score": round(score, 4),
+        }
+        for rid, score in matches if rid in rows
+    ]
+
+
+# ---------------------------
+# CLI:  flask similar rebuild|refresh
+# ---------------------------
+similar_cli = AppGroup("similar", help="Maintain the TF-IDF similar-restaurants index.")
+
+
+@similar_cli.command("rebuild")
+def rebuild_command():
+    started = time.perf_counter()
+    count = rebuild_index()
+    click.echo(f"Indexed {count} restaurants in {time.perf_counter() - started:.2f}s")
+
+
+@similar_cli.command("refresh")
+@click.option("--id", "restaurant_ids", type=int, multiple=True, help="Only re-vectorize these restaurants.")
+def refresh_command(restaurant_ids):
+    started = time.perf_counter()
+    count = refresh_index(set(restaurant_ids) or None)
+    click.echo(f"Re-vectorized {count} restaurants in {time.perf_counter() - started:.2f}s")
+
+
+app.cli.add_command(similar_cli)
@@ -0,0 +1,264 @@
+# application/restaurant/archive.py
+#
+# Time-partitioned cold storage for feedback.
+#
+# `flask feedback archive` moves reviews older than FEEDBACK_ARCHIVE_DAYS from
+# feedback into feedback_archive in small batches (one short transaction each,
+# with a pause in between so writers are never blocked for long).  Every moved
+# batch is also summed into feedback_daily_rollup, so analytics over old
+# periods read one row per restaurant per day instead of the raw reviews.
+#
+# Readers only look at cold data when their time range reaches past the
+# newest archive cutoff (archive_boundary()).
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import case, delete, exists, extract, func, insert, select
+
+from application.settings.setup import app
+from application.database.user.user_db import (
+    db, Feedback, FeedbackArchive, FeedbackDailyRollup, FeedbackArchiveRun, FeedbackLike,
+    Reply, Media, ModerationLog, feedback_tags, bump_restaurant_versions
+)
+
+app.config.setdefault("FEEDBACK_ARCHIVE_DAYS", 365)
+app.config.setdefault("FEEDBACK_ARCHIVE_BATCH", 500)
+app.config.setdefault("FEEDBACK_ARCHIVE_PAUSE", 0.05)
+
+ARCHIVED_COLUMNS = [c.name for c in FeedbackArchive.__table__.columns if c.name != "archived_at"]
+ROLLUP_SUMS = [c.name for c in FeedbackDailyRollup.__table__.columns if c.name not in ("restaurant_id", "day")]
+
+_boundary = {"value": None, "checked": 0.0}
+
+
+def archive_boundary(max_age=60):
+    """Cutoff of the newest archive run (None if nothing was ever archived).
+
+    Cached per process for `max_age` seconds; the archive only ever moves
+    forward, so a slightly stale value just means an unnecessary cold read.
+    """
+    now = time.monotonic()
+    if now - _boundary["checked"] > max_age:
+        _boundary["value"] = db.session.execute(select(func.max(FeedbackArchiveRun.cutoff))).scalar()
+        _boundary["checked"] = now
+    return _boundary["value"]
+
+
+def needs_cold(start_date):
+    boundary = archive_boundary()
+    return boundary is not None and (start_date is None or start_date < boundary)
+
+
+# ---------------------------
+# Archiving
+# ---------------------------
+def _rollup(rows):
+    sums = defaultdict(lambda: dict.fromkeys(ROLLUP_SUMS, 0))
+    for row in rows:
+        bucket = sums[(row["restaurant_id"], row["timestamp"].date())]
+        bucket["reviews"] += 1
+        bucket["food_sum"] += row["rating_food"] or 0
+        bucket["service_sum"] += row["rating_service"] or 0
+        bucket["cleanliness_sum"] += row["rating_cleanliness"] or 0
+        if row["rating_value"] is not None:
+            bucket["value_sum"] += row["rating_value"]
+            bucket["value_count"] += 1
+        if row["rating_overall"] is not None:
+            bucket["overall_sum"] += row["rating_overall"]
+            bucket["overall_count"] += 1
+        if row["recommend"] is not None:
+            bucket["recommend_count"] += 1
+            bucket["recommend_yes"] += bool(row["recommend"])
+        if row["rating_service"] in (1, 2, 3, 4, 5):
+            bucket[f"service_{row['rating_service']}"] += 1
+
+    existing = {
+        (r.restaurant_id, r.day): r
+        for r in FeedbackDailyRollup.query.filter(
+            FeedbackDailyRollup.restaurant_id.in_({k[0] for k in sums}),
+            FeedbackDailyRollup.day.in_({k[1] for k in sums}),
+        )
+    }
+    for (restaurant_id, day), bucket in sums.items():
+        rollup = existing.get((restaurant_id, day))
+        if rollup is None:
+            db.session.add(FeedbackDailyRollup(restaurant_id=restaurant_id, day=day, **bucket))
+        else:
+            for name, value in bucket.items():
+                setattr(rollup, name, getattr(rollup, name) + value)
+
+
+def archive_feedback(horizon_days=None, batch_size=None, pause=None, limit=None):
+    """Move reviews older than the horizon into cold storage.
+
+    Reviews that still have replies, media, tags or moderation entries stay
+    hot; like rows are dropped (the count is kept in the archived row).
+    """
+    horizon_days = horizon_days or app.config["FEEDBACK_ARCHIVE_DAYS"]
+    batch_size = batch_size or app.config["FEEDBACK_ARCHIVE_BATCH"]
+    pause = app.config["FEEDBACK_ARCHIVE_PAUSE"] if pause is None else pause
+    cutoff = datetime.utcnow() - timedelta(days=horizon_days)
+
+    run = FeedbackArchiveRun(cutoff=cutoff, archived=0)
+    db.session.add(run)
+    db.session.commit()
+
+    pinned = [
+        exists().where(Reply.feedback_id == Feedback.id),
+        exists().where(Media.feedback_id == Feedback.id),
+        exists().where(ModerationLog.feedback_id == Feedback.id),
+        exists().where(feedback_tags.c.feedback_id == Feedback.id),
+    ]
+    columns = [getattr(Feedback, name) for name in ARCHIVED_COLUMNS]
+    last_id = 0
+    while limit is None or run.archived < limit:
+        try:
+            rows = db.session.execute(
+                select(*columns)
+                .where(Feedback.id > last_id, Feedback.timestamp < cutoff, *[~p for p in pinned])
+                .order_by(Feedback.id)
+                .limit(batch_size)
+            ).mappings().all()
+            if not rows:
+                break
+            ids = [row["id"] for row in rows]
+            now = datetime.utcnow()
+            db.session.execute(insert(FeedbackArchive), [dict(row, archived_at=now) for row in rows])
+            _rollup(rows)
+            db.session.execute(delete(FeedbackLike).where(FeedbackLike.feedback_id.in_(ids)))
+            db.session.execute(delete(Feedback).where(Feedback.id.in_(ids)))
+            # Core delete skips the ORM listeners; the payload changed
+            bump_restaurant_versions(db.session.connection(), {row["restaurant_id"] for row in rows})
+            run.archived += len(rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        last_id = ids[-1]
+        if pause:
+            time.sleep(pause)
+
+    run.finished_at = datetime.utcnow()
+    db.session.commit()
+    _boundary["checked"] = 0.0
+    return run.archived
+
+
+def delete_archived(restaurant_id=None, user_id=None):
+    """Cascade for restaurant/user deletes (caller commits)."""
+    if restaurant_id is not None:
+        db.session.execute(delete(FeedbackArchive).where(FeedbackArchive.restaurant_id == restaurant_id))
+        db.session.execute(delete(FeedbackDailyRollup).where(FeedbackDailyRollup.restaurant_id == restaurant_id))
+    if user_id is not None:
+        # the user's old reviews stay counted in the rollups
+        db.session.execute(delete(FeedbackArchive).where(FeedbackArchive.user_id == user_id))
+
+
+# ---------------------------
+# Reading hot + cold
+# ---------------------------
+def daily_feedback_stats(restaurant_id, start_date):
+    """{'YYYY-MM-DD': {reviews, food_sum, ..., service_5}} for the window.
+
+    Hot reviews are aggregated in SQL; archived days come from the rollups
+    and are only read when the window reaches past the archive cutoff (cold
+    days are whole days, so the first day of such a window is not split by
+    time of day).
+    """
+    hot = db.session.query(
+        func.date(Feedback.timestamp).label("day"),
+        func.count(Feedback.id).label("reviews"),
+        func.sum(Feedback.rating_food).label("food_sum"),
+        func.sum(Feedback.rating_service).label("service_sum"),
+        func.sum(Feedback.rating_cleanliness).label("cleanliness_sum"),
+        func.sum(Feedback.rating_value).label("value_sum"),
+        func.count(Feedback.rating_value).label("value_count"),
+        func.sum(Feedback.rating_overall).label("overall_sum"),
+        func.count(Feedback.rating_overall).label("overall_count"),
+        func.sum(case((Feedback.recommend == True, 1), else_=0)).label("recommend_yes"),  # noqa: E712
+        func.count(Feedback.recommend).label("recommend_count"),
+        *[
+            func.sum(case((Feedback.rating_service == k, 1), else_=0)).label(f"service_{k}")
+            for k in range(1, 6)
+        ],
+    ).filter(
+        Feedback.restaurant_id == restaurant_id,
+        Feedback.timestamp >= start_date
+    ).group_by(func.date(Feedback.timestamp)).all()
+
+    days = defaultdict(lambda: dict.fromkeys(ROLLUP_SUMS, 0))
+    for row in hot:
+        bucket = days[str(row.day)]
+        for name in ROLLUP_SUMS:
+            bucket[name] += getattr(row, name) or 0
+
+    if needs_cold(start_date):
+        for rollup in FeedbackDailyRollup.query.filter(
+            FeedbackDailyRollup.restaurant_id == restaurant_id,
+            FeedbackDailyRollup.day >= start_date.date()
+        ):
+            bucket = days[rollup.day.isoformat()]
+            for name in ROLLUP_SUMS:
+                bucket[name] += getattr(rollup, name)
+    return days
+
+
+def monthly_feedback_stats(restaurant_ids):
+    """{month: (review_count, food_sum, service_sum, cleanliness_sum)} over
+    all time, hot and archived."""
+    months = defaultdict(lambda: [0, 0, 0, 0])
+    hot = db.session.query(
+        extract('month', Feedback.timestamp).label('month'),
+        func.count(Feedback.id),
+        func.sum(Feedback.rating_food),
+        func.sum(Feedback.rating_service),
+        func.sum(Feedback.rating_cleanliness),
+    ).filter(Feedback.restaurant_id.in_(restaurant_ids)).group_by(extract('month', Feedback.timestamp)).all()
+    cold = []
+    if needs_cold(None):
+        cold = db.session.query(
+            extract('month', FeedbackDailyRollup.day),
+            func.sum(FeedbackDailyRollup.reviews),
+            func.sum(FeedbackDailyRollup.food_sum),
+            func.sum(FeedbackDailyRollup.service_sum),
+            func.sum(FeedbackDailyRollup.cleanliness_sum),
+        ).filter(FeedbackDailyRollup.restaurant_id.in_(restaurant_ids)).group_by(
+            extract('month', FeedbackDailyRollup.day)
+        ).all()
+    for month, *values in list(hot) + list(cold):
+        if month is None:
+            continue
+        bucket = months[int(month)]
+        for i, value in enumerate(values):
+            bucket[i] += value or 0
+    return months
+
+
+def archived_feedback(restaurant_ids, since=None):
+    query = FeedbackArchive.query.filter(FeedbackArchive.restaurant_id.in_(restaurant_ids))
+    if since is not None:
+        query = query.filter(FeedbackArchive.timestamp >= since)
+    return query.order_by(FeedbackArchive.timestamp.desc()).all()
+
+
+# ---------------------------
+# CLI:  flask feedback archive
+# ---------------------------
+feedback_cli = AppGroup("feedback", help="Feedback storage maintenance.")
+
+
+@feedback_cli.command("archive")
+@click.option("--days", type=int, default=None, help="Archive reviews older than this many days.")
+@click.option("--batch-size", type=int, default=None, help="Reviews moved per transaction.")
+@click.option("--pause", type=float, default=None, help="Seconds to sleep between batches.")
+@click.option("--limit", type=int, default=None, help="Stop after moving this many reviews.")
+def archive_command(days, batch_size, pause, limit):
+    started = time.perf_counter()
+    moved = archive_feedback(days, batch_size, pause, limit)
+    click.echo(f"Archived {moved} reviews in {time.perf_counter() - started:.2f}s")
+
+
+app.cli.add_command(feedback_cli)
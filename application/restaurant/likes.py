@@ -0,0 +1,240 @@
+# application/restaurant/likes.py
+#
+# Review likes.
+#
+# feedback_like holds one row per (review, user), so liking twice is rejected
+# by the primary key instead of a read-modify-write.  The denormalised
+# Feedback.likes counter is not touched per request: deltas are coalesced in
+# memory and a background thread flushes them every few seconds as one batched
+# "UPDATE feedback SET likes = likes + n".  `flask likes reconcile` recomputes
+# the counters from feedback_like if a worker ever dies with unflushed deltas.
+#
+# Reconcile runs in its own process while the web workers still hold deltas
+# for likes already in feedback_like; recounting those reviews would count
+# such likes twice once the deltas land.  So it leaves alone every review
+# liked or unliked (feedback_unlike) in the last LIKES_RECONCILE_QUIET
+# seconds, which must be well over the flush interval.
+import atexit
+import os
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, delete, func, insert, select, union
+from sqlalchemy.exc import IntegrityError
+
+from application.settings.setup import app
+from application.database.user.user_db import (
+    db, User, Restaurant, Feedback, FeedbackLike, FeedbackUnlike, bump_restaurant_versions
+)
+
+app.config.setdefault("LIKES_FLUSH_INTERVAL", 2.0)
+app.config.setdefault("LIKES_RECONCILE_QUIET", 60)   # seconds; reviews touched since are not recounted
+
+
+class LikeCoalescer:
+    def __init__(self, interval):
+        self.interval = interval
+        self._pending = defaultdict(int)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+
+    def _ensure_thread(self):
+        # started lazily so every forked worker gets its own flusher
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="likes-flusher", daemon=True).start()
+
+    def add(self, feedback_id, delta):
+        self._ensure_thread()
+        with self._lock:
+            self._pending[feedback_id] += delta
+
+    def pending(self, feedback_id):
+        with self._lock:
+            return self._pending.get(feedback_id, 0)
+
+    def flush(self):
+        with self._lock:
+            batch = [{"fid": fid, "delta": n} for fid, n in self._pending.items() if n]
+            self._pending.clear()
+        if not batch:
+            return 0
+        table = Feedback.__table__
+        stmt = (
+            table.update()
+            .where(table.c.id == bindparam("fid"))
+            .values(likes=func.coalesce(table.c.likes, 0) + bindparam("delta"))
+        )
+        with app.app_context():
+            try:
+                db.session.execute(stmt, batch)
+                # likes are part of the restaurant payload, so its ETag moves
+                restaurant_ids = db.session.execute(
+                    select(Feedback.restaurant_id).where(Feedback.id.in_([row["fid"] for row in batch])).distinct()
+                ).scalars().all()
+                bump_restaurant_versions(db.session.connection(), restaurant_ids)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                with self._lock:
+                    for row in batch:
+                        self._pending[row["fid"]] += row["delta"]
+                app.logger.warning("Flushing %d like counters failed: %s", len(batch), e)
+                return 0
+        return len(batch)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+
+like_counter = LikeCoalescer(app.config["LIKES_FLUSH_INTERVAL"])
+atexit.register(like_counter.flush)
+
+
+def like_feedback(feedback_id, user_id):
+    """Returns True if the like was new, False if the user already liked it."""
+    db.session.add(FeedbackLike(feedback_id=feedback_id, user_id=user_id))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    like_counter.add(feedback_id, 1)
+    return True
+
+
+def unlike_feedback(feedback_id, user_id):
+    result = db.session.execute(
+        delete(FeedbackLike).where(FeedbackLike.feedback_id == feedback_id, FeedbackLike.user_id == user_id)
+    )
+    if not result.rowcount:
+        db.session.commit()
+        return False
+    db.session.add(FeedbackUnlike(feedback_id=feedback_id))
+    db.session.commit()
+    like_counter.add(feedback_id, -1)
+    return True
+
+
+def current_likes(feedback_id):
+    stored = db.session.execute(select(Feedback.likes).where(Feedback.id == feedback_id)).scalar()
+    return (stored or 0) + like_counter.pending(feedback_id)
+
+
+def liked_by(user_id, feedback_ids):
+    """Subset of `feedback_ids` the user has liked, in one indexed query."""
+    if not feedback_ids:
+        return set()
+    return set(db.session.execute(
+        select(FeedbackLike.feedback_id)
+        .where(FeedbackLike.user_id == user_id, FeedbackLike.feedback_id.in_(list(feedback_ids)))
+    ).scalars())
+
+
+def reconcile_likes():
+    """Reset Feedback.likes from the feedback_like rows, except on reviews
+    liked or unliked too recently to be sure every worker has flushed.
+    Returns the number of counters corrected."""
+    like_counter.flush()
+    quiet_since = datetime.utcnow() - timedelta(seconds=app.config["LIKES_RECONCILE_QUIET"])
+    recent = union(
+        select(FeedbackLike.feedback_id).where(FeedbackLike.created_at >= quiet_since),
+        select(FeedbackUnlike.feedback_id).where(FeedbackUnlike.unliked_at >= quiet_since),
+    )
+    counts = (
+        select(func.count())
+        .where(FeedbackLike.feedback_id == Feedback.id)
+        .correlate(Feedback)
+        .scalar_subquery()
+    )
+    table = Feedback.__table__
+    # only counters that are actually wrong, so only their restaurants' ETags move
+    fixed = db.session.execute(
+        table.update()
+        .where(func.coalesce(table.c.likes, 0) != counts, table.c.id.not_in(recent))
+        .values(likes=counts)
+        .returning(table.c.restaurant_id)
+    ).scalars().all()
+    if fixed:
+        bump_restaurant_versions(db.session.connection(), set(fixed))
+    db.session.execute(delete(FeedbackUnlike).where(FeedbackUnlike.unliked_at < quiet_since))
+    db.session.commit()
+    return len(fixed)
+
+
+# ---------------------------
+# CLI:  flask likes reconcile | check
+# ---------------------------
+likes_cli = AppGroup("likes", help="Review like counters.")
+
+
+@likes_cli.command("reconcile")
+def reconcile_command():
+    click.echo(f"Corrected likes on {reconcile_likes()} reviews")
+
+
+@likes_cli.command("check")
+def check_command():
+    """Reconciles while another worker's coalescer holds deltas for likes
+    already committed, then checks nothing is counted twice.  Works on a
+    scratch review and removes it."""
+    tag = uuid.uuid4().hex[:8]
+    user_ids = [
+        db.session.execute(insert(User).values(
+            username=f"likes-check-{tag}-{i}", email=f"likes-check-{tag}-{i}@example.invalid", password="-",
+        ).returning(User.id)).scalar()
+        for i in range(3)
+    ]
+    restaurant_id = db.session.execute(
+        insert(Restaurant).values(name=f"likes-check-{tag}").returning(Restaurant.id)
+    ).scalar()
+    feedback_id = db.session.execute(
+        insert(Feedback).values(restaurant_id=restaurant_id, user_id=user_ids[0], likes=0).returning(Feedback.id)
+    ).scalar()
+    db.session.commit()
+    other_worker = LikeCoalescer(3600)
+    try:
+        for user_id in user_ids:
+            db.session.add(FeedbackLike(feedback_id=feedback_id, user_id=user_id))
+            db.session.commit()
+            other_worker.add(feedback_id, 1)
+        reconcile_likes()
+        other_worker.flush()
+        after_flush = db.session.execute(select(Feedback.likes).where(Feedback.id == feedback_id)).scalar()
+
+        # a worker that died with its deltas: fixed once the likes are old enough
+        db.session.execute(Feedback.__table__.update().where(Feedback.id == feedback_id).values(likes=0))
+        db.session.execute(
+            FeedbackLike.__table__.update().where(FeedbackLike.feedback_id == feedback_id)
+            .values(created_at=datetime.utcnow() - timedelta(seconds=2 * app.config["LIKES_RECONCILE_QUIET"]))
+        )
+        db.session.commit()
+        reconcile_likes()
+        after_loss = db.session.execute(select(Feedback.likes).where(Feedback.id == feedback_id)).scalar()
+    finally:
+        db.session.rollback()
+        db.session.execute(delete(FeedbackLike).where(FeedbackLike.feedback_id == feedback_id))
+        db.session.execute(delete(FeedbackUnlike).where(FeedbackUnlike.feedback_id == feedback_id))
+        db.session.execute(delete(Feedback).where(Feedback.id == feedback_id))
+        db.session.execute(delete(Restaurant).where(Restaurant.id == restaurant_id))
+        db.session.execute(delete(User).where(User.id.in_(user_ids)))
+        db.session.commit()
+    click.echo(f"likes after reconcile + pending flush: {after_flush} (expected 3); "
+               f"after a lost flush: {after_loss} (expected 3)")
+    if (after_flush, after_loss) != (3, 3):
+        raise SystemExit(1)
+
+
+app.cli.add_command(likes_cli)
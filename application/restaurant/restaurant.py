@@ -1,11 +1,24 @@
 from flask import Blueprint, jsonify, request
 from application.extensions.extensions import *
 from application.settings.setup import app
-from application.database.user.user_db import db, User, Restaurant,Feedback,Subscription,MenuItem,SavedPlace
+from application.database.user.user_db import db, User, Restaurant,Feedback,FeedbackArchive,Subscription,MenuItem,SavedPlace
 from datetime import datetime
 import flask_praetorian
 from datetime import datetime, timedelta
 from flask_marshmallow import Marshmallow
+import zlib
+from sqlalchemy import select
+from sqlalchemy.orm import load_only, selectinload, lazyload, raiseload
+from application.recommendation.recommendation import also_saved, mark_dirty, forget_restaurant
+from application.recommendation.similar import similar_restaurants
+from application.analytics.text_analytics import review_insights, forget_insights, correct_review
+from application.moderation.minhash import check_feedback
+from application.ratelimit.ratelimit import rate_limited
+from application.restaurant.serializers import compile_serializers, json_response, etag_matches, not_modified
+from application.restaurant.archive import (
+    ROLLUP_SUMS, daily_feedback_stats, monthly_feedback_stats, archived_feedback, delete_archived, needs_cold
+)
+from application.restaurant.likes import like_feedback, unlike_feedback, current_likes, liked_by
 
 restaurant = Blueprint("restaurant", __name__)
 
@@ -17,8 +30,7 @@ class RestaurantSchema(ma.Schema):
     class Meta:
         fields = (
             "id", "owner_id", "location", "contact", "cuisine", "name",
-            "image", "menu", "hours", "is_featured", "feedbacks", "status",
-            "waiter", "quantity", "onetime", "table"
+            "image", "menu", "hours", "is_featured", "feedbacks", "status"
         )
 class FeedbackSchema(ma.Schema):
     class Meta:
@@ -51,6 +63,88 @@ feedbacks_schema = FeedbackSchema(many=True)
 restaurant_schema = RestaurantSchema()
 restaurants_schema = RestaurantSchema(many=True)
 
+# same output as the schemas above, without marshmallow on the hot paths
+compiled_restaurant, compiled_feedback, compiled_menu_item = compile_serializers(
+    RestaurantSchema, FeedbackSchema, MenuItemSchema
+)
+
+# large columns/relationships only sent when asked for with ?include=
+RESTAURANT_INCLUDES = ("feedbacks", "image", "menu")
+RESTAURANT_FIELDS = tuple(f for f in RestaurantSchema.Meta.fields if f not in RESTAURANT_INCLUDES)
+
+
+def restaurant_selection():
+    """Parse ?fields= and ?include= for the restaurant read endpoints.
+
+    Returns (only, options): the field names to serialize (None = the full
+    legacy payload, used when neither parameter is given) and the loader
+    options that make the query fetch exactly those columns/relationships.
+    Raises ValueError on unknown names.
+    """
+    fields = [f.strip() for f in request.args.get("fields", "").split(",") if f.strip()]
+    include = [f.strip() for f in request.args.get("include", "").split(",") if f.strip()]
+    unknown = [f for f in fields if f not in RESTAURANT_FIELDS + RESTAURANT_INCLUDES]
+    unknown += [f for f in include if f not in RESTAURANT_INCLUDES]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+    feedbacks = selectinload(Restaurant.feedbacks).options(lazyload(Feedback.restaurant), lazyload(Feedback.user))
+    if not fields and not include:
+        return None, [feedbacks]
+
+    only = set(fields or RESTAURANT_FIELDS) | set(include) | {"id"}
+    columns = [getattr(Restaurant, f) for f in only if f != "feedbacks"]
+    options = [load_only(Restaurant.version, *columns)]
+    options.append(feedbacks if "feedbacks" in only else raiseload(Restaurant.feedbacks))
+    return only, options
+
+
+def restaurant_etag(id, version, only):
+    selection = ",".join(sorted(only)) if only is not None else "*"
+    return f"r{id}-{version}-{zlib.crc32(selection.encode()):08x}"
+
+
+def restaurant_response(id, only, options):
+    # answer If-None-Match from the version column alone, before loading or
+    # serializing the row; returns None when the restaurant does not exist
+    version = db.session.execute(select(Restaurant.version).where(Restaurant.id == id)).scalar()
+    if version is None:
+        return None
+    etag = restaurant_etag(id, version, only)
+    matched = etag_matches(etag)
+    if matched:
+        return not_modified(matched)
+
+    restaurant = Restaurant.query.options(*options).filter_by(id=id).first()
+    if restaurant is None:
+        return None
+    return json_response(compiled_restaurant.dump(restaurant, only),
+                         etag=restaurant_etag(id, restaurant.version, only))
+
+
+def menu_response(restaurant_id):
+    # the menu_version aggregate changes with every menu item write, so the
+    # collection ETag needs no scan of menu_item
+    version = db.session.execute(
+        select(Restaurant.menu_version).where(Restaurant.id == restaurant_id)
+    ).scalar() or 0
+    etag = f"m{restaurant_id}-{version}"
+    matched = etag_matches(etag)
+    if matched:
+        return not_modified(matched)
+    items = MenuItem.query.filter_by(restaurant_id=restaurant_id).all()
+    return json_response(compiled_menu_item.dump_many(items), etag=etag)
+
+
+def flag_duplicates(feedback):
+    # moderation must never fail the review that was just saved
+    try:
+        if check_feedback(feedback):
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.warning("Duplicate check failed for feedback %s: %s", feedback.id, e)
+
 
 
 @restaurant.route("/add_restaurant", methods=["POST"])
@@ -87,8 +181,11 @@ def add_restaurant():
 @restaurant.route("/restaurants", methods=["GET"])
 def get_all_restaurants():
     try:
-        all_restaurants = Restaurant.query.all()
-        return restaurants_schema.jsonify(all_restaurants), 200
+        only, options = restaurant_selection()
+        all_restaurants = Restaurant.query.options(*options).all()
+        return json_response(compiled_restaurant.dump_many(all_restaurants, only))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -98,9 +195,11 @@ def get_all_restaurants():
 @flask_praetorian.auth_required
 def mine_restaurants():
     try:
-        all_restaurants = Restaurant.query.filter_by(owner_id=flask_praetorian.current_user().id).all()
-        result = restaurants_schema.dump(all_restaurants)
-        return jsonify(result)
+        only, options = restaurant_selection()
+        all_restaurants = Restaurant.query.options(*options).filter_by(owner_id=flask_praetorian.current_user().id).all()
+        return json_response(compiled_restaurant.dump_many(all_restaurants, only))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -108,11 +207,14 @@ def mine_restaurants():
 @restaurant.route("/restaurants/<int:id>", methods=["GET"])
 def get_restaurant(id):
     try:
-        restaurant = Restaurant.query.get(id)
-        if not restaurant:
+        only, options = restaurant_selection()
+        response = restaurant_response(id, only, options)
+        if response is None:
             return jsonify({"error": "Restaurant not found"}), 404
 
-        return restaurant_schema.jsonify(restaurant)
+        return response
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -151,6 +253,9 @@ def delete_restaurant(id):
         if restaurant.owner_id != flask_praetorian.current_user().id:
             return jsonify({"error": "Unauthorized access"}), 403
 
+        delete_archived(restaurant_id=restaurant.id)
+        forget_restaurant(restaurant.id)
+        forget_insights(restaurant.id)
         db.session.delete(restaurant)
         db.session.commit()
         return jsonify({"message": "Restaurant deleted successfully"}), 200
@@ -160,19 +265,23 @@ def delete_restaurant(id):
 
 
 @restaurant.route("/restaurants/search", methods=["GET"])
+@rate_limited("search")
 def searchi_restaurants():
     try:
         query = request.args.get("query", "")
         cuisine = request.args.get("cuisine", "")
         location = request.args.get("location", "")
 
-        results = Restaurant.query.filter(
+        only, options = restaurant_selection()
+        results = Restaurant.query.options(*options).filter(
             Restaurant.name.ilike(f"%{query}%"),
             Restaurant.location.ilike(f"%{location}%"),
             Restaurant.cuisine.ilike(f"%{cuisine}%")
         ).all()
 
-        return restaurants_schema.jsonify(results), 200
+        return json_response(compiled_restaurant.dump_many(results, only))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
@@ -207,6 +316,8 @@ def my_restaurant_feedback():
         restaurant_ids = [r.id for r in restaurants]
 
         feedbacks = Feedback.query.filter(Feedback.restaurant_id.in_(restaurant_ids)).all()
+        if request.args.get("include_archived") == "true":
+            feedbacks += archived_feedback(restaurant_ids)
 
         class FeedbackSchema(ma.Schema):
             class Meta:
@@ -244,7 +355,9 @@ def add_feedback():
             timestamp=datetime.utcnow()
         )
         db.session.add(feedback)
+        mark_dirty(feedback.restaurant_id)   # well rated feedback counts as a save
         db.session.commit()
+        flag_duplicates(feedback)
         return feedback_schema.jsonify(feedback), 201
     except Exception as e:
         db.session.rollback()
@@ -261,7 +374,9 @@ def get_my_feedbacks():
             return jsonify([])
 
         feedbacks = Feedback.query.filter_by(restaurant_id=my_restaurant.id).order_by(Feedback.timestamp.desc()).all()
-        return feedbacks_schema.jsonify(feedbacks), 200
+        if request.args.get("include_archived") == "true":
+            feedbacks += archived_feedback([my_restaurant.id])
+        return json_response(compiled_feedback.dump_many(feedbacks))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -279,12 +394,15 @@ def update_feedback(feedback_id):
             return jsonify({"error": "Not authorized"}), 403
 
         data = request.get_json()
+        old_comment = feedback.comment
         feedback.rating_food = data.get("rating_food", feedback.rating_food)
         feedback.rating_service = data.get("rating_service", feedback.rating_service)
         feedback.rating_cleanliness = data.get("rating_cleanliness", feedback.rating_cleanliness)
         feedback.comment = data.get("comment", feedback.comment)
         feedback.anonymous = data.get("anonymous", feedback.anonymous)
 
+        mark_dirty(feedback.restaurant_id)
+        correct_review(feedback.id, feedback.restaurant_id, feedback.timestamp, old_comment, feedback.comment)
         db.session.commit()
         return feedback_schema.jsonify(feedback), 200
     except Exception as e:
@@ -304,6 +422,8 @@ def delete_feedback(feedback_id):
         if feedback.user_id != user.id:
             return jsonify({"error": "Not authorized"}), 403
 
+        mark_dirty(feedback.restaurant_id)
+        correct_review(feedback.id, feedback.restaurant_id, feedback.timestamp, feedback.comment, None)
         db.session.delete(feedback)
         db.session.commit()
         return jsonify({"message": "Feedback deleted"}), 200
@@ -312,6 +432,43 @@ def delete_feedback(feedback_id):
         return jsonify({"error": str(e)}), 500
     
 
+@restaurant.route("/feedback/<int:feedback_id>/like", methods=["POST"])
+@flask_praetorian.auth_required
+def like_review(feedback_id):
+    try:
+        if db.session.get(Feedback, feedback_id) is None:
+            return jsonify({"error": "Feedback not found"}), 404
+
+        created = like_feedback(feedback_id, flask_praetorian.current_user().id)
+        return jsonify({"liked": True, "likes": current_likes(feedback_id)}), 201 if created else 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+@restaurant.route("/feedback/<int:feedback_id>/like", methods=["DELETE"])
+@flask_praetorian.auth_required
+def unlike_review(feedback_id):
+    try:
+        if not unlike_feedback(feedback_id, flask_praetorian.current_user().id):
+            return jsonify({"error": "Like not found"}), 404
+        return jsonify({"liked": False, "likes": current_likes(feedback_id)}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+# ids of the given reviews (?ids=1,2,3) the current user has liked
+@restaurant.route("/feedback/liked", methods=["GET"])
+@flask_praetorian.auth_required
+def liked_reviews():
+    try:
+        ids = [int(i) for i in request.args.get("ids", "").split(",") if i.strip().isdigit()][:500]
+        return jsonify({"liked": sorted(liked_by(flask_praetorian.current_user().id, ids))}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 from sqlalchemy import extract, func
 
 @restaurant.route("/monthly_review_stats", methods=["GET"])
@@ -322,29 +479,18 @@ def monthly_review_stats():
         restaurants = Restaurant.query.filter_by(owner_id=user.id).all()
         restaurant_ids = [r.id for r in restaurants]
 
-        # Group feedbacks by month and count or average ratings
-        stats = (
-            db.session.query(
-                extract('month', Feedback.timestamp).label('month'),
-                func.count(Feedback.id).label('review_count'),
-                func.avg(Feedback.rating_food).label('avg_food'),
-                func.avg(Feedback.rating_service).label('avg_service'),
-                func.avg(Feedback.rating_cleanliness).label('avg_cleanliness')
-            )
-            .filter(Feedback.restaurant_id.in_(restaurant_ids))
-            .group_by(extract('month', Feedback.timestamp))
-            .all()
-        )
+        # Group feedbacks (hot and archived) by month and count or average ratings
+        stats = monthly_feedback_stats(restaurant_ids)
 
         result = [
             {
-                "month": int(month),
+                "month": month,
                 "review_count": review_count,
-                "avg_food": float(avg_food or 0),
-                "avg_service": float(avg_service or 0),
-                "avg_cleanliness": float(avg_cleanliness or 0),
+                "avg_food": float(food_sum / review_count) if review_count else 0.0,
+                "avg_service": float(service_sum / review_count) if review_count else 0.0,
+                "avg_cleanliness": float(cleanliness_sum / review_count) if review_count else 0.0,
             }
-            for month, review_count, avg_food, avg_service, avg_cleanliness in stats
+            for month, (review_count, food_sum, service_sum, cleanliness_sum) in sorted(stats.items())
         ]
         return jsonify(result), 200
     except Exception as e:
@@ -355,8 +501,7 @@ def monthly_review_stats():
 @restaurant.route("/restaurant/<int:restaurant_id>/menu", methods=["GET"])
 @flask_praetorian.auth_required
 def get_menu_items(restaurant_id):
-    items = MenuItem.query.filter_by(restaurant_id=restaurant_id).all()
-    return jsonify(menu_items_schema.dump(items))
+    return menu_response(restaurant_id)
 
 
 @restaurant.route("/restaurant/menu", methods=["POST"])
@@ -410,6 +555,7 @@ def delete_menu_item(item_id):
 
 
 @flask_praetorian.auth_required
+@rate_limited("search")
 def search_restaurants():
     data = request.get_json()
     query = data.get('query', '').strip().lower()
@@ -423,15 +569,19 @@ def search_restaurants():
         (Restaurant.cuisine.ilike(f"%{query}%"))
     ).all()
 
-    results = restaurants_schema.dump(search)
-    return jsonify(results)
+    return json_response(compiled_restaurant.dump_many(search))
 
 
 @restaurant.route('/restaurant/<int:id>', methods=['GET'])
 def get_restaurants(id):
-    restaurant = Restaurant.query.get_or_404(id)
-    schema = RestaurantSchema()
-    return schema.dump(restaurant)
+    try:
+        only, options = restaurant_selection()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    response = restaurant_response(id, only, options)
+    if response is None:
+        abort(404)
+    return response
 
 
 @restaurant.route('/restaurant/save/<int:restaurant_id>', methods=['POST'])
@@ -444,6 +594,7 @@ def save_restaurant(restaurant_id):
 
     saved = SavedPlace(user_id=user_id, restaurant_id=restaurant_id)
     db.session.add(saved)
+    mark_dirty(restaurant_id)
     db.session.commit()
     return jsonify({'message': 'Saved successfully'}), 201
 
@@ -466,10 +617,29 @@ def remove_saved_restaurant(restaurant_id):
         return jsonify({'message': 'Not found'}), 404
 
     db.session.delete(saved)
+    mark_dirty(restaurant_id)
     db.session.commit()
     return jsonify({'message': 'Removed from saved places'}), 200
 
 
+@restaurant.route('/restaurant/<int:restaurant_id>/also_saved', methods=['GET'])
+def get_also_saved(restaurant_id):
+    try:
+        limit = request.args.get('limit', default=10, type=int)
+        return jsonify(also_saved(restaurant_id, min(max(limit, 1), 50))), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@restaurant.route('/restaurant/<int:restaurant_id>/similar', methods=['GET'])
+def get_similar(restaurant_id):
+    try:
+        limit = request.args.get('limit', default=10, type=int)
+        return jsonify(similar_restaurants(restaurant_id, min(max(limit, 1), 50))), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 
 @restaurant.route("/rate_property", methods=["POST"])
 @flask_praetorian.auth_required
@@ -507,7 +677,9 @@ def rate_property():
     )
 
     db.session.add(feedback)
+    mark_dirty(restaurant_id)
     db.session.commit()
+    flag_duplicates(feedback)
 
     return feedback_schema.jsonify(feedback), 201
 
@@ -515,8 +687,7 @@ def rate_property():
 
 @restaurant.route("/get_menu/<int:restaurant_id>", methods=["GET"])
 def get_menu(restaurant_id):
-    menu_items = MenuItem.query.filter_by(restaurant_id=restaurant_id).all()
-    return menu_items_schema.jsonify(menu_items)
+    return menu_response(restaurant_id)
 
 @restaurant.route('/analytics/premium/<int:restaurant_id>', methods=['GET'])
 @flask_praetorian.auth_required
@@ -526,87 +697,45 @@ def get_premium_analytics(restaurant_id):
         days = request.args.get('days', default=30, type=int)
         start_date = datetime.utcnow() - timedelta(days=days)
         
-        # Base query for the restaurant
-        base_query = Feedback.query.filter(
-            Feedback.restaurant_id == restaurant_id,
-            Feedback.timestamp >= start_date
-        )
+        # Per-day sums over hot reviews plus the archived rollups (the cold
+        # side is only read when the window reaches past the archive cutoff)
+        daily = daily_feedback_stats(restaurant_id, start_date)
+        totals = dict.fromkeys(ROLLUP_SUMS, 0)
+        for day in daily.values():
+            for name, value in day.items():
+                totals[name] += value
+        total_feedbacks = totals['reviews']
         
         # 1. Percentage of users rating service low (1–2 stars)
-        total_feedbacks = base_query.count()
-        low_service_feedbacks = base_query.filter(
-            Feedback.rating_service.in_([1, 2])
-        ).count()
-        
+        low_service_feedbacks = totals['service_1'] + totals['service_2']
         low_service_percentage = (low_service_feedbacks / total_feedbacks * 100) if total_feedbacks > 0 else 0
         
-        # 2. Suggestions collected (comments)
-        suggestions = base_query.filter(
-            Feedback.comment.isnot(None),
-            Feedback.comment != ''
-        ).with_entities(
-            Feedback.comment,
-            Feedback.timestamp,
-            Feedback.rating_service,
-            Feedback.rating_overall
-        ).order_by(Feedback.timestamp.desc()).all()
+        # 2. Suggestions collected (latest comments only; the digest of all of
+        #    them comes from the text analytics summaries below).  Archived
+        #    comments only fill up what the hot table could not.
+        suggestions_limit = max(request.args.get('suggestions', default=10, type=int), 0)
+        suggestions = []
+        for model in (Feedback, FeedbackArchive):
+            if len(suggestions) >= suggestions_limit or (model is FeedbackArchive and not needs_cold(start_date)):
+                break
+            suggestions += db.session.query(
+                model.comment,
+                model.timestamp,
+                model.rating_service,
+                model.rating_overall
+            ).filter(
+                model.restaurant_id == restaurant_id,
+                model.timestamp >= start_date,
+                model.comment.isnot(None),
+                model.comment != ''
+            ).order_by(model.timestamp.desc()).limit(suggestions_limit - len(suggestions)).all()
         
-        # 3. Time-based trends (convert SQL date string to ISO manually)
-        daily_trends = db.session.query(
-            func.date(Feedback.timestamp).label('date'),
-            func.avg(Feedback.rating_service).label('avg_service'),
-            func.avg(Feedback.rating_food).label('avg_food'),
-            func.avg(Feedback.rating_cleanliness).label('avg_cleanliness'),
-            func.avg(Feedback.rating_overall).label('avg_overall'),
-            func.count(Feedback.id).label('feedback_count')
-        ).filter(
-            Feedback.restaurant_id == restaurant_id,
-            Feedback.timestamp >= start_date
-        ).group_by(
-            func.date(Feedback.timestamp)
-        ).order_by(
-            func.date(Feedback.timestamp)
-        ).all()
-        
-        # 4. Rating distribution for service
-        service_distribution = db.session.query(
-            Feedback.rating_service,
-            func.count(Feedback.id).label('count')
-        ).filter(
-            Feedback.restaurant_id == restaurant_id,
-            Feedback.timestamp >= start_date
-        ).group_by(
-            Feedback.rating_service
-        ).order_by(
-            Feedback.rating_service
-        ).all()
-        
-        # 5. Overall statistics
-        avg_ratings = db.session.query(
-            func.avg(Feedback.rating_service).label('avg_service'),
-            func.avg(Feedback.rating_food).label('avg_food'),
-            func.avg(Feedback.rating_cleanliness).label('avg_cleanliness'),
-            func.avg(Feedback.rating_overall).label('avg_overall')
-        ).filter(
-            Feedback.restaurant_id == restaurant_id,
-            Feedback.timestamp >= start_date
-        ).first()
-        
-        # 6. Recommendation rate
-        recommend_stats = db.session.query(
-            Feedback.recommend,
-            func.count(Feedback.id).label('count')
-        ).filter(
-            Feedback.restaurant_id == restaurant_id,
-            Feedback.timestamp >= start_date,
-            Feedback.recommend.isnot(None)
-        ).group_by(
-            Feedback.recommend
-        ).all()
+        # 3. Overall statistics
+        def average(total, count):
+            return round(total / count, 2) if count else 0
         
-        total_recommendations = sum(stat.count for stat in recommend_stats if stat.recommend)
-        total_with_recommendation = sum(stat.count for stat in recommend_stats)
-        recommendation_rate = (total_recommendations / total_with_recommendation * 100) if total_with_recommendation > 0 else 0
+        # 4. Recommendation rate
+        recommendation_rate = (totals['recommend_yes'] / totals['recommend_count'] * 100) if totals['recommend_count'] > 0 else 0
         
         # Prepare response
         return jsonify({
@@ -617,10 +746,10 @@ def get_premium_analytics(restaurant_id):
                     'low_service_percentage': round(low_service_percentage, 2),
                     'recommendation_rate': round(recommendation_rate, 2),
                     'average_ratings': {
-                        'service': round(avg_ratings.avg_service or 0, 2),
-                        'food': round(avg_ratings.avg_food or 0, 2),
-                        'cleanliness': round(avg_ratings.avg_cleanliness or 0, 2),
-                        'overall': round(avg_ratings.avg_overall or 0, 2)
+                        'service': average(totals['service_sum'], total_feedbacks),
+                        'food': average(totals['food_sum'], total_feedbacks),
+                        'cleanliness': average(totals['cleanliness_sum'], total_feedbacks),
+                        'overall': average(totals['overall_sum'], totals['overall_count'])
                     }
                 },
                 'suggestions': [
@@ -631,22 +760,23 @@ def get_premium_analytics(restaurant_id):
                         'overall_rating': suggestion.rating_overall
                     } for suggestion in suggestions
                 ],
+                'insights': review_insights(restaurant_id, start_date),
                 'time_trends': [
                     {
-                        'date': str(trend.date),  # FIX: directly convert to string
-                        'avg_service': float(trend.avg_service or 0),
-                        'avg_food': float(trend.avg_food or 0),
-                        'avg_cleanliness': float(trend.avg_cleanliness or 0),
-                        'avg_overall': float(trend.avg_overall or 0),
-                        'feedback_count': trend.feedback_count
-                    } for trend in daily_trends
+                        'date': date,
+                        'avg_service': day['service_sum'] / day['reviews'],
+                        'avg_food': day['food_sum'] / day['reviews'],
+                        'avg_cleanliness': day['cleanliness_sum'] / day['reviews'],
+                        'avg_overall': (day['overall_sum'] / day['overall_count']) if day['overall_count'] else 0.0,
+                        'feedback_count': day['reviews']
+                    } for date, day in sorted(daily.items()) if day['reviews']
                 ],
                 'service_distribution': [
                     {
-                        'rating': dist.rating_service,
-                        'count': dist.count,
-                        'percentage': round((dist.count / total_feedbacks * 100), 2) if total_feedbacks > 0 else 0
-                    } for dist in service_distribution
+                        'rating': rating,
+                        'count': totals[f'service_{rating}'],
+                        'percentage': round((totals[f'service_{rating}'] / total_feedbacks * 100), 2) if total_feedbacks > 0 else 0
+                    } for rating in range(1, 6) if totals[f'service_{rating}']
                 ]
             }
         })
@@ -0,0 +1,189 @@
+# application/restaurant/serializers.py
+#
+# Precompiled serializers for the hot list endpoints.
+#
+# RestaurantSchema / FeedbackSchema / MenuItemSchema declare a plain field list
+# (Meta.fields), so marshmallow spends most of its time in generic field
+# inference and hooks and Flask then re-encodes the result with the stdlib
+# json module.  A CompiledSerializer resolves the field list once against the
+# model, reads attributes directly and encodes with orjson, keeping the same
+# output: same keys (attributes the model lacks are skipped, as marshmallow
+# does), datetimes as isoformat() strings and keys sorted like jsonify.
+#
+# json_response() also gzip/brotli-compresses large bodies when the client
+# accepts it and sets strong ETags; compressed variants get the encoding
+# appended to the tag, as different bytes must not share a strong ETag.
+import gzip
+import json
+import time
+from datetime import date, datetime
+
+import click
+from flask import Response, request
+from flask.cli import AppGroup
+
+from application.settings.setup import app
+from application.database.user.user_db import Restaurant, Feedback, MenuItem
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - falls back to the stdlib encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+app.config.setdefault("COMPRESS_MIN_SIZE", 1024)
+app.config.setdefault("COMPRESS_LEVEL", 5)
+
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+class CompiledSerializer:
+    def __init__(self, schema, model, nested=None):
+        nested = nested or {}
+        self.fields = tuple(
+            name for name in schema.Meta.fields
+            if name in nested or hasattr(model, name)
+        )
+        self.nested = nested
+
+    def dump(self, obj, only=None):
+        fields = self.fields if only is None else [name for name in self.fields if name in only]
+        # loaded column values sit in the instance __dict__; going through the
+        # instrumented attribute only for unloaded/lazy ones is much cheaper
+        state = obj.__dict__
+        data = {}
+        for name in fields:
+            value = state[name] if name in state else getattr(obj, name)
+            serializer = self.nested.get(name)
+            if serializer is not None:
+                data[name] = None if value is None else serializer.dump_many(value)
+            elif isinstance(value, (datetime, date)):
+                data[name] = value.isoformat()
+            else:
+                data[name] = value
+        return data
+
+    def dump_many(self, objs, only=None):
+        return [self.dump(obj, only) for obj in objs]
+
+
+def dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(payload, sort_keys=True, separators=(",", ":"), default=_plain) + "\n").encode()
+
+
+def _compress(body):
+    """Returns (body, content_encoding) for the best accepted encoding."""
+    if len(body) < app.config["COMPRESS_MIN_SIZE"]:
+        return body, None
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return brotli.compress(body, quality=app.config["COMPRESS_LEVEL"]), "br"
+    if accepted["gzip"]:
+        return gzip.compress(body, compresslevel=app.config["COMPRESS_LEVEL"]), "gzip"
+    return body, None
+
+
+def json_response(payload, status=200, etag=None):
+    body, encoding = _compress(dumps(payload))
+    response = Response(body, status=status, mimetype="application/json")
+    response.vary.add("Accept-Encoding")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    if etag:
+        response.set_etag(f"{etag}-{encoding}" if encoding else etag)
+    return response
+
+
+def etag_matches(etag):
+    """The encoding variant of `etag` that If-None-Match names, or None."""
+    if_none_match = request.if_none_match
+    if not if_none_match:
+        return None
+    if if_none_match.star_tag:
+        return etag
+    variants = (etag + suffix for suffix in ("", "-gzip", "-br"))
+    return next((v for v in variants if if_none_match.contains(v)), None)
+
+
+def not_modified(etag):
+    """304 for the ETag etag_matches returned: the validator the client
+    holds, suffix included."""
+    response = Response(status=304)
+    response.vary.add("Accept-Encoding")
+    response.set_etag(etag)
+    return response
+
+
+def compile_serializers(restaurant_schema, feedback_schema, menu_item_schema):
+    feedbacks = CompiledSerializer(feedback_schema, Feedback)
+    return (
+        CompiledSerializer(restaurant_schema, Restaurant, nested={"feedbacks": feedbacks}),
+        feedbacks,
+        CompiledSerializer(menu_item_schema, MenuItem),
+    )
+
+
+# ---------------------------
+# CLI:  flask serializers bench
+# ---------------------------
+serializers_cli = AppGroup("serializers", help="Compiled JSON serializers.")
+
+
+@serializers_cli.command("bench")
+@click.option("--rows", default=500, help="Restaurants per payload.")
+@click.option("--feedbacks", default=10, help="Feedbacks per restaurant.")
+@click.option("--repeat", default=20, help="Payloads per measurement.")
+def bench_command(rows, feedbacks, repeat):
+    """Compare marshmallow + jsonify with the compiled path on in-memory rows."""
+    from application.restaurant.restaurant import restaurants_schema, compiled_restaurant
+
+    now = datetime.utcnow()
+    data = [
+        Restaurant(
+            id=i, name=f"Restaurant {i}", location="Accra", cuisine="Ghanaian", contact="0200000000",
+            image="", menu="jollof, banku", hours="8-22", is_featured=bool(i % 2), status="Approved",
+            owner_id=1,
+            feedbacks=[
+                Feedback(id=i * 100 + j, restaurant_id=i, user_id=j, rating_food=4, rating_service=3,
+                         rating_cleanliness=5, rating_value=4, rating_overall=4, recommend=True,
+                         comment="Lovely food, friendly staff", anonymous=False, timestamp=now, likes=j)
+                for j in range(feedbacks)
+            ],
+        )
+        for i in range(rows)
+    ]
+
+    with app.test_request_context(headers={"Accept-Encoding": "gzip"}):
+        baseline = restaurants_schema.jsonify(data).get_data()
+        compiled = dumps(compiled_restaurant.dump_many(data))
+        if json.loads(baseline) != json.loads(compiled):
+            raise click.ClickException("Compiled output differs from marshmallow output")
+
+        def measure(fn):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                fn()
+            return (time.perf_counter() - started) / repeat
+
+        slow = measure(lambda: restaurants_schema.jsonify(data).get_data())
+        fast = measure(lambda: dumps(compiled_restaurant.dump_many(data)))
+        packed = json_response(compiled_restaurant.dump_many(data))
+
+    click.echo(f"payload: {rows} restaurants x {feedbacks} feedbacks, {len(baseline)} bytes "
+               f"({len(packed.get_data())} bytes {packed.headers.get('Content-Encoding', 'identity')})")
+    click.echo(f"marshmallow + jsonify: {slow * 1000:8.2f} ms  ({1 / slow:7.1f} payloads/s)")
+    click.echo(f"compiled + {'orjson' if orjson else 'json'}:   {fast * 1000:8.2f} ms  ({1 / fast:7.1f} payloads/s)")
+    click.echo(f"speed-up: {slow / fast:.1f}x")
+
+
+app.cli.add_command(serializers_cli)
@@ -0,0 +1,328 @@
+# application/room_view/audit.py
+#
+# Night audit: daily room revenue, ADR, RevPAR and occupancy.
+#
+# A run over [start, end) loads every active stay overlapping the range
+# (typed dates and money only) and every payment taken in it, then computes
+# all nights and room types at once with NumPy: each stay adds +rooms at its
+# first night and -rooms after its last one into a (type x night) grid, and
+# a cumulative sum along the nights turns that into rooms sold per night;
+# the same with rooms * net nightly rate gives revenue.  The result replaces
+# the range in night_audit, so re-running a range is idempotent and picks up
+# late edits.  Reports read night_audit only.
+#
+# Net nightly rate = nightly_rate minus the discount: a percentage of the
+# rate when discount_type says so, otherwise a fixed amount spread over the
+# nights of the stay.  Rooms available is the current room inventory.
+#
+#   flask hotel backfill-money             typed copies of the money strings
+#   flask hotel night-audit [--start --end]
+#   flask hotel check-audit                a scratch group booking, audited
+from datetime import date, datetime, timedelta
+
+import click
+import numpy as np
+from sqlalchemy import Float, bindparam, cast, delete, insert, or_, select
+
+from application.settings.setup import app
+from application.database.user.user_db import db
+from application.database.hotel_db.hotel import (
+    Room, Room_Type, Payment, Night_Audit, MONEY_FIELDS, PARSERS, is_percent
+)
+from application.room_view.availability import RESERVATION_MODELS, hotel_cli, room_numbers
+from application.room_view.booking import STRESS_PREFIX, _cleanup_stress, active, allocate_group
+
+app.config.setdefault("HOTEL_AUDIT_LOOKBACK_DAYS", 7)   # nights the nightly job re-audits
+
+ALL_TYPES = "*"
+PERIODS = {
+    "day": lambda day: day.isoformat(),
+    "week": lambda day: (day - timedelta(days=day.weekday())).isoformat(),
+    "month": lambda day: day.strftime("%Y-%m"),
+    "year": lambda day: day.strftime("%Y"),
+}
+
+
+# ---------------------------
+# Backfill of the typed money columns
+# ---------------------------
+def backfill_money(batch_size=1000):
+    """Parse the money strings of every payment, reservation and room type
+    written before the typed columns existed.  Returns the rows updated."""
+    updated = 0
+    for model in (Payment, Room_Type) + RESERVATION_MODELS:
+        pairs = MONEY_FIELDS[model.__name__]
+        key = model.__mapper__.primary_key[0]
+        table = model.__table__
+        stmt = (
+            table.update()
+            .where(table.c[key.name] == bindparam("row_id"))
+            .values({typed: bindparam(typed) for _, typed in pairs})
+        )
+        missing = or_(*[
+            getattr(model, name).isnot(None) & getattr(model, typed).is_(None) for name, typed in pairs
+        ])
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                select(key, *[getattr(model, name) for name, _ in pairs])
+                .where(key > last_id, missing)
+                .order_by(key)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            batch = [
+                {"row_id": row[0], **{typed: PARSERS[typed](value) for (_, typed), value in zip(pairs, row[1:])}}
+                for row in rows
+            ]
+            db.session.execute(stmt, batch)
+            db.session.commit()
+            updated += len(batch)
+            last_id = rows[-1][0]
+    return updated
+
+
+# ---------------------------
+# The audit
+# ---------------------------
+def load_inventory():
+    """({room_type: rooms}, {room_number: room_type})."""
+    counts, types = {}, {}
+    for number, room_type in db.session.execute(select(Room.room_number, Room.room_type)):
+        if number:
+            counts[room_type or ""] = counts.get(room_type or "", 0) + 1
+            types[number] = room_type or ""
+    return counts, types
+
+
+def load_stays(start, end, room_types):
+    """Flat columns of the active stays overlapping [start, end)."""
+    kinds, arrivals, departures, rooms, rates, discounts, percent = [], [], [], [], [], [], []
+    for model in RESERVATION_MODELS:
+        rows = db.session.execute(
+            select(
+                model.room_type, model.room_number, model.arrival_on, model.departure_on,
+                cast(model.nightly_rate, Float), cast(model.discount, Float), model.discount_type,
+            )
+            .where(
+                model.arrival_on < end, model.departure_on > start,
+                model.departure_on > model.arrival_on, active(model),
+            )
+        )
+        for room_type, number, arrival_on, departure_on, rate, discount, discount_type in rows:
+            numbers = room_numbers(number)
+            kinds.append(room_type or (room_types.get(numbers[0], "") if numbers else ""))
+            arrivals.append(arrival_on.toordinal())
+            departures.append(departure_on.toordinal())
+            rooms.append(len(numbers) or 1)
+            rates.append(rate or 0.0)
+            discounts.append(discount or 0.0)
+            percent.append(is_percent(discount_type))
+    return {
+        "room_type": kinds,
+        "arrival": np.array(arrivals, dtype=np.int64),
+        "departure": np.array(departures, dtype=np.int64),
+        "rooms": np.array(rooms, dtype=np.int64),
+        "rate": np.array(rates, dtype=np.float64),
+        "discount": np.array(discounts, dtype=np.float64),
+        "percent": np.array(percent, dtype=bool),
+    }
+
+
+def load_payments(start, end):
+    rows = db.session.execute(
+        select(Payment.paid_on, cast(Payment.amount_paid, Float))
+        .where(Payment.paid_on >= start, Payment.paid_on < end, Payment.amount_paid.isnot(None))
+    ).all()
+    return (
+        np.array([paid_on.toordinal() for paid_on, _ in rows], dtype=np.int64),
+        np.array([amount for _, amount in rows], dtype=np.float64),
+    )
+
+
+def compute_audit(start, end, inventory, stays, payments):
+    """Rows for night_audit covering [start, end), one per night and room
+    type plus one per night for the whole hotel."""
+    nights = (end - start).days
+    origin = start.toordinal()
+    types = sorted(set(inventory) | set(stays["room_type"]))
+    position = {t: i for i, t in enumerate(types)}
+
+    kind = np.array([position[t] for t in stays["room_type"]], dtype=np.int64)
+    first = np.clip(stays["arrival"] - origin, 0, nights)
+    last = np.clip(stays["departure"] - origin, 0, nights)
+    length = np.maximum(stays["departure"] - stays["arrival"], 1)
+    net = np.where(
+        stays["percent"],
+        stays["rate"] * (1 - stays["discount"] / 100),
+        stays["rate"] - stays["discount"] / length,
+    )
+    net = np.maximum(net, 0.0) * stays["rooms"]
+
+    shape = (len(types), nights + 1)
+    sold, revenue = np.zeros(shape, dtype=np.int64), np.zeros(shape)
+    np.add.at(sold, (kind, first), stays["rooms"])
+    np.add.at(sold, (kind, last), -stays["rooms"])
+    np.add.at(revenue, (kind, first), net)
+    np.add.at(revenue, (kind, last), -net)
+    sold = np.cumsum(sold, axis=1)[:, :nights]
+    revenue = np.round(np.cumsum(revenue, axis=1)[:, :nights], 2)
+    available = np.repeat(np.array([inventory.get(t, 0) for t in types], dtype=np.int64)[:, None], nights, axis=1)
+
+    paid_on, amount = payments
+    taken = np.round(np.bincount(paid_on - origin, weights=amount, minlength=nights)[:nights], 2)
+
+    types.append(ALL_TYPES)
+    sold = np.vstack([sold, sold.sum(axis=0)])
+    revenue = np.vstack([revenue, revenue.sum(axis=0)])
+    available = np.vstack([available, available.sum(axis=0)])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        adr = np.round(np.where(sold > 0, revenue / sold, 0.0), 2)
+        revpar = np.round(np.where(available > 0, revenue / available, 0.0), 2)
+        occupancy = np.round(np.where(available > 0, sold / available, 0.0), 4)
+
+    audited_at = datetime.utcnow()
+    rows = []
+    for t, room_type in enumerate(types):
+        keep = (sold[t] != 0) | (available[t] != 0) | (room_type == ALL_TYPES)
+        for n in np.flatnonzero(keep):
+            rows.append({
+                "day": start + timedelta(days=int(n)),
+                "room_type": room_type,
+                "rooms_available": int(available[t, n]),
+                "rooms_sold": int(sold[t, n]),
+                "room_revenue": float(revenue[t, n]),
+                "payments": float(taken[n]) if room_type == ALL_TYPES else None,
+                "adr": float(adr[t, n]),
+                "revpar": float(revpar[t, n]),
+                "occupancy": float(occupancy[t, n]),
+                "audited_at": audited_at,
+            })
+    return rows
+
+
+def night_audit(start, end):
+    """Recompute night_audit for the nights in [start, end); returns the
+    number of rows written."""
+    if end <= start:
+        raise ValueError("end must be after start")
+    inventory, room_types = load_inventory()
+    rows = compute_audit(start, end, inventory, load_stays(start, end, room_types), load_payments(start, end))
+    db.session.execute(delete(Night_Audit).where(Night_Audit.day >= start, Night_Audit.day < end))
+    if rows:
+        db.session.execute(insert(Night_Audit), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def audit_recent(days=None):
+    """The nightly run: re-audit the last few closed nights."""
+    today = date.today()
+    return night_audit(today - timedelta(days=days or app.config["HOTEL_AUDIT_LOOKBACK_DAYS"]), today)
+
+
+# ---------------------------
+# Reports (night_audit only)
+# ---------------------------
+def daily_report(start, end, room_type=ALL_TYPES):
+    rows = db.session.execute(
+        select(
+            Night_Audit.day, Night_Audit.rooms_available, Night_Audit.rooms_sold, Night_Audit.room_revenue,
+            Night_Audit.payments, Night_Audit.adr, Night_Audit.revpar, Night_Audit.occupancy,
+        )
+        .where(Night_Audit.room_type == room_type, Night_Audit.day >= start, Night_Audit.day < end)
+        .order_by(Night_Audit.day)
+    )
+    return [
+        {
+            "day": day.isoformat(), "rooms_available": available, "rooms_sold": sold,
+            "room_revenue": revenue, "payments": payments, "adr": adr, "revpar": revpar, "occupancy": occupancy,
+        }
+        for day, available, sold, revenue, payments, adr, revpar, occupancy in rows
+    ]
+
+
+def summary_report(start, end, period="month", room_type=ALL_TYPES):
+    """Totals per period; ADR, RevPAR and occupancy are recomputed from the
+    summed nights, not averaged."""
+    key = PERIODS[period]
+    totals = {}
+    rows = db.session.execute(
+        select(
+            Night_Audit.day, Night_Audit.rooms_available, Night_Audit.rooms_sold,
+            Night_Audit.room_revenue, Night_Audit.payments,
+        )
+        .where(Night_Audit.room_type == room_type, Night_Audit.day >= start, Night_Audit.day < end)
+        .order_by(Night_Audit.day)
+    )
+    for day, available, sold, revenue, payments in rows:
+        bucket = totals.setdefault(key(day), [0, 0, 0, 0.0, 0.0])
+        bucket[0] += 1
+        bucket[1] += available
+        bucket[2] += sold
+        bucket[3] += revenue or 0.0
+        bucket[4] += payments or 0.0
+    return [
+        {
+            "period": label,
+            "nights_audited": audited,
+            "rooms_available": available,
+            "rooms_sold": sold,
+            "room_revenue": round(revenue, 2),
+            "payments": round(payments, 2) if room_type == ALL_TYPES else None,
+            "adr": round(revenue / sold, 2) if sold else 0.0,
+            "revpar": round(revenue / available, 2) if available else 0.0,
+            "occupancy": round(sold / available, 4) if available else 0.0,
+        }
+        for label, (audited, available, sold, revenue, payments) in totals.items()
+    ]
+
+
+# ---------------------------
+# CLI:  flask hotel backfill-money | night-audit | check-audit
+# ---------------------------
+@hotel_cli.command("backfill-money")
+@click.option("--batch-size", type=int, default=1000)
+def backfill_money_command(batch_size):
+    click.echo(f"Backfilled {backfill_money(batch_size)} payments, room types and reservations")
+
+
+@hotel_cli.command("night-audit")
+@click.option("--start", type=click.DateTime(formats=["%Y-%m-%d"]), default=None,
+              help="First night (default: HOTEL_AUDIT_LOOKBACK_DAYS ago).")
+@click.option("--end", type=click.DateTime(formats=["%Y-%m-%d"]), default=None,
+              help="Night after the last one (default: today).")
+def night_audit_command(start, end):
+    end = end.date() if end else date.today()
+    start = start.date() if start else end - timedelta(days=app.config["HOTEL_AUDIT_LOOKBACK_DAYS"])
+    started = datetime.now()
+    written = night_audit(start, end)
+    elapsed = (datetime.now() - started).total_seconds()
+    click.echo(f"Audited {(end - start).days} nights ({written} rows) in {elapsed:.3f}s")
+
+
+@hotel_cli.command("check-audit")
+def check_audit_command():
+    """Books a scratch group (2 rooms, 2 nights at 300 less 10) and checks
+    the night audit counts its revenue, then removes it."""
+    _cleanup_stress()
+    numbers = [f"{STRESS_PREFIX}{i}" for i in range(2)]
+    db.session.execute(insert(Room), [{"room_number": n, "room_type": "stress", "status": "ready"} for n in numbers])
+    db.session.commit()
+    start = date.today() + timedelta(days=3650)   # far from real bookings
+    end = start + timedelta(days=2)
+    try:
+        allocate_group({"stress": 2}, {
+            "arrival_date": start.isoformat(), "night": "2",
+            "rate_amount": "300", "discount_value": "10", "discount_type": "amount",
+        })
+        night_audit(start, end)
+        revenue = [row["room_revenue"] for row in daily_report(start, end, "stress")]
+    finally:
+        db.session.execute(delete(Night_Audit).where(Night_Audit.day >= start, Night_Audit.day < end))
+        _cleanup_stress()
+    expected = [2 * (300 - 10 / 2)] * 2
+    click.echo(f"group room revenue per night: {revenue} (expected {expected})")
+    if revenue != expected:
+        raise SystemExit(1)
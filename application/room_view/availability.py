@@ -0,0 +1,279 @@
+# application/room_view/availability.py
+#
+# Room availability over an interval index.
+#
+# All active reservations are loaded once (typed dates only) into flat NumPy
+# arrays sorted by (room, arrival): for room r, key = r * SPAN + day ordinal.
+# `ends` holds the running maximum of r * SPAN + departure over the same
+# order; because the room offset dominates, that running maximum restarts at
+# every room boundary.  Room r is busy during [A, B) iff the last stay of r
+# that arrives before B departs after A, i.e.
+#
+#   p = searchsorted(starts, r * SPAN + B) - 1
+#   busy = p >= first[r] and ends[p] - r * SPAN > A
+#
+# which is answered for every room of a type with one vectorized call.
+# Bookings without an assigned room (or with an unknown room number) only
+# take capacity from their room type.
+#
+# The index is rebuilt lazily: immediately after a local write to rooms or
+# reservations, and otherwise at most ROOM_AVAILABILITY_TTL seconds after a
+# write in another worker.  It answers searches; booking itself re-checks
+# against the database.
+import re
+import threading
+import time
+from collections import defaultdict
+
+import click
+import numpy as np
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, event, select
+from sqlalchemy.orm import object_session
+
+from application.settings.setup import app
+from application.database.user.user_db import db
+from application.database.routing import RoutingSession
+from application.database.hotel_db.hotel import Room, Reservation, Group_Reservation, parse_stay
+
+app.config.setdefault("ROOM_AVAILABILITY_TTL", 30)
+app.config.setdefault("ROOM_INACTIVE_STATUSES", ("cancelled", "canceled", "void", "no show", "no_show"))
+app.config.setdefault("ROOM_OUT_OF_SERVICE", ("out of order", "out of service", "maintenance"))
+
+SPAN = 1 << 22  # > any date ordinal
+RESERVATION_MODELS = (Reservation, Group_Reservation)
+
+
+def room_numbers(value):
+    """Room numbers in a reservation's room_number field (groups list several)."""
+    return [n for n in re.split(r"[,;/\s]+", value or "") if n]
+
+
+def is_active(status):
+    return (status or "").strip().lower() not in app.config["ROOM_INACTIVE_STATUSES"]
+
+
+class AvailabilityIndex:
+    def __init__(self, rooms, stays):
+        """rooms: [(room_number, room_type, out_of_service)];
+        stays: [(room_number or None, room_type, arrival_on, departure_on)]."""
+        self.rooms = [number for number, _, _ in rooms]
+        self.out_of_service = np.array([oos for _, _, oos in rooms], dtype=bool)
+        position = {number: i for i, number in enumerate(self.rooms)}
+        self.by_type = defaultdict(list)
+        for i, (_, room_type, _) in enumerate(rooms):
+            self.by_type[room_type or ""].append(i)
+        self.by_type = {t: np.array(ix, dtype=np.int64) for t, ix in self.by_type.items()}
+
+        assigned, unassigned = [], defaultdict(list)
+        for number, room_type, arrival_on, departure_on in stays:
+            i = position.get(number)
+            if i is None:
+                unassigned[room_type or ""].append((arrival_on.toordinal(), departure_on.toordinal()))
+            else:
+                assigned.append((i, arrival_on.toordinal(), departure_on.toordinal()))
+        data = np.array(assigned, dtype=np.int64).reshape(-1, 3)
+        data = data[np.lexsort((data[:, 1], data[:, 0]))]
+        self.starts = data[:, 0] * SPAN + data[:, 1]
+        self.ends = np.maximum.accumulate(data[:, 0] * SPAN + data[:, 2]) if len(data) else data[:, 2]
+        self.first = np.searchsorted(data[:, 0], np.arange(len(self.rooms)), side="left")
+        self.unassigned = {
+            t: np.array(spans, dtype=np.int64) for t, spans in unassigned.items()
+        }
+        self.size = len(data)
+
+    def busy(self, rooms, start, end):
+        """Boolean array: is each room index in `rooms` booked during [start, end)."""
+        if not len(rooms) or not len(self.starts):
+            return np.zeros(len(rooms), dtype=bool)
+        offset = rooms * SPAN
+        p = np.searchsorted(self.starts, offset + end.toordinal(), side="left") - 1
+        has_earlier = p >= self.first[rooms]
+        return has_earlier & (self.ends[np.maximum(p, 0)] - offset > start.toordinal())
+
+    def unassigned_peak(self, room_type, start, end):
+        """Most room-less bookings of a type held on any single night of the window."""
+        spans = self.unassigned.get(room_type)
+        if spans is None:
+            return 0
+        a, b = start.toordinal(), end.toordinal()
+        spans = spans[(spans[:, 0] < b) & (spans[:, 1] > a)]
+        if not len(spans):
+            return 0
+        events = np.concatenate([
+            np.stack([np.maximum(spans[:, 0], a), np.ones(len(spans), dtype=np.int64)], axis=1),
+            np.stack([spans[:, 1], -np.ones(len(spans), dtype=np.int64)], axis=1),
+        ])
+        events = events[np.lexsort((events[:, 1], events[:, 0]))]  # departures first
+        return int(np.cumsum(events[:, 1]).max())
+
+    def search(self, start, end, room_type=None):
+        types = [room_type] if room_type is not None else sorted(self.by_type)
+        result = {}
+        for t in types:
+            rooms = self.by_type.get(t, np.array([], dtype=np.int64))
+            blocked = self.busy(rooms, start, end) | self.out_of_service[rooms]
+            free = [self.rooms[i] for i in rooms[~blocked]]
+            pending = self.unassigned_peak(t, start, end)
+            result[t] = {
+                "total": int(len(rooms)),
+                "available_rooms": free,
+                "unassigned_bookings": pending,
+                "available_count": max(0, len(free) - pending),
+            }
+        return result
+
+
+def load_index():
+    out_of_service = set(app.config["ROOM_OUT_OF_SERVICE"])
+    rooms = [
+        (number, room_type, (status or "").strip().lower() in out_of_service)
+        for number, room_type, status in db.session.execute(
+            select(Room.room_number, Room.room_type, Room.status).order_by(Room.id)
+        )
+        if number
+    ]
+    stays = []
+    for model in RESERVATION_MODELS:
+        rows = db.session.execute(
+            select(model.room_number, model.room_type, model.arrival_on, model.departure_on, model.status)
+            .where(model.arrival_on.isnot(None), model.departure_on.isnot(None))
+        )
+        for number, room_type, arrival_on, departure_on, status in rows:
+            if not is_active(status) or departure_on <= arrival_on:
+                continue
+            numbers = room_numbers(number) or [None]
+            stays.extend((n, room_type, arrival_on, departure_on) for n in numbers)
+    return AvailabilityIndex(rooms, stays)
+
+
+class AvailabilityCache:
+    def __init__(self):
+        self._index = None
+        self._built = 0.0
+        self._dirty = True
+        self._lock = threading.Lock()
+
+    def invalidate(self, *_):
+        self._dirty = True
+
+    def get(self):
+        ttl = app.config["ROOM_AVAILABILITY_TTL"]
+        if self._dirty or time.monotonic() - self._built > ttl:
+            with self._lock:
+                if self._dirty or time.monotonic() - self._built > ttl:
+                    self._dirty = False
+                    self._index = load_index()
+                    self._built = time.monotonic()
+        return self._index
+
+
+availability = AvailabilityCache()
+
+
+def rooms_changed(session):
+    """Rebuild the index after `session` commits; Core bulk writes call this
+    themselves, ORM writes go through the listeners below."""
+    session.info["rooms_changed"] = True
+
+
+def _rooms_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        rooms_changed(session)
+
+
+def _after_commit(session):
+    # rebuild from committed rows only, never from a flush that may roll back
+    if session.info.pop("rooms_changed", False):
+        availability.invalidate()
+
+
+for _model in (Room,) + RESERVATION_MODELS:
+    for _event in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _event, _rooms_changed)
+event.listen(RoutingSession, "after_commit", _after_commit)
+event.listen(RoutingSession, "after_rollback", lambda session: session.info.pop("rooms_changed", None))
+
+
+def search_availability(start, end, room_type=None):
+    return availability.get().search(start, end, room_type)
+
+
+# ---------------------------
+# Backfill of the typed stay columns
+# ---------------------------
+def backfill_stay_dates(batch_size=1000):
+    """Parse the string stay fields of every reservation whose typed dates are
+    missing.  Returns (updated, unparseable)."""
+    updated = unparseable = 0
+    for model in RESERVATION_MODELS:
+        table = model.__table__
+        stmt = (
+            table.update()
+            .where(table.c.id == bindparam("rid"))
+            .values(
+                arrival_on=bindparam("arrival_on"), departure_on=bindparam("departure_on"),
+                checkin_at=bindparam("checkin_at"), checkout_at=bindparam("checkout_at"),
+            )
+        )
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                select(model.id, model.arrival_date, model.night, model.checkin_time, model.checkout_time)
+                .where(model.id > last_id, model.arrival_on.is_(None))
+                .order_by(model.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            batch = []
+            for rid, arrival_date, night, checkin_time, checkout_time in rows:
+                arrival_on, departure_on, checkin_at, checkout_at = parse_stay(
+                    arrival_date, night, checkin_time, checkout_time
+                )
+                if arrival_on is None:
+                    unparseable += 1
+                    continue
+                batch.append({
+                    "rid": rid, "arrival_on": arrival_on, "departure_on": departure_on,
+                    "checkin_at": checkin_at, "checkout_at": checkout_at,
+                })
+            if batch:
+                db.session.execute(stmt, batch)
+            db.session.commit()
+            updated += len(batch)
+            last_id = rows[-1][0]
+    availability.invalidate()
+    return updated, unparseable
+
+
+# ---------------------------
+# CLI:  flask hotel backfill-dates | availability
+# ---------------------------
+hotel_cli = AppGroup("hotel", help="Hotel rooms and reservations.")
+
+
+@hotel_cli.command("backfill-dates")
+@click.option("--batch-size", type=int, default=1000)
+def backfill_command(batch_size):
+    updated, unparseable = backfill_stay_dates(batch_size)
+    click.echo(f"Backfilled {updated} reservations ({unparseable} with unparseable arrival dates)")
+
+
+@hotel_cli.command("availability")
+@click.argument("start", type=click.DateTime(formats=["%Y-%m-%d"]))
+@click.argument("end", type=click.DateTime(formats=["%Y-%m-%d"]))
+@click.option("--room-type", default=None)
+def availability_command(start, end, room_type):
+    started = time.perf_counter()
+    index = load_index()
+    built = time.perf_counter()
+    result = index.search(start.date(), end.date(), room_type)
+    done = time.perf_counter()
+    for t, info in result.items():
+        click.echo(f"{t or '(no type)':<20} {info['available_count']}/{info['total']} free")
+    click.echo(f"{index.size} stays indexed in {built - started:.3f}s, searched in {(done - built) * 1000:.2f}ms")
+
+
+app.cli.add_command(hotel_cli)
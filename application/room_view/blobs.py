@@ -0,0 +1,274 @@
+# application/room_view/blobs.py
+#
+# Room pictures and employee id photos.
+#
+# The LargeBinary columns are deferred on the models, so listings never load
+# them.  blob_response() serves one of them with an ETag (its sha256) and
+# Range support.  The sha256, size and content type live in stored_blob, so
+# a conditional request that matches is answered without reading the blob.
+#
+# With HOTEL_BLOB_STORAGE = "file", bytes written to these columns are moved
+# on flush into a content-addressed file store (HOTEL_BLOB_DIR/ab/abcdef...)
+# and the column is left NULL.  Existing rows are moved, or moved back, with
+#
+#   flask hotel migrate-blobs --to file [--vacuum]
+#   flask hotel migrate-blobs --to db
+import hashlib
+import io
+import os
+import tempfile
+from datetime import datetime
+
+import click
+from flask import jsonify, request, send_file
+from sqlalchemy import delete, event, insert, select, update
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.exc import IntegrityError
+
+from application.settings.setup import app
+from application.database.user.user_db import db
+from application.database.hotel_db.hotel import Room, Employee, Stored_Blob
+from application.room_view.availability import hotel_cli
+
+app.config.setdefault("HOTEL_BLOB_STORAGE", "db")   # "db" or "file"
+app.config.setdefault("HOTEL_BLOB_DIR", os.path.join(app.instance_path, "blobs"))
+app.config.setdefault("HOTEL_BLOB_MAX_AGE", 3600)
+
+BLOB_FIELDS = {
+    "room": (Room, ("picture_one", "picture_two", "picture_three")),
+    "employee": (Employee, ("id_photo",)),
+}
+OWNERS = {model: owner for owner, (model, _) in BLOB_FIELDS.items()}
+
+SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"%PDF", "application/pdf"),
+)
+
+
+def sniff(data):
+    for magic, content_type in SIGNATURES:
+        if data.startswith(magic):
+            return content_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+def describe(data):
+    return {"sha256": hashlib.sha256(data).hexdigest(), "size": len(data), "content_type": sniff(data)}
+
+
+def blob_path(relative):
+    return os.path.join(app.config["HOTEL_BLOB_DIR"], relative)
+
+
+def write_file(data, sha256):
+    """Store `data` under its hash (idempotent); returns the relative path."""
+    relative = os.path.join(sha256[:2], sha256)
+    path = blob_path(relative)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    return relative
+
+
+def _key(owner, owner_id, field):
+    return (
+        (Stored_Blob.owner == owner) & (Stored_Blob.owner_id == owner_id) & (Stored_Blob.field == field)
+    )
+
+
+# ---------------------------
+# Serving
+# ---------------------------
+def blob_response(owner, owner_id, field, private=False):
+    model, fields = BLOB_FIELDS[owner]
+    if field not in fields:
+        return jsonify({"error": "Unknown field"}), 404
+    meta = db.session.get(Stored_Blob, (owner, owner_id, field))
+    data = None
+    if meta is None:
+        # first request since the blob was written: read it once, remember
+        # its hash so later conditional requests can skip it
+        row = db.session.execute(
+            select(model.id, getattr(model, field)).where(model.id == owner_id)
+        ).first()
+        if row is None or row[1] is None:
+            return jsonify({"error": "Not found"}), 404
+        data = bytes(row[1])
+        meta = Stored_Blob(owner=owner, owner_id=owner_id, field=field, **describe(data))
+        try:
+            db.session.merge(meta)
+            db.session.commit()
+        except IntegrityError:
+            # a concurrent first request stored it already; same bytes, same hash
+            db.session.rollback()
+
+    cache_control = "private" if private else "public"
+    if meta.sha256 in request.if_none_match:
+        response = app.response_class(status=304)
+        response.set_etag(meta.sha256)
+        response.headers["Cache-Control"] = f"{cache_control}, max-age={app.config['HOTEL_BLOB_MAX_AGE']}"
+        return response
+
+    if meta.path:
+        source = blob_path(meta.path)   # streamed from disk in chunks
+    else:
+        if data is None:
+            data = db.session.execute(select(getattr(model, field)).where(model.id == owner_id)).scalar()
+            if data is None:
+                return jsonify({"error": "Not found"}), 404
+        source = io.BytesIO(data)
+    response = send_file(
+        source,
+        mimetype=meta.content_type,
+        conditional=True,
+        etag=meta.sha256,
+        max_age=app.config["HOTEL_BLOB_MAX_AGE"],
+    )
+    response.headers["Cache-Control"] = f"{cache_control}, max-age={app.config['HOTEL_BLOB_MAX_AGE']}"
+    response.headers["Accept-Ranges"] = "bytes"
+    return response
+
+
+def blob_presence(owner, ids):
+    """{owner_id: [fields that hold a blob]} without reading any blob."""
+    model, fields = BLOB_FIELDS[owner]
+    present = {owner_id: [] for owner_id in ids}
+    if not ids:
+        return present
+    rows = db.session.execute(
+        select(model.id, *[getattr(model, f).isnot(None) for f in fields]).where(model.id.in_(ids))
+    )
+    for owner_id, *flags in rows:
+        present[owner_id] = [f for f, flag in zip(fields, flags) if flag]
+    stored = db.session.execute(
+        select(Stored_Blob.owner_id, Stored_Blob.field)
+        .where(Stored_Blob.owner == owner, Stored_Blob.owner_id.in_(ids), Stored_Blob.path.isnot(None))
+    )
+    for owner_id, field in stored:
+        if field not in present[owner_id]:
+            present[owner_id].append(field)
+    return {owner_id: [f for f in fields if f in found] for owner_id, found in present.items()}
+
+
+# ---------------------------
+# Keeping stored_blob in step with writes
+# ---------------------------
+def _before_write(mapper, connection, target):
+    _, fields = BLOB_FIELDS[OWNERS[type(target)]]
+    state = sa_inspect(target)
+    changes = {}
+    for field in fields:
+        if state.attrs[field].history.has_changes():
+            changes[field] = getattr(target, field)
+            if changes[field] is not None and app.config["HOTEL_BLOB_STORAGE"] == "file":
+                setattr(target, field, None)
+    target.__dict__["_blob_changes"] = changes
+
+
+def _after_write(mapper, connection, target):
+    owner = OWNERS[type(target)]
+    for field, data in target.__dict__.pop("_blob_changes", {}).items():
+        connection.execute(delete(Stored_Blob).where(_key(owner, target.id, field)))
+        if data is not None and app.config["HOTEL_BLOB_STORAGE"] == "file":
+            meta = describe(bytes(data))
+            connection.execute(insert(Stored_Blob).values(
+                owner=owner, owner_id=target.id, field=field, path=write_file(bytes(data), meta["sha256"]),
+                updated_at=datetime.utcnow(), **meta
+            ))
+
+
+def _after_delete(mapper, connection, target):
+    connection.execute(delete(Stored_Blob).where(
+        Stored_Blob.owner == OWNERS[type(target)], Stored_Blob.owner_id == target.id
+    ))
+
+
+for _model in OWNERS:
+    event.listen(_model, "before_insert", _before_write)
+    event.listen(_model, "before_update", _before_write)
+    event.listen(_model, "after_insert", _after_write)
+    event.listen(_model, "after_update", _after_write)
+    event.listen(_model, "after_delete", _after_delete)
+
+
+# ---------------------------
+# Migration between the table and the file store
+# ---------------------------
+def migrate_to_files(batch_size=50):
+    moved = 0
+    for owner, (model, fields) in BLOB_FIELDS.items():
+        for field in fields:
+            column = getattr(model, field)
+            last_id = 0
+            while True:
+                rows = db.session.execute(
+                    select(model.id, column)
+                    .where(model.id > last_id, column.isnot(None))
+                    .order_by(model.id)
+                    .limit(batch_size)
+                ).all()
+                if not rows:
+                    break
+                for owner_id, data in rows:
+                    data = bytes(data)
+                    meta = describe(data)
+                    relative = write_file(data, meta["sha256"])
+                    db.session.execute(delete(Stored_Blob).where(_key(owner, owner_id, field)))
+                    db.session.execute(insert(Stored_Blob).values(
+                        owner=owner, owner_id=owner_id, field=field, path=relative,
+                        updated_at=datetime.utcnow(), **meta
+                    ))
+                db.session.execute(
+                    update(model.__table__)
+                    .where(model.__table__.c.id.in_([owner_id for owner_id, _ in rows]))
+                    .values({field: None})
+                )
+                db.session.commit()   # files are written before the column is cleared
+                moved += len(rows)
+                last_id = rows[-1][0]
+    return moved
+
+
+def migrate_to_table():
+    moved = 0
+    for owner, (model, fields) in BLOB_FIELDS.items():
+        stored = Stored_Blob.query.filter(
+            Stored_Blob.owner == owner, Stored_Blob.field.in_(fields), Stored_Blob.path.isnot(None)
+        ).all()
+        for meta in stored:
+            with open(blob_path(meta.path), "rb") as f:
+                data = f.read()
+            db.session.execute(
+                update(model.__table__).where(model.__table__.c.id == meta.owner_id).values({meta.field: data})
+            )
+            meta.path = None
+            db.session.commit()
+            moved += 1
+    return moved
+
+
+@hotel_cli.command("migrate-blobs")
+@click.option("--to", "target", type=click.Choice(["file", "db"]), required=True)
+@click.option("--batch-size", type=int, default=50)
+@click.option("--vacuum", is_flag=True, help="Reclaim the freed space afterwards (SQLite).")
+def migrate_blobs_command(target, batch_size, vacuum):
+    if target == "file":
+        moved = migrate_to_files(batch_size)
+        click.echo(f"Moved {moved} blobs to {app.config['HOTEL_BLOB_DIR']}; "
+                   f"set HOTEL_BLOB_STORAGE = 'file' so new uploads go there too")
+    else:
+        moved = migrate_to_table()
+        click.echo(f"Moved {moved} blobs back into the database")
+    if vacuum and db.engine.dialect.name == "sqlite":
+        with db.engine.connect() as connection:
+            connection.exec_driver_sql("VACUUM")
+        click.echo("Vacuumed")
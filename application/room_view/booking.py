@@ -0,0 +1,409 @@
+# application/room_view/booking.py
+#
+# Creating reservations without double-booking a room.
+#
+# The overlap check and the insert run in one transaction that first takes a
+# lock covering the rooms being booked, so two concurrent requests for the
+# same room cannot both pass the check:
+#
+#   Postgres  pg_advisory_xact_lock per room number (sorted, so two bookings
+#             of overlapping room sets cannot deadlock); row locks would not
+#             stop a concurrent INSERT of a new overlapping row.
+#   SQLite    BEGIN IMMEDIATE, i.e. the database write lock up front.
+#   others    SELECT ... FOR UPDATE on the Room rows.
+#
+# The check itself is an indexed range predicate on the typed stay columns
+# (room_number, arrival_on < end, departure_on > start).  A conflict raises
+# BookingConflict straight away; a lock that cannot be had within
+# ROOM_BOOKING_LOCK_TIMEOUT raises BookingBusy.
+#
+#   flask hotel stress-bookings --threads 16 --bookings 2000
+#
+# hammers the booking path with concurrent overlapping requests and verifies
+# afterwards that no room ended up double-booked.
+import random
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+import click
+from sqlalchemy import and_, case, delete, exists, func, insert, literal, or_, select, text, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import aliased
+
+from application.settings.setup import app
+from application.database.user.user_db import db
+from application.database.hotel_db.hotel import (
+    Room, Reservation, Group_Reservation, MONEY_FIELDS, PARSERS, parse_stay
+)
+from application.room_view.availability import RESERVATION_MODELS, hotel_cli, room_numbers, rooms_changed
+
+app.config.setdefault("ROOM_BOOKING_LOCK_TIMEOUT", 5)   # seconds
+app.config.setdefault("ROOM_GROUP_MAX_ROOMS", 200)
+
+LOCK_NAMESPACE = 7301        # first key of the two-key advisory locks
+TYPE_LOCK_NAMESPACE = 7302   # group allocations also lock their room types
+
+
+class BookingConflict(Exception):
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        first = conflicts[0]
+        super().__init__(
+            f"Room {first['room_number']} is already booked from {first['arrival_on']} "
+            f"to {first['departure_on']}"
+        )
+
+
+class BookingBusy(Exception):
+    pass
+
+
+class NotEnoughRooms(Exception):
+    def __init__(self, shortfall):
+        self.shortfall = shortfall
+        super().__init__("Not enough free rooms: " + ", ".join(
+            f"{missing} more {room_type}" for room_type, missing in sorted(shortfall.items())
+        ))
+
+
+def inactive_statuses():
+    return tuple(app.config["ROOM_INACTIVE_STATUSES"])
+
+
+def active(model):
+    return func.lower(func.trim(func.coalesce(model.status, ""))).notin_(inactive_statuses())
+
+
+def lock_rooms(numbers, namespace=LOCK_NAMESPACE):
+    """Lock `numbers` for the rest of the current transaction."""
+    connection = db.session.connection()
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        # pysqlite only opens a transaction on the first write; if one is
+        # already open this connection holds the write lock anyway
+        if not connection.connection.dbapi_connection.in_transaction:
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+    elif dialect == "postgresql":
+        timeout_ms = int(app.config["ROOM_BOOKING_LOCK_TIMEOUT"] * 1000)
+        connection.exec_driver_sql(f"SET LOCAL lock_timeout = {timeout_ms}")
+        for number in sorted(set(numbers)):
+            connection.execute(
+                text("SELECT pg_advisory_xact_lock(:namespace, hashtext(:room))"),
+                {"namespace": namespace, "room": number},
+            )
+    elif numbers:
+        column = Room.room_number if namespace == LOCK_NAMESPACE else Room.room_type
+        db.session.execute(select(Room.id).where(column.in_(numbers)).with_for_update())
+
+
+def find_conflicts(numbers, start, end, exclude=None):
+    """Active stays in any of `numbers` overlapping [start, end)."""
+    numbers = set(numbers)
+    conflicts = []
+    for model in RESERVATION_MODELS:
+        overlapping = and_(model.arrival_on < end, model.departure_on > start, active(model))
+        query = select(model.id, model.room_number, model.arrival_on, model.departure_on).where(
+            overlapping, model.room_number.in_(numbers)
+        )
+        if model is Group_Reservation:
+            # older group rows list several rooms in one field
+            query = query.union_all(
+                select(model.id, model.room_number, model.arrival_on, model.departure_on)
+                .where(overlapping, model.room_number.contains(","))
+            )
+        for rid, number, arrival_on, departure_on in db.session.execute(query):
+            if exclude is not None and (model, rid) == exclude:
+                continue
+            for n in set(room_numbers(number)) & numbers:
+                conflicts.append({
+                    "reservation_id": rid,
+                    "group": model is Group_Reservation,
+                    "room_number": n,
+                    "arrival_on": arrival_on.isoformat(),
+                    "departure_on": departure_on.isoformat(),
+                })
+    return conflicts
+
+
+def _is_lock_error(error):
+    message = str(getattr(error, "orig", error)).lower()
+    return "locked" in message or "lock timeout" in message or "lock_timeout" in message
+
+
+def create_reservation(model, fields, user_id=None):
+    """Insert a Reservation / Group_Reservation after checking its rooms are
+    free; commits.  Raises ValueError, BookingConflict or BookingBusy."""
+    arrival_on, departure_on, _, _ = parse_stay(
+        fields.get("arrival_date"), fields.get("night"), fields.get("checkin_time"), fields.get("checkout_time")
+    )
+    if arrival_on is None:
+        raise ValueError("arrival_date must be a date (YYYY-MM-DD)")
+    numbers = room_numbers(fields.get("room_number"))
+    known = set(db.session.execute(select(Room.room_number).where(Room.room_number.in_(numbers))).scalars())
+    unknown = sorted(set(numbers) - known)
+    if unknown:
+        raise ValueError(f"Unknown room number(s): {', '.join(unknown)}")
+    reservation = model(created_by_id=user_id, **fields)
+
+    # everything left in the session belongs to the caller's earlier work
+    db.session.commit()
+    try:
+        if numbers and (fields.get("status") or "").strip().lower() not in inactive_statuses():
+            lock_rooms(numbers)
+            conflicts = find_conflicts(numbers, arrival_on, departure_on)
+            if conflicts:
+                raise BookingConflict(conflicts)
+        db.session.add(reservation)
+        db.session.commit()
+    except OperationalError as e:
+        db.session.rollback()
+        if _is_lock_error(e):
+            raise BookingBusy("The rooms are being booked by another request, try again") from e
+        raise
+    except Exception:
+        db.session.rollback()
+        raise
+    return reservation
+
+
+# ---------------------------
+# Group allocations
+# ---------------------------
+def _occupied(model, start, end):
+    """EXISTS an active stay of `model` in Room's room during [start, end)."""
+    other = aliased(model)
+    same_room = other.room_number == Room.room_number
+    if model is Group_Reservation:
+        # legacy rows with several rooms: match ",<number>," in the normalised list
+        listed = literal(",") + func.replace(func.replace(func.replace(
+            other.room_number, " ", ","), ";", ","), "/", ",") + literal(",")
+        same_room = or_(same_room, and_(
+            other.room_number.contains(","), listed.contains(literal(",") + Room.room_number + literal(","))
+        ))
+    return exists().where(same_room, other.arrival_on < end, other.departure_on > start, active(other))
+
+
+def free_rooms_query(counts, start, end, excluded=()):
+    """Up to counts[type] free rooms of each type, picked in one statement
+    (floor by floor, so a group stays together)."""
+    out_of_service = tuple(app.config["ROOM_OUT_OF_SERVICE"])
+    ranked = (
+        select(
+            Room.room_number,
+            Room.room_type,
+            func.row_number().over(
+                partition_by=Room.room_type, order_by=(Room.floor, Room.room_number)
+            ).label("rank"),
+        )
+        .where(
+            Room.room_type.in_(counts),
+            Room.room_number.isnot(None),
+            Room.room_number.notin_(excluded),
+            func.lower(func.trim(func.coalesce(Room.status, ""))).notin_(out_of_service),
+            ~_occupied(Reservation, start, end),
+            ~_occupied(Group_Reservation, start, end),
+        )
+        .subquery()
+    )
+    return (
+        select(ranked.c.room_number, ranked.c.room_type)
+        .where(ranked.c.rank <= case(counts, value=ranked.c.room_type, else_=0))
+        .order_by(ranked.c.room_type, ranked.c.rank)
+    )
+
+
+def allocate_group(counts, fields, user_id=None, attempts=3):
+    """Book counts[type] rooms of each type for one group, all or nothing.
+
+    Returns (group_ref, [(id, room_number, room_type)]).  Raises ValueError,
+    NotEnoughRooms or BookingBusy.
+    """
+    counts = {str(room_type): int(n) for room_type, n in counts.items() if int(n) > 0}
+    if not counts:
+        raise ValueError("rooms must ask for at least one room")
+    if sum(counts.values()) > app.config["ROOM_GROUP_MAX_ROOMS"]:
+        raise ValueError(f"A group can book at most {app.config['ROOM_GROUP_MAX_ROOMS']} rooms")
+    arrival_on, departure_on, checkin_at, checkout_at = parse_stay(
+        fields.get("arrival_date"), fields.get("night"), fields.get("checkin_time"), fields.get("checkout_time")
+    )
+    if arrival_on is None:
+        raise ValueError("arrival_date must be a date (YYYY-MM-DD)")
+    group_ref = uuid.uuid4().hex
+
+    db.session.commit()
+    try:
+        # SQLite: the write lock, before looking.  Postgres: group bookings
+        # of the same room types queue up; single bookings are caught by the
+        # per-room re-check below
+        lock_rooms(sorted(counts), TYPE_LOCK_NAMESPACE)
+        excluded = set()
+        for _ in range(attempts):
+            chosen = db.session.execute(free_rooms_query(counts, arrival_on, departure_on, excluded)).all()
+            found = Counter(room_type for _, room_type in chosen)
+            shortfall = {t: n - found[t] for t, n in counts.items() if found[t] < n}
+            if shortfall:
+                raise NotEnoughRooms(shortfall)
+            numbers = [number for number, _ in chosen]
+            lock_rooms(numbers)
+            taken = {c["room_number"] for c in find_conflicts(numbers, arrival_on, departure_on)}
+            if not taken:
+                break
+            excluded |= taken   # booked by a single reservation meanwhile
+        else:
+            raise BookingBusy("The rooms are being booked by other requests, try again")
+
+        shared = dict(
+            fields,
+            group_ref=group_ref,
+            created_by_id=user_id,
+            status=fields.get("status") or "booked",
+            arrival_on=arrival_on,
+            departure_on=departure_on,
+            checkin_at=checkin_at,
+            checkout_at=checkout_at,
+        )
+        # a Core insert skips sync_money: fill the typed money columns here
+        for name, typed in MONEY_FIELDS["Group_Reservation"]:
+            shared[typed] = PARSERS[typed](fields.get(name))
+        allocation = db.session.execute(
+            insert(Group_Reservation).returning(
+                Group_Reservation.id, Group_Reservation.room_number, Group_Reservation.room_type
+            ),
+            [dict(shared, room_number=number, room_type=room_type) for number, room_type in chosen],
+        ).all()
+        rooms_changed(db.session)
+        db.session.commit()
+    except OperationalError as e:
+        db.session.rollback()
+        if _is_lock_error(e) or "deadlock" in str(e).lower():
+            raise BookingBusy("The rooms are being booked by other requests, try again") from e
+        raise
+    except Exception:
+        db.session.rollback()
+        raise
+    return group_ref, [tuple(row) for row in allocation]
+
+
+def release_group(group_ref):
+    """Cancel every room of a group in one statement; returns the count."""
+    result = db.session.execute(
+        update(Group_Reservation)
+        .where(Group_Reservation.group_ref == group_ref, active(Group_Reservation))
+        .values(status="cancelled")
+        .execution_options(synchronize_session=False)
+    )
+    rooms_changed(db.session)
+    db.session.commit()
+    return result.rowcount
+
+
+# ---------------------------
+# CLI:  flask hotel stress-bookings
+# ---------------------------
+STRESS_PREFIX = "STRESS-"
+
+
+def double_bookings(prefix=STRESS_PREFIX):
+    """[(room, stay, stay)] pairs of active stays that overlap."""
+    stays = defaultdict(list)
+    for model in RESERVATION_MODELS:
+        rows = db.session.execute(
+            select(model.room_number, model.arrival_on, model.departure_on)
+            .where(model.room_number.like(prefix + "%"), active(model))
+        )
+        for number, arrival_on, departure_on in rows:
+            for n in room_numbers(number):
+                stays[n].append((arrival_on, departure_on))
+    overlaps = []
+    for number, spans in stays.items():
+        spans.sort()
+        longest = spans[0]   # the earlier stay reaching furthest
+        for span in spans[1:]:
+            if span[0] < longest[1]:
+                overlaps.append((number, longest, span))
+            if span[1] > longest[1]:
+                longest = span
+    return overlaps
+
+
+def _cleanup_stress(prefix=STRESS_PREFIX):
+    for model in RESERVATION_MODELS:
+        db.session.execute(delete(model).where(model.room_number.like(prefix + "%")))
+    db.session.execute(delete(Room).where(Room.room_number.like(prefix + "%")))
+    db.session.commit()
+
+
+@hotel_cli.command("stress-bookings")
+@click.option("--threads", type=int, default=16)
+@click.option("--bookings", type=int, default=2000, help="Total booking attempts.")
+@click.option("--rooms", type=int, default=20, help="Scratch rooms to fight over.")
+@click.option("--days", type=int, default=60, help="Length of the booking calendar.")
+@click.option("--keep", is_flag=True, help="Leave the scratch rooms and bookings in place.")
+def stress_command(threads, bookings, rooms, days, keep):
+    """Concurrent overlapping bookings against scratch rooms, then an overlap audit."""
+    _cleanup_stress()
+    numbers = [f"{STRESS_PREFIX}{i}" for i in range(rooms)]
+    db.session.execute(insert(Room), [{"room_number": n, "room_type": "stress", "status": "ready"} for n in numbers])
+    db.session.commit()
+
+    outcomes = Counter()
+    latencies = []
+    lock = threading.Lock()
+    base = date.today() + timedelta(days=3650)   # far from real bookings
+    per_thread = [bookings // threads + (i < bookings % threads) for i in range(threads)]
+
+    def run(count, seed):
+        rng = random.Random(seed)
+        with app.app_context():
+            for _ in range(count):
+                arrival = base + timedelta(days=rng.randrange(days))
+                fields = {
+                    "room_number": rng.choice(numbers),
+                    "room_type": "stress",
+                    "arrival_date": arrival.isoformat(),
+                    "night": str(rng.randint(1, 4)),
+                    "status": "booked",
+                }
+                started = time.perf_counter()
+                try:
+                    create_reservation(Reservation, fields)
+                    outcome = "booked"
+                except BookingConflict:
+                    outcome = "conflict"
+                except BookingBusy:
+                    outcome = "busy"
+                except Exception as e:
+                    outcome = f"error: {e.__class__.__name__}"
+                elapsed = time.perf_counter() - started
+                with lock:
+                    outcomes[outcome] += 1
+                    latencies.append(elapsed)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=run, args=(n, i)) for i, n in enumerate(per_thread)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    overlaps = double_bookings()
+    for outcome, count in sorted(outcomes.items()):
+        click.echo(f"{outcome:<20} {count}")
+    click.echo(
+        f"{sum(outcomes.values())} attempts in {elapsed:.2f}s "
+        f"({sum(outcomes.values()) / elapsed:.0f}/s, {outcomes['booked'] / elapsed:.0f} bookings/s); "
+        f"p50 {latencies[len(latencies) // 2] * 1000:.1f}ms, "
+        f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms"
+    )
+    click.echo(f"double bookings: {len(overlaps)}")
+    for number, before, after in overlaps[:10]:
+        click.echo(f"  {number}: {before} / {after}")
+    if not keep:
+        _cleanup_stress()
+    if overlaps:
+        raise SystemExit(1)
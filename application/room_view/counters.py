@@ -0,0 +1,322 @@
+# application/room_view/counters.py
+#
+# Live room counts for the front-desk dashboard.
+#
+# Each worker keeps, in memory, how many rooms there are per value of
+# occupancy_state, maintanace_state, status, floor and room_type.  Room
+# writes made through the ORM are turned into deltas when their session
+# commits (never on flush, so rolled-back changes are not counted) and
+# applied under a version number.  Writes made by other workers, or with
+# Core statements, are picked up by a reconciliation: at most every
+# ROOM_COUNTERS_RECONCILE seconds one GROUP BY per dimension is compared
+# with the counters and any difference is published as a delta too.  A
+# reconciliation that overlaps a local room write (flushed, not yet
+# applied) is thrown away and retried, so that write isn't counted twice.
+#
+# /room/dashboard returns a snapshot; /room/dashboard/stream is a
+# server-sent-events stream of deltas.  The last ROOM_COUNTERS_HISTORY
+# deltas are kept, so a reconnecting EventSource (Last-Event-ID) gets what
+# it missed rather than a new snapshot.  Each open stream holds a worker
+# thread, so a worker serves at most ROOM_COUNTERS_MAX_STREAMS of them (more
+# get 503 with Retry-After: poll /room/dashboard meanwhile) and ends each
+# after ROOM_COUNTERS_STREAM_SECONDS; the EventSource reconnects on its own
+# and resumes from Last-Event-ID, possibly on a less busy worker.
+import json
+import os
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime
+
+from sqlalchemy import event, func, select
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import object_session
+
+from application.settings.setup import app
+from application.database.user.user_db import db
+from application.database.routing import RoutingSession
+from application.database.hotel_db.hotel import Room
+
+app.config.setdefault("ROOM_COUNTERS_RECONCILE", 60)
+app.config.setdefault("ROOM_COUNTERS_HEARTBEAT", 15)
+app.config.setdefault("ROOM_COUNTERS_HISTORY", 500)
+app.config.setdefault("ROOM_COUNTERS_MAX_STREAMS", 2)       # per worker; each holds a request thread
+app.config.setdefault("ROOM_COUNTERS_STREAM_SECONDS", 300)  # then the client reconnects
+
+DIMENSIONS = ("occupancy_state", "maintanace_state", "status", "floor", "room_type")
+
+
+def label(value):
+    return "" if value is None else str(value).strip()
+
+
+class RoomCounters:
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:8]   # versions are per worker; event ids carry this too
+        self.counts = None            # {dimension: {value: rooms}}, None until loaded
+        self.total = 0
+        self.version = 0
+        self.in_flight = 0            # transactions with flushed room writes not applied yet
+        self.reconciled_at = None
+        self._reconciled = 0.0
+        self._history = deque(maxlen=app.config["ROOM_COUNTERS_HISTORY"])
+        self._changed = threading.Condition()
+        self._reconciling = threading.Lock()
+
+    # ---------------------------
+    # Loading and reconciliation
+    # ---------------------------
+    def _load(self):
+        counts = {}
+        with db.engine.connect() as connection:   # the primary, never a lagging replica
+            total = connection.execute(select(func.count(Room.id))).scalar()
+            for dimension in DIMENSIONS:
+                column = getattr(Room, dimension)
+                counts[dimension] = Counter()
+                for value, rooms in connection.execute(select(column, func.count()).group_by(column)):
+                    counts[dimension][label(value)] += rooms
+        return counts, total
+
+    def reconcile(self, force=False):
+        """Compare with the table (when due) and publish any difference."""
+        due = time.monotonic() - self._reconciled >= app.config["ROOM_COUNTERS_RECONCILE"]
+        if not (force or due or self.counts is None):
+            return
+        if not self._reconciling.acquire(blocking=self.counts is None):
+            return   # another thread is already on it
+        try:
+            with self._changed:
+                seen, busy = self.version, self.in_flight
+            counts, total = self._load()
+            with self._changed:
+                if self.counts is None:
+                    self.counts, self.total = counts, total
+                elif self.version != seen or busy or self.in_flight:
+                    # a local commit may be both in the load and in a delta
+                    # applied before or after this; retry next time
+                    return
+                else:
+                    changes = {}
+                    for dimension in DIMENSIONS:
+                        delta = Counter(counts[dimension])
+                        delta.subtract(self.counts[dimension])
+                        delta = {value: n for value, n in delta.items() if n}
+                        if delta:
+                            changes[dimension] = delta
+                    if changes or total != self.total:
+                        self._publish(changes, total - self.total, reconciled=True)
+                self._reconciled = time.monotonic()
+                self.reconciled_at = datetime.utcnow()
+        finally:
+            self._reconciling.release()
+
+    # ---------------------------
+    # Deltas
+    # ---------------------------
+    def begin(self):
+        with self._changed:
+            self.in_flight += 1
+
+    def end(self):
+        with self._changed:
+            self.in_flight -= 1
+
+    def apply(self, changes, total=0):
+        with self._changed:
+            if self.counts is not None:   # otherwise the first load will include it
+                self._publish(changes, total)
+
+    def _publish(self, changes, total, reconciled=False):
+        for dimension, delta in changes.items():
+            counts = self.counts[dimension]
+            for value, n in delta.items():
+                counts[value] += n
+                if not counts[value]:
+                    del counts[value]
+        self.total += total
+        self.version += 1
+        self._history.append({
+            "version": self.version, "changes": changes, "total": total, "reconciled": reconciled,
+        })
+        self._changed.notify_all()
+
+    def forked(self):
+        # a worker forked from a preloaded master: same counts, but its
+        # versions diverge from here, so it must not share the epoch
+        self.epoch = uuid.uuid4().hex[:8]
+        self.in_flight = 0
+        self._history.clear()
+        self._changed = threading.Condition()
+        self._reconciling = threading.Lock()
+
+    def snapshot(self):
+        self.reconcile()
+        with self._changed:
+            return {
+                "version": self.version,
+                "total": self.total,
+                "counts": {dimension: dict(self.counts[dimension]) for dimension in DIMENSIONS},
+                "reconciled_at": self.reconciled_at.isoformat() if self.reconciled_at else None,
+            }
+
+    def since(self, version, timeout):
+        """Deltas after `version`, waiting up to `timeout` seconds for one;
+        None when they are no longer all in the history."""
+        with self._changed:
+            if version > self.version:
+                return None
+            self._changed.wait_for(lambda: self.version > version, timeout)
+            if self.version == version:
+                return []
+            if self._history[0]["version"] > version + 1:
+                return None
+            return [delta for delta in self._history if delta["version"] > version]
+
+    def event_id(self, version):
+        return f"{self.epoch}-{version}"
+
+
+counters = RoomCounters()
+os.register_at_fork(after_in_child=counters.forked)
+
+
+class StreamSlots:
+    """Open SSE streams in this worker, at most ROOM_COUNTERS_MAX_STREAMS."""
+
+    def __init__(self):
+        self.open = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self.open >= app.config["ROOM_COUNTERS_MAX_STREAMS"]:
+                return False
+            self.open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.open -= 1
+
+
+stream_slots = StreamSlots()
+
+
+# ---------------------------
+# Turning committed ORM writes into deltas
+# ---------------------------
+def _pending(target):
+    session = object_session(target)
+    if session is None:
+        return None
+    if not session.info.get("room_in_flight"):
+        # from the flush until the transaction ends, reconcile can't tell
+        # whether its load saw these writes
+        session.info["room_in_flight"] = True
+        counters.begin()
+    return session.info.setdefault("room_deltas", {})
+
+
+def _record(pending, values, sign):
+    for dimension, value in zip(DIMENSIONS, values):
+        delta = pending.setdefault(dimension, Counter())
+        delta[label(value)] += sign
+    pending["__total__"] = pending.get("__total__", 0) + sign
+
+
+def _after_insert(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        _record(pending, [getattr(target, d) for d in DIMENSIONS], 1)
+
+
+def _after_delete(mapper, connection, target):
+    pending = _pending(target)
+    if pending is not None:
+        state = sa_inspect(target)
+        _record(pending, [state.committed_state.get(d, getattr(target, d)) for d in DIMENSIONS], -1)
+
+
+def _after_update(mapper, connection, target):
+    pending = _pending(target)
+    if pending is None:
+        return
+    state = sa_inspect(target)
+    for dimension in DIMENSIONS:
+        history = state.attrs[dimension].history
+        if not history.has_changes():
+            continue
+        delta = pending.setdefault(dimension, Counter())
+        if history.deleted:
+            delta[label(history.deleted[0])] -= 1
+        delta[label(history.added[0] if history.added else None)] += 1
+
+
+def _after_commit(session):
+    pending = session.info.pop("room_deltas", None)
+    if pending:
+        total = pending.pop("__total__", 0)
+        changes = {d: {v: n for v, n in delta.items() if n} for d, delta in pending.items()}
+        changes = {d: delta for d, delta in changes.items() if delta}
+        if changes or total:
+            counters.apply(changes, total)
+
+
+event.listen(Room, "after_insert", _after_insert)
+event.listen(Room, "after_update", _after_update)
+event.listen(Room, "after_delete", _after_delete)
+for _dimension in DIMENSIONS:
+    # load the old value when the attribute is set, so the update has
+    # something to subtract from even if the row was expired
+    event.listen(getattr(Room, _dimension), "set", lambda *args: None, active_history=True)
+event.listen(RoutingSession, "after_commit", _after_commit)
+event.listen(RoutingSession, "after_rollback", lambda session: session.info.pop("room_deltas", None))
+
+
+def _after_transaction_end(session, transaction):
+    # after after_commit has applied the deltas (or a rollback or close)
+    if transaction.parent is None and session.info.pop("room_in_flight", False):
+        counters.end()
+
+
+event.listen(RoutingSession, "after_transaction_end", _after_transaction_end)
+
+
+# ---------------------------
+# Server-sent events
+# ---------------------------
+def sse(event_name, data, event_id=None):
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines.append(f"event: {event_name}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+def stream_counters(last_event_id=None, seconds=None):
+    """Generator for /room/dashboard/stream: a snapshot (unless the client
+    can resume from `last_event_id`), then deltas and keep-alive comments,
+    for `seconds` (ROOM_COUNTERS_STREAM_SECONDS)."""
+    deadline = time.monotonic() + (seconds or app.config["ROOM_COUNTERS_STREAM_SECONDS"])
+    counters.reconcile()
+    version = None
+    epoch, _, seen = (last_event_id or "").partition("-")
+    if epoch == counters.epoch and seen.isdigit() and counters.since(int(seen), 0) is not None:
+        version = int(seen)
+    yield "retry: 3000\n\n"
+    while True:
+        timeout = min(app.config["ROOM_COUNTERS_HEARTBEAT"], deadline - time.monotonic())
+        if timeout <= 0:
+            return   # frees the thread; the client resumes from its last event id
+        deltas = counters.since(version, timeout) if version is not None else None
+        if deltas is None:   # new client, or fell behind the history
+            snapshot = counters.snapshot()
+            version = snapshot["version"]
+            yield sse("snapshot", snapshot, counters.event_id(version))
+        elif not deltas:
+            yield ": keep-alive\n\n"
+        else:
+            for delta in deltas:
+                yield sse("delta", delta, counters.event_id(delta["version"]))
+            version = deltas[-1]["version"]
+        counters.reconcile()
@@ -0,0 +1,352 @@
+# application/room_view/pricing.py
+#
+# Room pricing over compiled rate tables.
+#
+# The base rate of every room type (Room_Type.base_rate) and every rate rule
+# are compiled into one float matrix: rates[type, day] over the nights from
+# PRICING_PAST_DAYS ago to PRICING_HORIZON_DAYS ahead, plus a running sum
+# along the days.  A stay [start, end) of type t then costs
+#
+#   cumulative[t, end] - cumulative[t, start]
+#
+# so a batch of quotes is priced with a handful of array operations: room
+# nights, extra beds (asked for, plus children over the type's max_kids, at
+# extra_bed_rate per night) and the booking's discount (a percentage, or a
+# fixed amount off the stay, as in the night audit).
+#
+# A type whose typed columns are still NULL (before `flask hotel
+# backfill-money`) is priced from its form fields; a type with no parseable
+# base price is left out, and quotes for it fail instead of costing 0.
+#
+# The tables are rebuilt after a local commit touching room types or rate
+# rules, and otherwise at most PRICING_TTL seconds after a change made by
+# another worker.
+import threading
+import time
+from datetime import date, timedelta
+
+import click
+import numpy as np
+from sqlalchemy import event, select
+from sqlalchemy.orm import object_session
+
+from application.settings.setup import app
+from application.database.user.user_db import db
+from application.database.routing import RoutingSession
+from application.database.hotel_db.hotel import (
+    Room_Type, Rate_Rule, parse_date, parse_money, parse_nights, is_percent
+)
+from application.room_view.availability import hotel_cli
+
+app.config.setdefault("PRICING_TTL", 60)
+app.config.setdefault("PRICING_PAST_DAYS", 31)
+app.config.setdefault("PRICING_HORIZON_DAYS", 730)
+app.config.setdefault("PRICING_MAX_QUOTES", 1000)
+
+RULE_KINDS = ("override", "percent", "fixed")
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+
+def weekday_mask(days):
+    """Bit mask from [0..6], ["fri", "sat"] or "fri,sat"; None for every day."""
+    if isinstance(days, str):
+        days = [day for day in days.split(",") if day.strip()]
+    if not days:
+        return None
+    mask = 0
+    for day in days:
+        name = str(day).strip().lower()[:3]
+        index = day if isinstance(day, int) else WEEKDAYS.index(name) if name in WEEKDAYS else -1
+        if not 0 <= index < 7:
+            raise ValueError(f"unknown weekday {day!r}")
+        mask |= 1 << index
+    return mask
+
+
+class RateTable:
+    def __init__(self, room_types, rules, first_day, days, unpriced=()):
+        """room_types: [(name, base_rate, extra_bed_rate, max_kids)];
+        rules: [(room_type, start_on, end_on, weekdays, kind, value)] in
+        the order they apply; unpriced: types left out for want of a rate."""
+        self.first_day = first_day
+        self.unpriced = frozenset(unpriced)
+        self.origin = first_day.toordinal()
+        self.days = days
+        self.types = [name for name, _, _, _ in room_types]
+        self.position = {name: i for i, name in enumerate(self.types)}
+        self.extra_bed = np.array([extra or 0.0 for _, _, extra, _ in room_types], dtype=np.float64)
+        self.max_kids = np.array([kids or 0 for _, _, _, kids in room_types], dtype=np.int64)
+
+        base = np.array([rate or 0.0 for _, rate, _, _ in room_types], dtype=np.float64)
+        self.rates = np.repeat(base[:, None], days, axis=1)
+        ordinals = np.arange(self.origin, self.origin + days)
+        weekday = (ordinals - 1) % 7   # ordinal 1 (0001-01-01) was a Monday
+        for room_type, start_on, end_on, weekdays, kind, value in rules:
+            if room_type is None:
+                rows = slice(None)
+            elif room_type in self.position:
+                rows = self.position[room_type]
+            else:
+                continue
+            columns = (ordinals >= start_on.toordinal()) & (ordinals < end_on.toordinal())
+            if weekdays:
+                columns &= ((weekdays >> weekday) & 1).astype(bool)
+            if kind == "override":
+                self.rates[rows, columns] = value
+            elif kind == "percent":
+                self.rates[rows, columns] *= 1 + value / 100
+            else:
+                self.rates[rows, columns] += value
+        np.maximum(self.rates, 0.0, out=self.rates)
+        self.cumulative = np.zeros((len(self.types), days + 1))
+        np.cumsum(self.rates, axis=1, out=self.cumulative[:, 1:])
+
+    @property
+    def last_day(self):
+        return self.first_day + timedelta(days=self.days)
+
+    def nightly(self, room_type, start, end):
+        t = self.position[room_type]
+        return np.round(self.rates[t, start.toordinal() - self.origin:end.toordinal() - self.origin], 2)
+
+    def quote(self, kinds, starts, ends, extra_beds, children, discount_percent, discount_value):
+        """Arrays in, arrays out: (nights, room, extras, discount, total)."""
+        s, e = starts - self.origin, ends - self.origin
+        nights = ends - starts
+        room = self.cumulative[kinds, e] - self.cumulative[kinds, s]
+        beds = extra_beds + np.maximum(children - self.max_kids[kinds], 0)
+        extras = beds * self.extra_bed[kinds] * nights
+        subtotal = room + extras
+        discount = np.where(discount_percent, subtotal * discount_value / 100, discount_value)
+        discount = np.clip(discount, 0.0, subtotal)
+        return nights, np.round(room, 2), np.round(extras, 2), np.round(discount, 2), np.round(subtotal - discount, 2)
+
+
+def load_rate_table():
+    today = date.today()
+    first_day = today - timedelta(days=app.config["PRICING_PAST_DAYS"])
+    days = app.config["PRICING_PAST_DAYS"] + app.config["PRICING_HORIZON_DAYS"]
+    room_types, unpriced, seen = [], set(), set()
+    rows = db.session.execute(
+        select(Room_Type.room_type, Room_Type.base_rate, Room_Type.extra_bed_rate, Room_Type.max_kids,
+               Room_Type.bace_price, Room_Type.extral_bed_price, Room_Type.kids_occupancy)
+        .order_by(Room_Type.id)
+    )
+    for name, base_rate, extra_bed_rate, max_kids, bace_price, extral_bed_price, kids_occupancy in rows:
+        if not name or name in seen:   # the first definition of a type wins
+            continue
+        seen.add(name)
+        # not backfilled yet: parse the form fields
+        if base_rate is None:
+            base_rate = parse_money(bace_price)
+        if extra_bed_rate is None:
+            extra_bed_rate = parse_money(extral_bed_price)
+        if max_kids is None:
+            max_kids = parse_nights(kids_occupancy)
+        if base_rate is None:
+            unpriced.add(name)
+            continue
+        room_types.append((
+            name,
+            float(base_rate),
+            float(extra_bed_rate) if extra_bed_rate is not None else None,
+            max_kids,
+        ))
+    rules = [
+        (room_type, start_on, end_on, weekdays, kind, float(value))
+        for room_type, start_on, end_on, weekdays, kind, value in db.session.execute(
+            select(Rate_Rule.room_type, Rate_Rule.start_on, Rate_Rule.end_on, Rate_Rule.weekdays,
+                   Rate_Rule.kind, Rate_Rule.value)
+            .where(Rate_Rule.end_on > first_day)
+            .order_by(Rate_Rule.priority, Rate_Rule.id)
+        )
+    ]
+    return RateTable(room_types, rules, first_day, days, unpriced)
+
+
+class RateTableCache:
+    def __init__(self):
+        self._table = None
+        self._built = 0.0
+        self._dirty = True
+        self._lock = threading.Lock()
+
+    def invalidate(self, *_):
+        self._dirty = True
+
+    def get(self):
+        ttl = app.config["PRICING_TTL"]
+        stale = self._table is not None and self._table.first_day != date.today() - timedelta(
+            days=app.config["PRICING_PAST_DAYS"])
+        if self._dirty or stale or time.monotonic() - self._built > ttl:
+            with self._lock:
+                if self._dirty or stale or time.monotonic() - self._built > ttl:
+                    self._dirty = False
+                    self._table = load_rate_table()
+                    self._built = time.monotonic()
+        return self._table
+
+
+rate_tables = RateTableCache()
+
+
+def _rates_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info["rates_changed"] = True
+
+
+def _after_commit(session):
+    if session.info.pop("rates_changed", False):
+        rate_tables.invalidate()
+
+
+for _model in (Room_Type, Rate_Rule):
+    for _event in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _event, _rates_changed)
+event.listen(RoutingSession, "after_commit", _after_commit)
+event.listen(RoutingSession, "after_rollback", lambda session: session.info.pop("rates_changed", None))
+
+
+# ---------------------------
+# Quotes
+# ---------------------------
+def _count(value, name):
+    if value in (None, ""):
+        return 0
+    count = int(value)
+    if count < 0:
+        raise ValueError(f"{name} cannot be negative")
+    return count
+
+
+def quote_stays(requests, breakdown=False):
+    """Price a list of {room_type, start, end | nights, children,
+    extra_beds, discount_type, discount_value}.  Returns one dict per
+    request, in order; a request that cannot be priced gets an "error"."""
+    table = rate_tables.get()
+    results = [None] * len(requests)
+    valid, columns = [], ([], [], [], [], [], [], [])
+    for i, item in enumerate(requests):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError("each quote must be an object")
+            room_type = item.get("room_type")
+            if room_type in table.unpriced:
+                raise ValueError(f"no rate for room type {room_type!r}")
+            if room_type not in table.position:
+                raise ValueError(f"unknown room type {room_type!r}")
+            start = parse_date(item.get("start") or item.get("arrival_date"))
+            if start is None:
+                raise ValueError("start must be a date (YYYY-MM-DD)")
+            if item.get("end"):
+                end = parse_date(item.get("end"))
+                if end is None:
+                    raise ValueError("end must be a date (YYYY-MM-DD)")
+            else:
+                end = start + timedelta(days=_count(item.get("nights") or item.get("night") or 1, "nights"))
+            if end <= start:
+                raise ValueError("end must be after start")
+            if start < table.first_day or end > table.last_day:
+                raise ValueError(f"rates are only known from {table.first_day} to {table.last_day}")
+            discount = parse_money(item.get("discount_value"))
+            values = (
+                table.position[room_type], start.toordinal(), end.toordinal(),
+                _count(item.get("extra_beds"), "extra_beds"), _count(item.get("children"), "children"),
+                is_percent(item.get("discount_type")), float(discount) if discount is not None else 0.0,
+            )
+        except (ValueError, TypeError) as e:
+            results[i] = {"error": str(e)}
+            continue
+        valid.append(i)
+        for column, value in zip(columns, values):
+            column.append(value)
+
+    if valid:
+        kinds, starts, ends, beds, children, percent, discount = (np.array(c) for c in columns)
+        priced = table.quote(
+            kinds.astype(np.int64), starts.astype(np.int64), ends.astype(np.int64),
+            beds.astype(np.int64), children.astype(np.int64), percent.astype(bool), discount.astype(np.float64),
+        )
+        for n, i in enumerate(valid):
+            nights, room, extras, discount_amount, total = (float(a[n]) for a in priced)
+            start = date.fromordinal(int(starts[n]))
+            results[i] = {
+                "room_type": table.types[kinds[n]],
+                "start": start.isoformat(),
+                "end": date.fromordinal(int(ends[n])).isoformat(),
+                "nights": int(nights),
+                "room": room,
+                "extras": extras,
+                "discount": discount_amount,
+                "total": total,
+            }
+            if breakdown:
+                rates = table.nightly(table.types[kinds[n]], start, date.fromordinal(int(ends[n])))
+                results[i]["nightly"] = [float(r) for r in rates]
+    return results
+
+
+def rate_calendar(start, end, room_type=None):
+    """{room_type: [rate per night]} for the nights in [start, end)."""
+    table = rate_tables.get()
+    if start < table.first_day or end > table.last_day:
+        raise ValueError(f"rates are only known from {table.first_day} to {table.last_day}")
+    types = [room_type] if room_type else table.types
+    unknown = [t for t in types if t not in table.position]
+    if unknown and unknown[0] in table.unpriced:
+        raise ValueError(f"no rate for room type {unknown[0]!r}")
+    if unknown:
+        raise ValueError(f"unknown room type {unknown[0]!r}")
+    return {t: [float(r) for r in table.nightly(t, start, end)] for t in types}
+
+
+# ---------------------------
+# CLI:  flask hotel quote-bench
+# ---------------------------
+@hotel_cli.command("quote-bench")
+@click.option("--quotes", type=int, default=10000)
+def quote_bench_command(quotes):
+    """Batch pricing against pricing each stay one night at a time."""
+    table = load_rate_table()
+    if not table.types:
+        click.echo("No room types with prices")
+        return
+    rng = np.random.default_rng(0)
+    today = date.today()
+    requests = []
+    for _ in range(quotes):
+        start = today + timedelta(days=int(rng.integers(0, 300)))
+        requests.append({
+            "room_type": table.types[int(rng.integers(len(table.types)))], "start": start.isoformat(),
+            "nights": int(rng.integers(1, 15)), "children": int(rng.integers(0, 3)),
+            "discount_type": "percent", "discount_value": "10",
+        })
+    rate_tables.invalidate()
+    rate_tables.get()
+    started = time.perf_counter()
+    batch = quote_stays(requests)
+    endpoint = time.perf_counter() - started
+
+    kinds = np.array([table.position[item["room_type"]] for item in requests], dtype=np.int64)
+    starts = np.array([date.fromisoformat(item["start"]).toordinal() for item in requests], dtype=np.int64)
+    ends = starts + np.array([item["nights"] for item in requests], dtype=np.int64)
+    children = np.array([item["children"] for item in requests], dtype=np.int64)
+    started = time.perf_counter()
+    table.quote(kinds, starts, ends, np.zeros(quotes, dtype=np.int64), children,
+                np.ones(quotes, dtype=bool), np.full(quotes, 10.0))
+    vectorized = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for item, quoted in zip(requests, batch):
+        t = table.position[item["room_type"]]
+        first = date.fromisoformat(item["start"]).toordinal() - table.origin
+        room = sum(table.rates[t, first + k] for k in range(item["nights"]))
+        extras = max(item["children"] - table.max_kids[t], 0) * table.extra_bed[t] * item["nights"]
+        total = round((room + extras) * 0.9, 2)
+        assert abs(total - quoted["total"]) < 0.02, (item, quoted)
+    looped = time.perf_counter() - started
+    click.echo(f"{quotes} quotes ({len(table.types)} types x {table.days} days of rates):")
+    click.echo(f"  quote_stays (validation + pricing) {endpoint * 1000:8.1f}ms")
+    click.echo(f"  vectorized pricing alone           {vectorized * 1000:8.1f}ms")
+    click.echo(f"  night-by-night loop                {looped * 1000:8.1f}ms")
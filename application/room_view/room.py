@@ -0,0 +1,379 @@
+from flask import Blueprint, jsonify, request, Response, stream_with_context
+from application.extensions.extensions import *
+from application.settings.setup import app
+from application.database.user.user_db import db
+from application.database.hotel_db.hotel import (
+    Room, Reservation, Group_Reservation, Rate_Rule, parse_date, parse_nights, parse_money
+)
+from application.room_view.availability import search_availability
+from application.room_view.booking import (
+    create_reservation, allocate_group, release_group, BookingConflict, BookingBusy, NotEnoughRooms
+)
+from application.room_view.blobs import blob_response, blob_presence
+from application.room_view.counters import counters, stream_counters, stream_slots
+from application.room_view.pricing import quote_stays, rate_calendar, weekday_mask, RULE_KINDS
+from application.room_view.audit import daily_report, summary_report, ALL_TYPES, PERIODS
+from flask_marshmallow import Marshmallow
+from datetime import timedelta
+import flask_praetorian
+
+
+room = Blueprint("room", __name__)
+
+ma = Marshmallow(app)
+
+# the booking form fields; the typed stay columns are derived from them
+RESERVATION_FIELDS = (
+    "guestname", "reservation_type", "country", "guest_language", "purpose",
+    "night", "arrival_date", "checkin_time", "checkout_time",
+    "number_of_adult", "number_of_children", "room_type", "room_number",
+    "rate", "rate_amount", "discount_type", "discount_value",
+    "payment_method", "status"
+)
+
+
+class ReservationSchema(ma.Schema):
+    class Meta:
+        fields = ("id",) + RESERVATION_FIELDS + (
+            "arrival_on", "departure_on", "checkin_at", "checkout_at", "created_by_id", "created_date"
+        )
+
+reservation_schema = ReservationSchema()
+reservations_schema = ReservationSchema(many=True)
+
+
+class RoomSchema(ma.Schema):
+    class Meta:
+        fields = (
+            "id", "room_number", "room_type", "floor", "duration", "occupied_by", "session", "type",
+            "maintanace_state", "occupancy_state", "assignee", "task", "status", "created_by_id"
+        )
+
+rooms_schema = RoomSchema(many=True)
+
+PICTURES = ("picture_one", "picture_two", "picture_three")
+
+
+class RateRuleSchema(ma.Schema):
+    class Meta:
+        fields = (
+            "id", "name", "room_type", "start_on", "end_on", "weekdays", "kind", "value", "priority",
+            "created_by_id", "created_date"
+        )
+
+rate_rule_schema = RateRuleSchema()
+rate_rules_schema = RateRuleSchema(many=True)
+
+
+def stay_window(args, max_days=366):
+    """(start, end) from ?start=&end= or ?start=&nights=; raises ValueError."""
+    start = parse_date(args.get("start"))
+    if start is None:
+        raise ValueError("start must be a date (YYYY-MM-DD)")
+    if args.get("end"):
+        end = parse_date(args.get("end"))
+        if end is None:
+            raise ValueError("end must be a date (YYYY-MM-DD)")
+    else:
+        end = start + timedelta(days=parse_nights(args.get("nights")) or 1)
+    if end <= start:
+        raise ValueError("end must be after start")
+    if (end - start).days > max_days:
+        raise ValueError(f"ranges are limited to {max_days} days")
+    return start, end
+
+
+@room.route("/rooms", methods=["GET"])
+@flask_praetorian.auth_required
+def get_rooms():
+    # pictures are deferred columns: the grid only learns which exist
+    try:
+        rooms = Room.query.order_by(Room.room_number).all()
+        pictures = blob_presence("room", [r.id for r in rooms])
+        results = rooms_schema.dump(rooms)
+        for result in results:
+            result["pictures"] = [
+                f"/room/{result['id']}/picture/{PICTURES.index(field) + 1}" for field in pictures[result["id"]]
+            ]
+        return jsonify(results), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@room.route("/<int:room_id>/picture/<int:number>", methods=["GET"])
+def get_room_picture(room_id, number):
+    if not 1 <= number <= len(PICTURES):
+        return jsonify({"error": "Pictures are numbered 1 to 3"}), 404
+    try:
+        return blob_response("room", room_id, PICTURES[number - 1])
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@room.route("/availability", methods=["GET"])
+@flask_praetorian.auth_required
+def room_availability():
+    try:
+        start, end = stay_window(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        room_type = request.args.get("room_type")
+        return jsonify({
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "nights": (end - start).days,
+            "room_types": search_availability(start, end, room_type),
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+def form_fields(data, exclude=()):
+    fields = {name: data[name] for name in RESERVATION_FIELDS if data.get(name) is not None and name not in exclude}
+    return {name: value if isinstance(value, str) else str(value) for name, value in fields.items()}
+
+
+def busy_response(e):
+    response = jsonify({"error": str(e)})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+
+def book(model):
+    fields = form_fields(request.get_json() or {})
+    try:
+        reservation = create_reservation(model, fields, flask_praetorian.current_user().id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except BookingConflict as e:
+        return jsonify({"error": str(e), "conflicts": e.conflicts}), 409
+    except BookingBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return reservation_schema.jsonify(reservation), 201
+
+
+@room.route("/reservation", methods=["POST"])
+@flask_praetorian.auth_required
+def add_reservation():
+    return book(Reservation)
+
+
+@room.route("/group_reservation", methods=["POST"])
+@flask_praetorian.auth_required
+def add_group_reservation():
+    return book(Group_Reservation)
+
+
+# ---------------------------
+# Group bookings: {"rooms": {"double": 10, "single": 4}, "arrival_date": ..., "night": ..., ...}
+# ---------------------------
+@room.route("/group_booking", methods=["POST"])
+@flask_praetorian.auth_required
+def add_group_booking():
+    data = request.get_json() or {}
+    counts = data.get("rooms")
+    if not isinstance(counts, dict):
+        return jsonify({"error": "rooms must map room types to counts"}), 400
+    try:
+        group_ref, allocation = allocate_group(
+            counts, form_fields(data, exclude=("room_type", "room_number")), flask_praetorian.current_user().id
+        )
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    except NotEnoughRooms as e:
+        return jsonify({"error": str(e), "shortfall": e.shortfall}), 409
+    except BookingBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    rooms = {}
+    for rid, number, room_type in allocation:
+        rooms.setdefault(room_type, []).append({"id": rid, "room_number": number})
+    return jsonify({"group_ref": group_ref, "room_count": len(allocation), "rooms": rooms}), 201
+
+
+@room.route("/group_booking/<group_ref>", methods=["GET"])
+@flask_praetorian.auth_required
+def get_group_booking(group_ref):
+    try:
+        rows = Group_Reservation.query.filter_by(group_ref=group_ref).order_by(Group_Reservation.id).all()
+        if not rows:
+            return jsonify({"error": "Group booking not found"}), 404
+        return jsonify({"group_ref": group_ref, "reservations": reservations_schema.dump(rows)}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@room.route("/group_booking/<group_ref>", methods=["DELETE"])
+@flask_praetorian.auth_required
+def delete_group_booking(group_ref):
+    try:
+        released = release_group(group_ref)
+        if not released and not Group_Reservation.query.filter_by(group_ref=group_ref).first():
+            return jsonify({"error": "Group booking not found"}), 404
+        return jsonify({"group_ref": group_ref, "released": released}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# ---------------------------
+# Pricing (application/room_view/pricing.py)
+# ---------------------------
+@room.route("/quotes", methods=["POST"])
+@flask_praetorian.auth_required
+def post_quotes():
+    # {"quotes": [{"room_type": "double", "start": "2025-05-01", "nights": 3,
+    #              "children": 1, "extra_beds": 0, "discount_type": "percent", "discount_value": 10}, ...]}
+    data = request.get_json() or {}
+    requests = data.get("quotes")
+    if not isinstance(requests, list) or not requests:
+        return jsonify({"error": "quotes must be a non-empty list"}), 400
+    if len(requests) > app.config["PRICING_MAX_QUOTES"]:
+        return jsonify({"error": f"at most {app.config['PRICING_MAX_QUOTES']} quotes per request"}), 400
+    try:
+        return jsonify({"quotes": quote_stays(requests, breakdown=bool(data.get("breakdown")))}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@room.route("/rates", methods=["GET"])
+@flask_praetorian.auth_required
+def get_rates():
+    try:
+        start, end = stay_window(request.args)
+        rates = rate_calendar(start, end, request.args.get("room_type"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"start": start.isoformat(), "end": end.isoformat(), "rates": rates}), 200
+
+
+@room.route("/rate_rules", methods=["GET"])
+@flask_praetorian.auth_required
+def get_rate_rules():
+    try:
+        rules = Rate_Rule.query.order_by(Rate_Rule.priority, Rate_Rule.id).all()
+        return jsonify(rate_rules_schema.dump(rules)), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@room.route("/rate_rules", methods=["POST"])
+@flask_praetorian.roles_required("admin")
+def add_rate_rule():
+    data = request.get_json() or {}
+    try:
+        start_on, end_on = stay_window({"start": data.get("start_on"), "end": data.get("end_on")}, max_days=3660)
+        if data.get("kind") not in RULE_KINDS:
+            raise ValueError(f"kind must be one of {', '.join(RULE_KINDS)}")
+        value = parse_money(data.get("value"))
+        if value is None:
+            raise ValueError("value must be a number")
+        rule = Rate_Rule(
+            name=data.get("name"),
+            room_type=data.get("room_type") or None,
+            start_on=start_on,
+            end_on=end_on,
+            weekdays=weekday_mask(data.get("weekdays")),
+            kind=data["kind"],
+            value=value,
+            priority=int(data.get("priority") or 0),
+            created_by_id=flask_praetorian.current_user().id,
+        )
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        db.session.add(rule)
+        db.session.commit()
+        return rate_rule_schema.jsonify(rule), 201
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@room.route("/rate_rules/<int:rule_id>", methods=["DELETE"])
+@flask_praetorian.roles_required("admin")
+def delete_rate_rule(rule_id):
+    try:
+        rule = db.session.get(Rate_Rule, rule_id)
+        if rule is None:
+            return jsonify({"error": "Rate rule not found"}), 404
+        db.session.delete(rule)
+        db.session.commit()
+        return jsonify({"deleted": rule_id}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# ---------------------------
+# Front-desk dashboard: live room counts (application/room_view/counters.py)
+# ---------------------------
+@room.route("/dashboard", methods=["GET"])
+@flask_praetorian.auth_required
+def get_dashboard():
+    try:
+        return jsonify(counters.snapshot()), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@room.route("/dashboard/stream", methods=["GET"])
+@flask_praetorian.auth_required
+def stream_dashboard():
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    if not stream_slots.acquire():
+        # every stream holds a thread; leave the rest to ordinary requests
+        return jsonify({"error": "Too many open dashboard streams, retry shortly"}), 503, {"Retry-After": "30"}
+    response = Response(stream_with_context(stream_counters(last_event_id)), mimetype="text/event-stream")
+    response.call_on_close(stream_slots.release)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"   # no proxy buffering of the stream
+    return response
+
+
+# ---------------------------
+# Revenue reports, read from the night audit (application/room_view/audit.py)
+# ---------------------------
+@room.route("/reports/daily", methods=["GET"])
+@flask_praetorian.roles_required("admin")
+def get_daily_report():
+    try:
+        start, end = stay_window(request.args, max_days=3660)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        room_type = request.args.get("room_type", ALL_TYPES)
+        return jsonify({
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "room_type": room_type,
+            "days": daily_report(start, end, room_type),
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@room.route("/reports/summary", methods=["GET"])
+@flask_praetorian.roles_required("admin")
+def get_summary_report():
+    try:
+        start, end = stay_window(request.args, max_days=3660)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    period = request.args.get("period", "month")
+    if period not in PERIODS:
+        return jsonify({"error": f"period must be one of {', '.join(PERIODS)}"}), 400
+    try:
+        room_type = request.args.get("room_type", ALL_TYPES)
+        return jsonify({
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "room_type": room_type,
+            "period": period,
+            "periods": summary_report(start, end, period, room_type),
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,178 @@
+# application/server/prefork.py
+#
+# State built once in the gunicorn master, before it forks its workers.
+#
+# With preload_app (gunicorn.conf.py) the app is imported by the master and
+# the workers are forked from it, so everything built at import -- models,
+# compiled serializers, schemas, regexes -- is shared copy-on-write instead
+# of being rebuilt per worker.  warm_all() runs the WARMERS below to do the
+# same for the caches that are otherwise filled on the first request:
+#
+#   minhash       the LSH tables of the near-duplicate index (read-mostly)
+#   similar       the memory-mapped similar-restaurants matrix
+#   availability  the room interval index
+#   rates         the per-date rate table
+#   room_counters the live room counters
+#   revocations   the revoked-token Bloom filter
+#
+# The TTL'd ones (availability, rates, counters, revocations) are rebuilt by
+# each worker once they expire, so what they save is the cold first
+# requests; the rest stay shared for the life of the worker.  The master
+# then freezes the GC (gc.freeze) so collections in the workers don't write
+# to the shared pages, and every worker drops the pooled connections it
+# inherited (after_fork).
+#
+# `flask server warmup` times the warmers; `flask server memory PID` shows
+# RSS, PSS and shared/private memory of a master and its workers.
+import gc
+import os
+import time
+
+import click
+from flask.cli import AppGroup
+
+from application.settings.setup import app
+from application.database.user.user_db import db
+
+WARMERS = []
+BOOT = {"started": time.monotonic(), "warmed": []}   # wsgi.py sets started before the app import
+
+
+def warmer(name):
+    def register(fn):
+        WARMERS.append((name, fn))
+        return fn
+    return register
+
+
+@warmer("minhash")
+def _minhash():
+    from application.moderation.minhash import minhash_index
+    minhash_index.sync()
+    return len(minhash_index)
+
+
+@warmer("similar")
+def _similar():
+    from application.recommendation.similar import similar_index
+    similar_index.load()
+    return len(similar_index.position)
+
+
+@warmer("availability")
+def _availability():
+    from application.room_view.availability import availability
+    availability.get()
+
+
+@warmer("rates")
+def _rates():
+    from application.room_view.pricing import rate_tables
+    rate_tables.get()
+
+
+@warmer("room_counters")
+def _room_counters():
+    from application.room_view.counters import counters
+    counters.reconcile(force=True)
+    return counters.total
+
+
+@warmer("revocations")
+def _revocations():
+    from application.user_view.revocation import revocations
+    revocations.rebuild()
+    return revocations.bloom.count
+
+
+def warm_all():
+    """Run every warmer; a failing one is reported and left to be built on
+    first use, as it would have been."""
+    report = []
+    for name, fn in WARMERS:
+        started = time.perf_counter()
+        try:
+            size = fn()
+            error = None
+        except Exception as e:
+            size, error = None, str(e)
+        report.append({"name": name, "ms": round((time.perf_counter() - started) * 1000, 1),
+                       "size": size, "error": error})
+    db.session.remove()   # no connection checked out across the fork
+    BOOT["warmed"] = report
+    BOOT["ready_ms"] = round((time.monotonic() - BOOT["started"]) * 1000, 1)
+    return report
+
+
+def freeze():
+    """Move everything built so far out of the GC's reach; call in the
+    master right before forking."""
+    gc.collect()
+    gc.freeze()
+    return gc.get_freeze_count()
+
+
+def after_fork():
+    """In a new worker: pooled connections belong to the master."""
+    for engine in db.engines.values():
+        engine.dispose(close=False)
+
+
+def memory(pid="self"):
+    """{rss, pss, shared, private} in MB from /proc (Linux)."""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as fh:
+            for line in fh:
+                key, _, value = line.partition(":")
+                if value.strip().endswith("kB"):
+                    fields[key] = int(value.split()[0])
+    except OSError:
+        return None
+    mb = lambda kb: round(kb / 1024, 1)
+    return {
+        "rss": mb(fields.get("Rss", 0)),
+        "pss": mb(fields.get("Pss", 0)),
+        "shared": mb(fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)),
+        "private": mb(fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)),
+    }
+
+
+def children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as fh:
+            return [int(child) for child in fh.read().split()]
+    except OSError:
+        return []
+
+
+# ---------------------------
+# CLI:  flask server warmup | memory
+# ---------------------------
+server_cli = AppGroup("server", help="Production server.")
+
+
+@server_cli.command("warmup")
+def warmup_command():
+    """What each worker would spend building the caches itself."""
+    for entry in warm_all():
+        status = entry["error"] or (f"{entry['size']} entries" if entry["size"] is not None else "ok")
+        click.echo(f"{entry['name']:<14} {entry['ms']:8.1f}ms  {status}")
+
+
+@server_cli.command("memory")
+@click.argument("pid", type=int)
+def memory_command(pid):
+    """Memory of a gunicorn master (PID) and its workers."""
+    rows = [("master", pid)] + [("worker", child) for child in children(pid)]
+    click.echo(f"{'':<7} {'pid':>7} {'rss':>8} {'pss':>8} {'shared':>8} {'private':>8}  (MB)")
+    for role, child in rows:
+        usage = memory(child)
+        if usage is None:
+            click.echo(f"{role:<7} {child:>7}  (not readable)")
+            continue
+        click.echo(f"{role:<7} {child:>7} {usage['rss']:8.1f} {usage['pss']:8.1f} "
+                   f"{usage['shared']:8.1f} {usage['private']:8.1f}")
+
+
+app.cli.add_command(server_cli)
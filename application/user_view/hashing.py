@@ -0,0 +1,22 @@
+# application/user_view/hashing.py
+#
+# What runs inside the password pool's processes (see passwords.py).  Kept
+# free of application imports so a pool process only loads passlib.
+import time
+
+from passlib.context import CryptContext
+
+_context = None
+
+
+def init(config):
+    """Pool initializer: the guard's CryptContext, from its to_string()."""
+    global _context
+    _context = CryptContext.from_string(config)
+
+
+def run(operation, *args):
+    """(result, seconds spent hashing) for hash / verify / verify_and_update."""
+    started = time.perf_counter()
+    result = getattr(_context, operation)(*args)
+    return result, time.perf_counter() - started
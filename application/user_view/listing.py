@@ -0,0 +1,192 @@
+# application/user_view/listing.py
+#
+# The admin user list (GET /user/get_users).
+#
+# Pages are keyset-paginated: ?cursor= is the opaque position after the last
+# row of the previous page (sort value + id), so page 1000 costs the same as
+# page 1 and rows inserted meanwhile don't shift later pages.  Sorting is on
+# indexed columns only (id, username, email; "-" for descending), with id as
+# the tie-breaker.
+#
+# Filters: role (comma list), is_active, the subscription flags
+# (premium_listing=yes, sponsored_ads=pending, ...; "none" for unset) and
+# username_prefix (case-sensitive, an index range).
+#
+# Only the listed columns are loaded; feedbacks are loaded (one batched
+# query) only with ?include=feedbacks, and can't be loaded lazily otherwise.
+#
+# The total for a filter is counted at most every USER_COUNT_TTL seconds
+# and cached; a commit that adds or removes users, or changes a filtered
+# column, clears the cache of that worker.
+import base64
+import binascii
+import json
+import threading
+import time
+
+from sqlalchemy import event, func, tuple_
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import lazyload, load_only, object_session, raiseload, selectinload
+
+from application.settings.setup import app
+from application.database.user.user_db import db, User, Feedback
+from application.database.routing import RoutingSession
+
+app.config.setdefault("USER_LIST_LIMIT", 50)
+app.config.setdefault("USER_LIST_MAX_LIMIT", 200)
+app.config.setdefault("USER_COUNT_TTL", 60)
+app.config.setdefault("USER_COUNT_ENTRIES", 256)
+
+SORTS = {"id": User.id, "username": User.username, "email": User.email}
+FLAGS = ("premium_listing", "normal_listing", "sponsored_ads", "premium_analytics",
+         "review_contest", "subscription")
+FILTERED = ("role", "is_active") + FLAGS
+INCLUDES = ("feedbacks",)
+TRUE, FALSE = ("1", "true", "yes"), ("0", "false", "no")
+
+
+# ---------------------------
+# Request parsing
+# ---------------------------
+def parse_filters(args):
+    """{name: value} of the filters in `args`; raises ValueError."""
+    filters = {}
+    if args.get("role"):
+        filters["role"] = tuple(sorted({r.strip() for r in args["role"].split(",") if r.strip()}))
+    if args.get("is_active"):
+        value = args["is_active"].lower()
+        if value not in TRUE + FALSE:
+            raise ValueError("is_active must be true or false")
+        filters["is_active"] = value in TRUE
+    for flag in FLAGS:
+        if args.get(flag):
+            filters[flag] = args[flag]
+    if args.get("username_prefix"):
+        filters["username_prefix"] = args["username_prefix"]
+    return filters
+
+
+def apply_filters(query, filters):
+    for name, value in filters.items():
+        if name == "role":
+            query = query.filter(User.role.in_(value))
+        elif name == "is_active":
+            # rows written before the default existed have NULL: active
+            query = query.filter(User.is_active.is_(False) if not value else
+                                 (User.is_active.is_(True) | User.is_active.is_(None)))
+        elif name == "username_prefix":
+            query = query.filter(User.username >= value, User.username < value + "\uffff")
+        else:
+            column = getattr(User, name)
+            query = query.filter(column.is_(None) if value.lower() == "none" else column == value)
+    return query
+
+
+def parse_sort(value):
+    value = value or "id"
+    descending = value.startswith("-")
+    name = value.lstrip("-")
+    if name not in SORTS:
+        raise ValueError(f"sort must be one of {', '.join(SORTS)} (prefix - for descending)")
+    return name, descending
+
+
+def encode_cursor(sort, user):
+    payload = [sort, getattr(user, sort), user.id]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        name, value, last_id = json.loads(raw)
+    except (ValueError, TypeError, binascii.Error):
+        raise ValueError("Invalid cursor")
+    if name != sort or not isinstance(last_id, int):
+        raise ValueError("Cursor belongs to another sort order")
+    return value, last_id
+
+
+# ---------------------------
+# Counts
+# ---------------------------
+class UserCountCache:
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self, *_):
+        with self._lock:
+            self._counts.clear()
+
+    def get(self, filters):
+        key = tuple(sorted(filters.items()))
+        now = time.monotonic()
+        with self._lock:
+            cached = self._counts.get(key)
+        if cached is not None and now - cached[1] < app.config["USER_COUNT_TTL"]:
+            return cached[0]
+        total = apply_filters(db.session.query(func.count(User.id)), filters).scalar()
+        with self._lock:
+            if len(self._counts) >= app.config["USER_COUNT_ENTRIES"]:
+                self._counts.pop(next(iter(self._counts)))
+            self._counts[key] = (total, now)
+        return total
+
+
+user_counts = UserCountCache()
+
+
+def _users_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info["users_changed"] = True
+
+
+def _user_updated(mapper, connection, target):
+    # logins stamp last_login on every request; only filtered columns matter
+    state = sa_inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in FILTERED + ("username",)):
+        _users_changed(mapper, connection, target)
+
+
+def _after_commit(session):
+    if session.info.pop("users_changed", False):
+        user_counts.invalidate()
+
+
+event.listen(User, "after_insert", _users_changed)
+event.listen(User, "after_delete", _users_changed)
+event.listen(User, "after_update", _user_updated)
+event.listen(RoutingSession, "after_commit", _after_commit)
+event.listen(RoutingSession, "after_rollback", lambda session: session.info.pop("users_changed", None))
+
+
+# ---------------------------
+# Listing
+# ---------------------------
+def list_users(filters, sort="id", descending=False, cursor=None, limit=None, include=(), columns=()):
+    """(users, next_cursor).  `columns` are the User attributes to load."""
+    limit = min(max(limit or app.config["USER_LIST_LIMIT"], 1), app.config["USER_LIST_MAX_LIMIT"])
+    column = SORTS[sort]
+    query = apply_filters(User.query, filters)
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort)
+        if sort == "id":
+            query = query.filter(User.id < last_id if descending else User.id > last_id)
+        else:
+            position = tuple_(column, User.id)
+            query = query.filter(position < tuple_(value, last_id) if descending else position > tuple_(value, last_id))
+    order = [column.desc(), User.id.desc()] if descending else [column, User.id]
+    if sort == "id":
+        order = order[:1]
+
+    options = [load_only(*[getattr(User, name) for name in columns])]
+    if "feedbacks" in include:
+        options.append(selectinload(User.feedbacks).options(lazyload(Feedback.restaurant), lazyload(Feedback.user)))
+    else:
+        options.append(raiseload(User.feedbacks))
+    rows = query.options(*options).order_by(*order).limit(limit + 1).all()
+    users = rows[:limit]
+    next_cursor = encode_cursor(sort, users[-1]) if len(rows) > limit else None
+    return users, next_cursor
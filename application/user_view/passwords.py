@@ -0,0 +1,250 @@
+# application/user_view/passwords.py
+#
+# Password hashing off the request thread.
+#
+# install_password_pool(guard) swaps the guard's passlib CryptContext for a
+# proxy that sends hash / verify / verify_and_update to a small process pool
+# (PASSWORD_POOL_WORKERS processes; 0 hashes inline as before).  Everything
+# in flask_praetorian that hashes -- hash_password, authenticate,
+# verify_and_update -- goes through it unchanged, and the hashes are the
+# same, so existing passwords keep working.
+#
+# The waiting thread only blocks on a future, so the rest of the worker
+# keeps serving while a burst of logins or sign-ups is hashed elsewhere.
+# At most PASSWORD_POOL_MAX_PENDING operations may be queued or running per
+# worker process; past that, and after PASSWORD_POOL_TIMEOUT seconds, the
+# request gets a 503 with Retry-After instead of piling up.
+#
+# GET /user/password_pool (admin) shows queue wait and hash time per
+# operation for this process.
+#
+# Pool processes start from a fork server and import only hashing.py, plus
+# the entry script as multiprocessing always does: the flask and gunicorn
+# entry points are import-safe, `python app.py` loads the app once per pool
+# process.
+import multiprocessing
+import os
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import click
+from flask import jsonify
+from flask.cli import AppGroup
+
+from application.settings.setup import app
+from application.user_view import hashing
+
+app.config.setdefault("PASSWORD_POOL_WORKERS", min(4, os.cpu_count() or 1))
+app.config.setdefault("PASSWORD_POOL_MAX_PENDING", 32)
+app.config.setdefault("PASSWORD_POOL_TIMEOUT", 10)
+app.config.setdefault("PASSWORD_POOL_START_METHOD",
+                      "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+app.config.setdefault("PASSWORD_POOL_SAMPLES", 1000)   # latencies kept per operation
+
+
+class PasswordPoolBusy(Exception):
+    """Too many hashes queued, or one took longer than the timeout."""
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else None
+
+
+class PasswordPool:
+    def __init__(self):
+        self.config = None
+        self.pending = 0
+        self.counters = Counter()
+        self._samples = {}
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # one pool per worker process, created on first use (after any fork)
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ProcessPoolExecutor(
+                max_workers=app.config["PASSWORD_POOL_WORKERS"],
+                mp_context=multiprocessing.get_context(app.config["PASSWORD_POOL_START_METHOD"]),
+                initializer=hashing.init,
+                initargs=(self.config,),
+            )
+            self._pid = os.getpid()
+        return self._executor
+
+    def _record(self, operation, wait, compute):
+        samples = self._samples.get(operation)
+        if samples is None:
+            samples = self._samples[operation] = deque(maxlen=app.config["PASSWORD_POOL_SAMPLES"])
+        samples.append((wait, compute))
+        self.counters[operation] += 1
+
+    def run(self, context, operation, *args):
+        if not app.config["PASSWORD_POOL_WORKERS"]:
+            started = time.perf_counter()
+            result = getattr(context, operation)(*args)
+            with self._lock:
+                self.counters["inline"] += 1
+                self._record(operation, 0.0, time.perf_counter() - started)
+            return result
+
+        with self._lock:
+            if self.pending >= app.config["PASSWORD_POOL_MAX_PENDING"]:
+                self.counters["rejected"] += 1
+                raise PasswordPoolBusy("Too many logins at once, try again shortly")
+            self.pending += 1
+            executor = self._pool()
+        started = time.perf_counter()
+        try:
+            future = executor.submit(hashing.run, operation, *args)
+            result, compute = future.result(timeout=app.config["PASSWORD_POOL_TIMEOUT"])
+        except FuturesTimeout:
+            future.cancel()
+            with self._lock:
+                self.counters["timeouts"] += 1
+            raise PasswordPoolBusy("Password check timed out, try again shortly")
+        except BrokenProcessPool:
+            # a pool process died (OOM killer, ...): start a new pool next time
+            with self._lock:
+                self.counters["broken"] += 1
+                if self._executor is executor:
+                    self._executor = None
+            raise PasswordPoolBusy("Password check failed, try again shortly")
+        finally:
+            with self._lock:
+                self.pending -= 1
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._record(operation, max(elapsed - compute, 0.0), compute)
+        return result
+
+    def snapshot(self):
+        with self._lock:
+            operations = {}
+            for operation, samples in self._samples.items():
+                waits = [round(w * 1000, 2) for w, _ in samples]
+                computes = [round(c * 1000, 2) for _, c in samples]
+                operations[operation] = {
+                    "samples": len(samples),
+                    "queue_wait_ms": {"p50": percentile(waits, 0.5), "p95": percentile(waits, 0.95),
+                                      "max": max(waits)},
+                    "hash_ms": {"p50": percentile(computes, 0.5), "p95": percentile(computes, 0.95),
+                                "max": max(computes)},
+                }
+            return {
+                "pid": os.getpid(),
+                "workers": app.config["PASSWORD_POOL_WORKERS"],
+                "max_pending": app.config["PASSWORD_POOL_MAX_PENDING"],
+                "pending": self.pending,
+                "counters": dict(self.counters),
+                "operations": operations,
+            }
+
+    def shutdown(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+
+
+password_pool = PasswordPool()
+
+
+class PooledCryptContext:
+    """Stands in for the guard's CryptContext: the CPU-heavy calls go to the
+    pool, everything else (needs_update, identify, schemes...) stays local."""
+
+    def __init__(self, context):
+        self.context = context
+
+    def hash(self, secret):
+        return password_pool.run(self.context, "hash", secret)
+
+    def verify(self, secret, hashed):
+        return password_pool.run(self.context, "verify", secret, hashed)
+
+    def verify_and_update(self, secret, hashed):
+        return tuple(password_pool.run(self.context, "verify_and_update", secret, hashed))
+
+    def __getattr__(self, name):
+        return getattr(self.context, name)
+
+
+def install_password_pool(guard):
+    """Call after guard.init_app()."""
+    if not isinstance(guard.pwd_ctx, PooledCryptContext):
+        password_pool.config = guard.pwd_ctx.to_string()
+        guard.pwd_ctx = PooledCryptContext(guard.pwd_ctx)
+    return guard
+
+
+@app.errorhandler(PasswordPoolBusy)
+def password_pool_busy(e):
+    response = jsonify({"error": str(e)})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+
+# ---------------------------
+# CLI:  flask passwords bench
+# ---------------------------
+passwords_cli = AppGroup("passwords", help="Password hashing pool.")
+
+
+@passwords_cli.command("bench")
+@click.option("--hashes", type=int, default=32, help="Passwords hashed in the burst.")
+@click.option("--threads", type=int, default=8, help="Request threads doing the hashing.")
+def bench_command(hashes, threads):
+    """Latency of a light request handler while a sign-up burst is hashed,
+    inline and through the pool."""
+    from application.settings.settings import guard
+
+    def light_request():
+        # stands in for a cached catalog read: a little pure-Python work
+        return sum(i * i for i in range(2000))
+
+    def run(label):
+        done = threading.Event()
+        latencies = []
+
+        def reader():
+            while not done.is_set():
+                started = time.perf_counter()
+                light_request()
+                latencies.append(time.perf_counter() - started)
+                time.sleep(0.001)
+
+        def signups(count):
+            for n in range(count):
+                guard.hash_password(f"password-{n}")
+
+        reading = threading.Thread(target=reader)
+        reading.start()
+        started = time.perf_counter()
+        workers = [threading.Thread(target=signups, args=(hashes // threads,)) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        done.set()
+        reading.join()
+        latencies = [l * 1000 for l in latencies]
+        click.echo(f"{label:<8} burst {elapsed:6.2f}s   light requests: {len(latencies):5d} served, "
+                   f"p50 {percentile(latencies, 0.5):6.2f}ms  p95 {percentile(latencies, 0.95):6.2f}ms  "
+                   f"max {max(latencies):7.2f}ms")
+
+    workers = app.config["PASSWORD_POOL_WORKERS"] or 1
+    app.config["PASSWORD_POOL_WORKERS"] = 0
+    run("inline")
+    app.config["PASSWORD_POOL_WORKERS"] = workers
+    guard.hash_password("warm-up")   # start the pool outside the measurement
+    run("pool")
+    password_pool.shutdown()
+    click.echo(password_pool.snapshot()["operations"])
+
+
+app.cli.add_command(passwords_cli)
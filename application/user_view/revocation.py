@@ -0,0 +1,283 @@
+# application/user_view/revocation.py
+#
+# Revoking JWTs on logout.
+#
+# A logout stores the token's jti in revoked_token.  flask_praetorian asks
+# is_revoked(jti) on every authenticated request (and on refresh, which
+# keeps the jti), so the table is mirrored into a Bloom filter in each
+# worker process:
+#
+#   - a jti the filter has never seen is answered from memory, no query
+#   - a filter hit is confirmed with a primary-key lookup; confirmed and
+#     false-positive answers are remembered (bounded LRU) so a replayed
+#     revoked token doesn't query again
+#
+# Every REVOCATION_REFRESH seconds the next check reads the rows revoked
+# since the last refresh (revoked_at, indexed, with REVOCATION_OVERLAP
+# seconds of overlap for slow commits and clock skew between workers);
+# adding a jti twice is harmless.  Revocations made in this process go into
+# the filter straight away; ones made by another worker are seen here
+# within REVOCATION_REFRESH seconds.  Every REVOCATION_REBUILD seconds, or
+# once more jtis are in the filter than it was sized for, it is rebuilt
+# from the rows that have not expired yet -- a Bloom filter can't forget,
+# so that is how pruned rows leave it.
+#
+# GET /user/revocations (admin) shows the filter and its hit counters for
+# this process; `flask revocations bench` compares it with a lookup per
+# check.
+import math
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from hashlib import blake2b
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import delete, select
+
+from application.settings.setup import app
+from application.database.user.user_db import db, RevokedToken
+
+app.config.setdefault("REVOCATION_BLOOM_CAPACITY", 100_000)   # jtis before the filter is resized
+app.config.setdefault("REVOCATION_BLOOM_ERROR", 0.001)        # false-positive rate at capacity
+app.config.setdefault("REVOCATION_REFRESH", 5)                # seconds between incremental reads
+app.config.setdefault("REVOCATION_OVERLAP", 60)               # seconds re-read on each refresh
+app.config.setdefault("REVOCATION_REBUILD", 3600)             # seconds between full rebuilds
+app.config.setdefault("REVOCATION_DECIDED", 10_000)           # remembered filter-hit answers
+
+
+class BloomFilter:
+    def __init__(self, capacity, error):
+        capacity = max(int(capacity), 1)
+        self.bits = max(int(math.ceil(-capacity * math.log(error) / math.log(2) ** 2)), 8)
+        self.hashes = max(int(round(self.bits / capacity * math.log(2))), 1)
+        self.capacity = capacity
+        self.count = 0
+        self.array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, key):
+        # double hashing: k positions from the two halves of one digest
+        digest = blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key):
+        # re-adding a key (refreshes overlap) doesn't count it twice
+        new = False
+        for position in self._positions(key):
+            byte, bit = position >> 3, 1 << (position & 7)
+            if not self.array[byte] & bit:
+                self.array[byte] |= bit
+                new = True
+        self.count += new
+
+    def __contains__(self, key):
+        array = self.array
+        return all(array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def error_rate(self):
+        """Expected false-positive rate with the jtis added so far."""
+        return (1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes
+
+
+class RevocationList:
+    def __init__(self):
+        self.bloom = None
+        self.cursor = None        # newest revoked_at read so far
+        self.refreshed = 0.0      # monotonic time of the last refresh
+        self.rebuilt = 0.0
+        self.decided = OrderedDict()
+        self.counters = Counter()
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+
+    # -- loading ---------------------------------------------------------
+    def _rows(self, since=None):
+        query = select(RevokedToken.jti, RevokedToken.revoked_at)
+        if since is None:
+            query = query.where(RevokedToken.expires_at > datetime.utcnow())
+        else:
+            query = query.where(RevokedToken.revoked_at >= since)
+        with db.engine.connect() as connection:
+            return connection.execute(query).all()
+
+    def rebuild(self):
+        rows = self._rows()
+        bloom = BloomFilter(max(app.config["REVOCATION_BLOOM_CAPACITY"], 2 * len(rows)),
+                            app.config["REVOCATION_BLOOM_ERROR"])
+        for jti, _ in rows:
+            bloom.add(jti)
+        with self._lock:
+            self.bloom = bloom
+            self.cursor = max((revoked_at for _, revoked_at in rows), default=self.cursor)
+            self.decided.clear()
+            self.rebuilt = self.refreshed = time.monotonic()
+            self.counters["rebuilds"] += 1
+
+    def refresh(self):
+        since = (self.cursor or datetime.utcnow()) - timedelta(seconds=app.config["REVOCATION_OVERLAP"])
+        rows = self._rows(since)
+        with self._lock:
+            for jti, revoked_at in rows:
+                self.bloom.add(jti)
+                # a remembered false positive may have been revoked since
+                self.decided.pop(jti, None)
+                if self.cursor is None or revoked_at > self.cursor:
+                    self.cursor = revoked_at
+            self.refreshed = time.monotonic()
+            self.counters["refreshes"] += 1
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if self.bloom is None:
+            # nothing to answer from yet: wait for the first load
+            with self._refreshing:
+                if self.bloom is None:
+                    self.rebuild()
+            return
+        if now - self.refreshed < app.config["REVOCATION_REFRESH"]:
+            return
+        # single flight: the others keep answering from the current filter
+        if not self._refreshing.acquire(blocking=False):
+            return
+        try:
+            if (now - self.rebuilt >= app.config["REVOCATION_REBUILD"]
+                    or self.bloom.count > self.bloom.capacity):
+                self.rebuild()
+            else:
+                self.refresh()
+        finally:
+            self._refreshing.release()
+
+    # -- checking --------------------------------------------------------
+    def _remember(self, jti, revoked):
+        with self._lock:
+            self.decided[jti] = revoked
+            if len(self.decided) > app.config["REVOCATION_DECIDED"]:
+                self.decided.popitem(last=False)
+
+    def is_revoked(self, jti):
+        self._maybe_refresh()
+        self.counters["checks"] += 1
+        if jti not in self.bloom:
+            self.counters["bloom_negative"] += 1
+            return False
+        self.counters["bloom_positive"] += 1
+        with self._lock:
+            revoked = self.decided.get(jti)
+            if revoked is not None:
+                self.decided.move_to_end(jti)
+        if revoked is None:
+            self.counters["db_lookups"] += 1
+            with db.engine.connect() as connection:
+                revoked = connection.execute(
+                    select(RevokedToken.jti).where(RevokedToken.jti == jti)
+                ).first() is not None
+            self._remember(jti, revoked)
+        self.counters["confirmed" if revoked else "false_positive"] += 1
+        return revoked
+
+    def added(self, jti):
+        """A jti revoked by this process: known here at once."""
+        self._maybe_refresh()
+        with self._lock:
+            self.bloom.add(jti)
+            self.decided.pop(jti, None)
+
+    def snapshot(self):
+        bloom = self.bloom
+        return {
+            "entries": bloom.count if bloom else 0,
+            "capacity": bloom.capacity if bloom else app.config["REVOCATION_BLOOM_CAPACITY"],
+            "bits": bloom.bits if bloom else None,
+            "hashes": bloom.hashes if bloom else None,
+            "expected_error_rate": round(bloom.error_rate(), 6) if bloom else None,
+            "remembered": len(self.decided),
+            "seconds_since_refresh": round(time.monotonic() - self.refreshed, 1) if bloom else None,
+            "counters": dict(self.counters),
+        }
+
+
+revocations = RevocationList()
+
+
+def is_revoked(jti):
+    """flask_praetorian's is_blacklisted hook."""
+    return revocations.is_revoked(jti)
+
+
+def revoke_token(jwt_data, user_id=None):
+    """Revoke the token with these claims.  Adds the row to the session; the
+    caller commits."""
+    jti = jwt_data["jti"]
+    # once the refresh window has passed the token is dead anyway
+    expires = max(jwt_data.get("rf_exp") or 0, jwt_data.get("exp") or 0)
+    db.session.merge(RevokedToken(
+        jti=jti,
+        user_id=user_id if user_id is not None else jwt_data.get("id"),
+        revoked_at=datetime.utcnow(),
+        expires_at=datetime.utcfromtimestamp(expires) if expires else datetime.utcnow(),
+    ))
+    revocations.added(jti)
+    return jti
+
+
+def prune_revoked():
+    """Drop rows whose tokens have expired; the filters forget them at their
+    next rebuild."""
+    result = db.session.execute(delete(RevokedToken).where(RevokedToken.expires_at <= datetime.utcnow()))
+    db.session.commit()
+    return result.rowcount
+
+
+# ---------------------------
+# CLI:  flask revocations bench
+# ---------------------------
+revocations_cli = AppGroup("revocations", help="Revoked JWTs.")
+
+
+@revocations_cli.command("bench")
+@click.option("--revoked", type=int, default=10000, help="Revoked tokens in the table.")
+@click.option("--checks", type=int, default=20000, help="Live tokens checked.")
+def bench_command(revoked, checks):
+    """Checking live tokens against the filter and against the table.
+    Writes fake rows into revoked_token and removes them afterwards."""
+    expires = datetime.utcnow() + timedelta(days=1)
+    fake = [str(uuid.uuid4()) for _ in range(revoked)]
+    db.session.execute(RevokedToken.__table__.insert(), [
+        {"jti": jti, "user_id": None, "revoked_at": datetime.utcnow(), "expires_at": expires} for jti in fake
+    ])
+    db.session.commit()
+    try:
+        live = [str(uuid.uuid4()) for _ in range(checks)]
+
+        started = time.perf_counter()
+        with db.engine.connect() as connection:
+            hits = sum(connection.execute(select(RevokedToken.jti).where(RevokedToken.jti == jti)).first()
+                       is not None for jti in live)
+        table = time.perf_counter() - started
+
+        revocations.rebuild()
+        before = Counter(revocations.counters)
+        started = time.perf_counter()
+        hits += sum(revocations.is_revoked(jti) for jti in live)
+        bloom = time.perf_counter() - started
+        used = revocations.counters - before
+
+        caught = sum(revocations.is_revoked(jti) for jti in fake[:1000])
+        click.echo(f"table lookup  {checks} checks in {table * 1000:8.1f}ms  "
+                   f"({table / checks * 1e6:6.1f}us each, {checks} queries)")
+        click.echo(f"bloom filter  {checks} checks in {bloom * 1000:8.1f}ms  "
+                   f"({bloom / checks * 1e6:6.1f}us each, {used['db_lookups']} queries, "
+                   f"{used['false_positive']} false positives)")
+        click.echo(f"revoked tokens caught: {caught}/{min(revoked, 1000)}; live tokens rejected: {hits}")
+    finally:
+        db.session.execute(delete(RevokedToken).where(RevokedToken.jti.in_(fake)))
+        db.session.commit()
+        revocations.rebuild()
+
+
+app.cli.add_command(revocations_cli)
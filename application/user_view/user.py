@@ -1,4 +1,4 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, url_for
 from flask.helpers import make_response
 from application.extensions.extensions import *
 from application.settings.setup import app
@@ -11,6 +11,13 @@ from flask_marshmallow import Marshmallow
 from flask_dance.contrib.facebook import make_facebook_blueprint, facebook
 import secrets
 from sqlalchemy.exc import IntegrityError
+from application.ratelimit.ratelimit import rate_limited
+from application.restaurant.archive import delete_archived
+from application.user_view.passwords import install_password_pool, password_pool, PasswordPoolBusy
+from application.user_view.revocation import is_revoked, revoke_token, revocations
+from flask_praetorian.utilities import get_jwt_data_from_app_context
+from application.user_view.listing import INCLUDES, list_users, parse_filters, parse_sort, user_counts
+from application.restaurant.restaurant import FeedbackSchema
 
 from google.oauth2 import id_token
 from google.auth.transport import requests as google_requests
@@ -22,10 +29,13 @@ facebook_bp = make_facebook_blueprint(
     redirect_to="user.facebook_login"
 )
 app.register_blueprint(facebook_bp, url_prefix="/facebook_login")
-guard.init_app(app, User)
+guard.init_app(app, User, is_blacklisted=is_revoked)   # logged-out tokens are refused
+install_password_pool(guard)   # hashing runs in a process pool
 ma = Marshmallow(app)
 
 class User_schema(ma.Schema):
+    feedbacks = ma.Nested(FeedbackSchema, many=True)
+
     class Meta:
         fields=("id","username","email","phone","id","role","is_active",
                 "premium_listing","normal_listing","sponsored_ads","premium_analytics","feedbacks","review_contest"
@@ -34,9 +44,12 @@ class User_schema(ma.Schema):
         
 
 user_schema = User_schema(many=True)
+USER_LIST_COLUMNS = tuple(dict.fromkeys(f for f in User_schema.Meta.fields if f not in INCLUDES))
+user_list_schema = User_schema(many=True, only=USER_LIST_COLUMNS)
 
 
 @app.route("/register", methods=["POST"])
+@rate_limited("register")
 def register():
     data = request.get_json()
 
@@ -74,11 +87,14 @@ def register():
 
         return jsonify({"message": "User registered successfully"}), 201
 
+    except PasswordPoolBusy:
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": "Registration failed: " + str(e)}), 500
 
 @user.route("/login", methods=["POST"])
+@rate_limited("login")
 def login():
     try:
         username = request.json.get("username")
@@ -89,11 +105,20 @@ def login():
         db.session.commit()
         token = guard.encode_jwt_token(user)
         return jsonify({"id_token": token}), 200
+    except PasswordPoolBusy:
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 401
     
 
 
+@user.route("/password_pool", methods=["GET"])
+@flask_praetorian.roles_required("admin")
+def get_password_pool():
+    # per worker process, like /ratelimit/stats
+    return jsonify(password_pool.snapshot()), 200
+
+
 @user.route("/update_logout", methods=['PUT'])
 @flask_praetorian.auth_required
 def update_logout():
@@ -101,6 +126,9 @@ def update_logout():
     
     # Update the last logout time
     user.last_logout = datetime.utcnow()  # Use UTC for consistency
+
+    # the token used for this request stops working (and can't be refreshed)
+    revoke_token(get_jwt_data_from_app_context(), user.id)
     
     # Commit the changes
     db.session.commit()
@@ -109,6 +137,13 @@ def update_logout():
     return jsonify({"message": "Logout time updated successfully"}), 200
 
 
+@user.route("/revocations", methods=["GET"])
+@flask_praetorian.roles_required("admin")
+def get_revocations():
+    # per worker process, like /user/password_pool
+    return jsonify(revocations.snapshot()), 200
+
+
 
 
 @user.route("/facebook-login", methods=["POST"])
@@ -167,12 +202,41 @@ def get_info():
         return jsonify({"error": str(e)}), 500
 
 @user.route("/get_users", methods=["GET"])
-@flask_praetorian.auth_required
+@flask_praetorian.roles_required("admin")
 def get_users():
+    # one page per request; paging and the total are in the response headers
+    try:
+        filters = parse_filters(request.args)
+        sort, descending = parse_sort(request.args.get("sort"))
+        include = [f.strip() for f in request.args.get("include", "").split(",") if f.strip()]
+        unknown = [f for f in include if f not in INCLUDES]
+        if unknown:
+            raise ValueError(f"Unknown include: {', '.join(unknown)}")
+        users, next_cursor = list_users(
+            filters, sort, descending,
+            cursor=request.args.get("cursor"),
+            limit=request.args.get("limit", type=int),
+            include=include,
+            columns=USER_LIST_COLUMNS,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     try:
-        users = User.query.all()
-        results = user_schema.dump(users)
-        return jsonify(results)
+        response = jsonify((user_schema if include else user_list_schema).dump(users))
+        exposed = []
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+            args = request.args.to_dict()
+            args["cursor"] = next_cursor
+            response.headers["Link"] = f'<{url_for("user.get_users", _external=True, **args)}>; rel="next"'
+            exposed += ["X-Next-Cursor", "Link"]
+        if request.args.get("count", "true").lower() not in ("0", "false", "no"):
+            # cached per filter for USER_COUNT_TTL seconds
+            response.headers["X-Total-Count"] = str(user_counts.get(filters))
+            exposed.append("X-Total-Count")
+        if exposed:
+            response.headers["Access-Control-Expose-Headers"] = ", ".join(exposed)
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -200,6 +264,7 @@ def delete_user(id):
         user = User.query.get(id)
         if not user:
             return jsonify({"error": "User not found"}), 404
+        delete_archived(user_id=user.id)
         db.session.delete(user)
         db.session.commit()
         return jsonify({"message": "User deleted successfully"}), 200
@@ -226,6 +291,8 @@ def update_user():
 
         db.session.commit()
         return jsonify({"message": "User updated successfully"}), 200
+    except PasswordPoolBusy:
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
@@ -272,6 +339,9 @@ from google.oauth2 import id_token
 from google.auth.transport import requests as google_requests
 
 
+GOOGLE_CLIENT_ID = "351595459993-vbnlaj5c8jbp21tgnjtlb09gl5igmlf2.apps.googleusercontent.com"
+
+
 @user.route("/google-login", methods=["POST"])
 def google_login():
     try:
@@ -283,7 +353,7 @@ def google_login():
         idinfo = id_token.verify_oauth2_token(
             token,
             google_requests.Request(),
-            "351595459993-vbnlaj5c8jbp21tgnjtlb09gl5igmlf2.apps.googleusercontent.com"
+            GOOGLE_CLIENT_ID
         )
 
         email = idinfo['email']
@@ -0,0 +1,12 @@
+# asgi.py
+#
+# ASGI entry point (see application/asgi/server.py):
+#
+#   uvicorn asgi:application --workers 2
+#   GUNICORN_APP=asgi:application GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn
+#
+# wsgi.py stays the entry point for sync mode.
+from wsgi import app   # loaded and warmed like the WSGI entry point
+from application.asgi.server import create_asgi_app
+
+application = create_asgi_app(app)
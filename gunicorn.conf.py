@@ -0,0 +1,69 @@
+# gunicorn.conf.py
+#
+# Production server settings; gunicorn reads this file from the working
+# directory:
+#
+#   gunicorn                       # wsgi:app, gthread workers
+#   GUNICORN_APP=asgi:application GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn
+#
+# The app is preloaded: the master imports it and warms its caches once
+# (wsgi.py), freezes the GC and forks the workers, which share all of it
+# copy-on-write.  Each worker logs its boot time and memory once it is
+# ready; `flask server memory <master pid>` shows them at any time.
+#
+# Reloading:
+#   kill -HUP <master>     new config, workers re-forked from the loaded app
+#                          (code is NOT reloaded: it was loaded before fork)
+#   kill -USR2 <master>    new code: starts a new master and its workers
+#                          next to the old ones; then
+#   kill -WINCH <old>      old workers finish what they are serving
+#                          (graceful_timeout) and exit, then
+#   kill -QUIT <old>       the old master exits
+import os
+import time
+
+wsgi_app = os.environ.get("GUNICORN_APP", "wsgi:app")
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+pidfile = os.environ.get("GUNICORN_PIDFILE")
+
+# threads wait on the database and SSE streams; the password pool does the
+# CPU-heavy hashing in processes of its own
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.environ.get("WEB_CONCURRENCY", max(2, os.cpu_count() or 1)))
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+preload_app = True
+
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+# workers are cheap to replace (forked from the warm master): recycle them
+# before slow leaks add up, not all at once
+max_requests = 5000
+max_requests_jitter = 500
+# heartbeat files in memory, so a slow disk can't get workers killed
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOGLEVEL", "info")
+
+
+def when_ready(server):
+    from application.server.prefork import BOOT, freeze, memory
+    frozen = freeze()
+    warmed = ", ".join(f"{w['name']} {w['ms']:.0f}ms" + (" (failed)" if w["error"] else "")
+                       for w in BOOT["warmed"])
+    server.log.info("app loaded in %sms (%s); %s objects frozen; master memory %s",
+                    BOOT.get("ready_ms"), warmed or "not warmed", frozen, memory())
+
+
+def post_fork(server, worker):
+    from application.server.prefork import after_fork
+    worker.forked_at = time.monotonic()
+    after_fork()
+
+
+def post_worker_init(worker):
+    from application.server.prefork import memory
+    worker.log.info("worker %s booted in %.1fms, memory %s",
+                    worker.pid, (time.monotonic() - worker.forked_at) * 1000, memory())
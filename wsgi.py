@@ -0,0 +1,16 @@
+# wsgi.py
+#
+# Production entry point:  gunicorn wsgi:app  (settings in gunicorn.conf.py)
+#
+# Imported once by the gunicorn master (preload_app), which also fills the
+# read-mostly caches here so the workers inherit them instead of building
+# them on their first requests (application/server/prefork.py).
+import time
+
+started = time.monotonic()
+
+from app import app
+from application.server.prefork import BOOT, warm_all
+
+BOOT["started"] = started
+warm_all()